@@ -19,24 +19,145 @@ import inspect
 import binascii
 import json
 import logging
+import os
 import re
+import threading
 import time
+from collections import OrderedDict
 from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 from functools import partial
 from typing import Any, Union, Tuple
 
+import xxhash
+
 from agent.component import component_class
 from agent.component.base import ComponentBase
 from api.db.services.file_service import FileService
-from api.db.services.llm_service import LLMBundle
+from api.db.services.llm_service import LLMBundle, run_coroutine_sync
 from api.db.services.task_service import has_canceled
 from common.constants import LLMType
-from common.misc_utils import get_uuid, hash_str2int
+from common.misc_utils import get_uuid, hash_str2int, once
 from common.exceptions import TaskCanceledException
 from rag.prompts.generator import chunks_format
 from rag.utils.redis_conn import REDIS_CONN
 
+AGENT_THREAD_POOL_SIZE = int(os.environ.get("AGENT_THREAD_POOL_SIZE", 32))
+# Components of one canvas that may run at the same time.
+CANVAS_MAX_CONCURRENCY = int(os.environ.get("CANVAS_MAX_CONCURRENCY", 5))
+CANVAS_TEMPLATE_CACHE_SIZE = int(os.environ.get("CANVAS_TEMPLATE_CACHE_SIZE", 128))
+TOOL_TRACE_MAX_ENTRIES = int(os.environ.get("TOOL_TRACE_MAX_ENTRIES", 2000))
+# Components whose outcome decides the next path; their downstream is never started early.
+_ROUTING_COMPONENTS = ("categorize", "switch", "iteration", "iterationitem", "loop", "loopitem", "exitloop", "userfillup")
+# Components that may start before their wave. They only read and compute, so one started for a
+# branch the run never reaches, or still running on the thread pool after a cancel, changes nothing
+# outside the run. Everything else (tools that send, write or execute, agents, messages) waits.
+_EARLY_START_COMPONENTS = (
+    "llm", "retrieval", "stringtransform", "dataoperations", "listoperations", "variableaggregator",
+    "akshare", "arxiv", "deepl", "duckduckgo", "github", "google", "googlescholar", "jin10", "pubmed",
+    "qweather", "searxng", "tavilyextract", "tavilysearch", "tushare", "wencai", "wikipedia", "yahoofinance",
+)
+# Variable references in a component's params: globals (sys./env.) or another component's output (cpn_id@var).
+_VARIABLE_REF_PATT = re.compile(r"\b(?:sys|env)\.[A-Za-z0-9_]|([A-Za-z0-9:]+)@[A-Za-z0-9_.-]+")
+
+
+@once
+def _shared_thread_pool():
+    return ThreadPoolExecutor(max_workers=AGENT_THREAD_POOL_SIZE, thread_name_prefix="canvas")
+
+
+class CompiledDSL:
+    """
+    A parsed and validated DSL template, shared read-only by every graph built from a
+    DSL with the same template.
+
+    Parsing the params and running `param.check()` for every component happens once per
+    template. A DSL saved after a run (history, path, globals, input and output values)
+    keeps the template of the DSL it ran from; `delta()` is what it adds on top. A graph
+    deep-copies the checked params, while the layout under "graph" is shared as is.
+    """
+
+    _SHARED_KEYS = ("graph",)
+
+    def __init__(self, dsl: dict):
+        self.dsl = {k: v for k, v in dsl.items() if k in ("components", *self._SHARED_KEYS)}
+        self.params = {}
+        self.baseline = {}
+        for k, cpn in self.dsl["components"].items():
+            param = component_class(cpn["obj"]["component_name"] + "Param")()
+            param.update(cpn["obj"]["params"])
+            try:
+                param.check()
+            except Exception as e:
+                raise ValueError(self.get_component_name(k) + f": {e}")
+            self.params[k] = param
+            self.baseline[k] = json.loads(str(param))
+
+    @staticmethod
+    def template_key(dsl: dict) -> tuple:
+        """Identity of the template of `dsl`: components and layout, without the values a run fills in."""
+        def strip(params):
+            params = {n: v for n, v in params.items() if n != "debug_inputs"}
+            for n in ("inputs", "outputs"):
+                if isinstance(params.get(n), dict):
+                    params[n] = {k: {f: x for f, x in v.items() if f != "value"} if isinstance(v, dict) else v
+                                 for k, v in params[n].items()}
+            return params
+
+        components = {
+            k: {**cpn, "obj": {**cpn["obj"], "params": strip(cpn["obj"].get("params", {}))}}
+            for k, cpn in dsl["components"].items()
+        }
+        text = json.dumps([components, dsl.get("graph")], ensure_ascii=False, sort_keys=True)
+        return len(text), xxhash.xxh64(text.encode("utf-8")).hexdigest()
+
+    def get_component_name(self, cid):
+        for n in self.dsl.get("graph", {}).get("nodes", []):
+            if cid == n["id"]:
+                return n["data"]["name"]
+        return ""
+
+    def delta(self, dsl: dict) -> dict:
+        """What `dsl`, a DSL with this template, holds beyond it, in the form of `Graph.session_state()`."""
+        components = {}
+        for k, cpn in dsl["components"].items():
+            base = self.baseline[k]
+            diff = {n: v for n, v in cpn["obj"].get("params", {}).items() if n not in base or base[n] != v}
+            if diff:
+                components[k] = diff
+        return {"dsl": {k: v for k, v in dsl.items() if k not in ("components", *self._SHARED_KEYS)}, "components": components}
+
+    def instantiate(self, state: dict) -> dict:
+        """A DSL dict for one graph: the shared layout plus the top-level entries of `state["dsl"]`."""
+        dsl = {k: v for k, v in self.dsl.items() if k in self._SHARED_KEYS}
+        dsl.update(state["dsl"])
+        dsl["components"] = {}
+        for k, cpn in self.dsl["components"].items():
+            dsl["components"][k] = {c: deepcopy(v) for c, v in cpn.items() if c != "obj"}
+            dsl["components"][k]["obj"] = {"component_name": cpn["obj"]["component_name"]}
+        return dsl
+
+
+_compiled_dsl_lock = threading.Lock()
+_compiled_dsl_cache: OrderedDict = OrderedDict()
+
+
+def compile_dsl(dsl: dict) -> CompiledDSL:
+    """Compiled template of `dsl`, cached so every session and debug run of an agent version shares it."""
+    key = CompiledDSL.template_key(dsl)
+    with _compiled_dsl_lock:
+        compiled = _compiled_dsl_cache.get(key)
+        if compiled:
+            _compiled_dsl_cache.move_to_end(key)
+            return compiled
+    compiled = CompiledDSL(dsl)
+    with _compiled_dsl_lock:
+        _compiled_dsl_cache[key] = compiled
+        while len(_compiled_dsl_cache) > CANVAS_TEMPLATE_CACHE_SIZE:
+            _compiled_dsl_cache.popitem(last=False)
+    return compiled
+
+
 class Graph:
     """
         dsl = {
@@ -78,37 +199,65 @@ class Graph:
         }
         """
 
-    def __init__(self, dsl: str, tenant_id=None, task_id=None, custom_header=None):
+    def __init__(self, dsl: str, tenant_id=None, task_id=None, custom_header=None, state=None):
+        """
+        `state` is what `session_state()` returned for an earlier run of the same `dsl`;
+        it is applied on top of `dsl`.
+        """
         self.path = []
         self.components = {}
         self.error = ""
-        self.dsl = json.loads(dsl)
+        dsl = json.loads(dsl)
+        self._template = compile_dsl(dsl)
+        # Runtime values saved in `dsl` itself, then the session's own changes on top.
+        delta = self._template.delta(dsl)
+        self._start = delta["components"]
+        state = state or {}
+        self._state = {"dsl": {**delta["dsl"], **state.get("dsl", {})}, "components": deepcopy(self._start)}
+        for k, params in state.get("components", {}).items():
+            self._state["components"].setdefault(k, {}).update(params)
+        self.dsl = self._template.instantiate(self._state)
         self._tenant_id = tenant_id
         self.task_id = task_id if task_id else get_uuid()
         self.custom_header = custom_header
-        self._thread_pool = ThreadPoolExecutor(max_workers=5)
+        self._thread_pool = _shared_thread_pool()
         self.load()
 
     def load(self):
         self.components = self.dsl["components"]
-        cpn_nms = set([])
+        param_states = self._state.get("components", {})
         for k, cpn in self.components.items():
-            cpn_nms.add(cpn["obj"]["component_name"])
-            param = component_class(cpn["obj"]["component_name"] + "Param")()
-            cpn["obj"]["params"]["custom_header"] = self.custom_header
-            param.update(cpn["obj"]["params"])
-            try:
-                param.check()
-            except Exception as e:
-                raise ValueError(self.get_component_name(k) + f": {e}")
-
+            param = deepcopy(self._template.params[k])
+            param.custom_header = self.custom_header
+            if param_states.get(k):
+                param.update(param_states[k])
             cpn["obj"] = component_class(cpn["obj"]["component_name"])(self, k, param)
 
         self.path = self.dsl["path"]
 
-    def __str__(self):
+    def _sync_dsl(self):
         self.dsl["path"] = self.path
         self.dsl["task_id"] = self.task_id
+
+    def session_state(self) -> dict:
+        """
+        Everything this graph changed relative to the DSL it was built from: the top-level DSL entries
+        except the layout, and for each component only the params that differ. Holds
+        references to live objects, so serialize it right away.
+        """
+        self._sync_dsl()
+        components = {}
+        for k, cpn in self.components.items():
+            base = {**self._template.baseline[k], **self._start.get(k, {})}
+            cur = json.loads(str(cpn["obj"]._param))
+            diff = {n: v for n, v in cur.items() if n != "custom_header" and (n not in base or base[n] != v)}
+            if diff:
+                components[k] = diff
+        dsl = {k: v for k, v in self.dsl.items() if k not in ("components", *CompiledDSL._SHARED_KEYS)}
+        return {"dsl": dsl, "components": components}
+
+    def __str__(self):
+        self._sync_dsl()
         dsl = {
             "components": {}
         }
@@ -278,9 +427,34 @@ class Graph:
         return True
 
 
+class ScopedGraph(Graph):
+    """
+    A view of a canvas in which some components are private copies, e.g. the body of one
+    parallel Iteration item. Lookups of those ids resolve to the copies; everything else,
+    including globals, cancellation and references, goes to the parent canvas.
+    """
+
+    def __init__(self, parent: Graph, components: dict):
+        # No DSL of its own, so Graph.__init__ is not called.
+        self._parent = parent
+        self.components = components
+
+    def __getattr__(self, name):
+        return getattr(self._parent, name)
+
+    def get_component(self, cpn_id) -> Union[None, dict[str, Any]]:
+        return self.components.get(cpn_id) or self._parent.get_component(cpn_id)
+
+    def get_component_obj(self, cpn_id) -> ComponentBase:
+        return self.get_component(cpn_id)["obj"]
+
+    def get_component_type(self, cpn_id) -> str:
+        return self.get_component(cpn_id)["obj"].component_name
+
+
 class Canvas(Graph):
 
-    def __init__(self, dsl: str, tenant_id=None, task_id=None, canvas_id=None, custom_header=None):
+    def __init__(self, dsl: str, tenant_id=None, task_id=None, canvas_id=None, custom_header=None, state=None):
         self.globals = {
             "sys.query": "",
             "sys.user_id": tenant_id,
@@ -289,7 +463,7 @@ class Canvas(Graph):
             "sys.history": []
         }
         self.variables = {}
-        super().__init__(dsl, tenant_id, task_id, custom_header=custom_header)
+        super().__init__(dsl, tenant_id, task_id, custom_header=custom_header, state=state)
         self._id = canvas_id
 
     def load(self):
@@ -315,11 +489,11 @@ class Canvas(Graph):
         self.retrieval = self.dsl["retrieval"]
         self.memory = self.dsl.get("memory", [])
 
-    def __str__(self):
+    def _sync_dsl(self):
+        super()._sync_dsl()
         self.dsl["history"] = self.history
         self.dsl["retrieval"] = self.retrieval
         self.dsl["memory"] = self.memory
-        return super().__str__()
 
     def reset(self, mem=False):
         super().reset()
@@ -367,6 +541,17 @@ class Canvas(Graph):
                     self.globals[k] = ""
 
     async def run(self, **kwargs):
+        self._ahead = {}
+        try:
+            async for ev in self._run(**kwargs):
+                yield ev
+        finally:
+            # Started early for a branch the run never reached (error, cancel, user input).
+            for task in self._ahead.values():
+                task.cancel()
+            self._ahead = {}
+
+    async def _run(self, **kwargs):
         st = time.perf_counter()
         self._loop = asyncio.get_running_loop()
         self.message_id = get_uuid()
@@ -419,54 +604,136 @@ class Canvas(Graph):
         yield decorate("workflow_started", {"inputs": kwargs.get("inputs")})
         self.retrieval.append({"chunks": {}, "doc_aggs": {}})
 
+        loop = asyncio.get_running_loop()
+        # Events components emit while a batch runs (emit_event).
+        events: asyncio.Queue = asyncio.Queue()
+        self._events = events
+        sem = asyncio.Semaphore(CANVAS_MAX_CONCURRENCY)
+        started, finished, early = set(), set(), set()
+        # Components started before their wave because everything upstream had already finished.
+        ahead: dict[str, asyncio.Task] = self._ahead
+
+        def _start(cpn_id, coro) -> asyncio.Task:
+            started.add(cpn_id)
+            events.put_nowait(("node_started", {
+                "inputs": None, "created_at": int(time.time()),
+                "component_id": cpn_id,
+                "component_name": self.get_component_name(cpn_id),
+                "component_type": self.get_component_type(cpn_id),
+                "thoughts": self.get_component_thoughts(cpn_id)
+            }))
+            return asyncio.create_task(coro)
+
+        async def _invoke_one(cpn_obj, call_kwargs):
+            async with sem:
+                if cpn_obj._id in early and self.is_canceled():
+                    return
+                fn_invoke_async = getattr(cpn_obj, "_invoke_async", None)
+                use_async = (fn_invoke_async and asyncio.iscoroutinefunction(fn_invoke_async)) or asyncio.iscoroutinefunction(getattr(cpn_obj, "_invoke", None))
+                if use_async:
+                    await cpn_obj.invoke_async(**(call_kwargs or {}))
+                else:
+                    await loop.run_in_executor(self._thread_pool, partial(cpn_obj.invoke, **(call_kwargs or {})))
+            finished.add(cpn_obj._id)
+            _start_ready_downstream(cpn_obj._id)
+
+        async def _invoke_after(deps, cpn_obj):
+            # Inputs are resolved only once the components this one reads from are done.
+            if deps:
+                await asyncio.gather(*deps)
+            await _invoke_one(cpn_obj, cpn_obj.get_input())
+
+        refs = {}
+
+        def _references(cpn_id):
+            """(reads sys./env. globals, ids of the components it reads from), from its params and inputs."""
+            if cpn_id not in refs:
+                cpn_obj = self.get_component_obj(cpn_id)
+                matches = [m.group(1) for m in _VARIABLE_REF_PATT.finditer(str(cpn_obj._param))]
+                cpn_ids = {c for c in matches if c}
+                cpn_ids.update(ele["_cpn_id"] for ele in cpn_obj.get_input_elements().values() if isinstance(ele, dict) and ele.get("_cpn_id"))
+                refs[cpn_id] = (None in matches, {c for c in cpn_ids if c in self.components})
+            return refs[cpn_id]
+
+        def _start_ready_downstream(cpn_id):
+            cpn = self.get_component(cpn_id)
+            cpn_obj = cpn["obj"]
+            if self.is_canceled() or cpn_obj.error() or cpn.get("parent_id") or cpn_obj.component_name.lower() in _ROUTING_COMPONENTS:
+                return
+            if isinstance(cpn_obj.output("content"), partial):
+                return
+            for d in cpn["downstream"]:
+                if d in started:
+                    continue
+                d_cpn = self.get_component(d)
+                if d_cpn.get("parent_id") or d_cpn["obj"].component_name.lower() not in _EARLY_START_COMPONENTS:
+                    continue
+                # Globals may be assigned by any component of the wave, so only the wave order is safe.
+                reads_globals, deps = _references(d)
+                if reads_globals:
+                    continue
+                deps = deps | set(d_cpn.get("upstream", []))
+                if not deps.issubset(finished):
+                    continue
+                # Whether a branch is taken is only known once the wave routes; an upstream
+                # that routes or failed (exception goto) leaves the branch unresolved.
+                if any(self.get_component_obj(u).component_name.lower() in _ROUTING_COMPONENTS or self.get_component_obj(u).error() for u in deps):
+                    continue
+                early.add(d)
+                ahead[d] = _start(d, _invoke_after([], d_cpn["obj"]))
+
         async def _run_batch(f, t):
             if self.is_canceled():
                 msg = f"Task {self.task_id} has been canceled during batch execution."
                 logging.info(msg)
                 raise TaskCanceledException(msg)
 
-            loop = asyncio.get_running_loop()
-            tasks = []
-            max_concurrency = getattr(self._thread_pool, "_max_workers", 5)
-            sem = asyncio.Semaphore(max_concurrency)
-
-            async def _invoke_one(cpn_obj, sync_fn, call_kwargs, use_async: bool):
-                async with sem:
-                    if use_async:
-                        await cpn_obj.invoke_async(**(call_kwargs or {}))
-                        return
-                    await loop.run_in_executor(self._thread_pool, partial(sync_fn, **(call_kwargs or {})))
-
+            tasks = {}
             i = f
             while i < t:
-                cpn = self.get_component_obj(self.path[i])
-                task_fn = None
-                call_kwargs = None
+                cpn_id = self.path[i]
+                cpn = self.get_component_obj(cpn_id)
 
-                if cpn.component_name.lower() in ["begin", "userfillup"]:
-                    call_kwargs = {"inputs": kwargs.get("inputs", {})}
-                    task_fn = cpn.invoke
+                if cpn_id in ahead:
+                    tasks[cpn_id] = ahead.pop(cpn_id)
+                    i += 1
+                elif cpn.component_name.lower() in ["begin", "userfillup"]:
+                    tasks[cpn_id] = _start(cpn_id, _invoke_one(cpn, {"inputs": kwargs.get("inputs", {})}))
                     i += 1
                 else:
+                    deps = []
                     for _, ele in cpn.get_input_elements().items():
                         if isinstance(ele, dict) and ele.get("_cpn_id") and ele.get("_cpn_id") not in self.path[:i] and self.path[0].lower().find("userfillup") < 0:
                             self.path.pop(i)
                             t -= 1
                             break
+                        if isinstance(ele, dict) and ele.get("_cpn_id") in tasks:
+                            deps.append(tasks[ele["_cpn_id"]])
                     else:
-                        call_kwargs = cpn.get_input()
-                        task_fn = cpn.invoke
+                        tasks[cpn_id] = _start(cpn_id, _invoke_after(deps, cpn))
                         i += 1
 
-                if task_fn is None:
-                    continue
-
-                fn_invoke_async = getattr(cpn, "_invoke_async", None)
-                use_async = (fn_invoke_async and asyncio.iscoroutinefunction(fn_invoke_async)) or asyncio.iscoroutinefunction(getattr(cpn, "_invoke", None))
-                tasks.append(asyncio.create_task(_invoke_one(cpn, task_fn, call_kwargs, use_async)))
-
             if tasks:
-                await asyncio.gather(*tasks)
+                await asyncio.gather(*tasks.values())
+
+        async def _with_events(coro):
+            """Run `coro`, yielding the events components emit meanwhile (see emit_event)."""
+            task = asyncio.create_task(coro)
+            try:
+                while not task.done() or not events.empty():
+                    if not events.empty():
+                        yield events.get_nowait()
+                        continue
+                    getter = asyncio.create_task(events.get())
+                    await asyncio.wait({task, getter}, return_when=asyncio.FIRST_COMPLETED)
+                    if getter.done():
+                        yield getter.result()
+                    else:
+                        getter.cancel()
+                task.result()
+            finally:
+                if not task.done():
+                    task.cancel()
 
         def _node_finished(cpn_obj):
             return decorate("node_finished",{
@@ -486,15 +753,9 @@ class Canvas(Graph):
         tts_mdl = None
         while idx < len(self.path):
             to = len(self.path)
-            for i in range(idx, to):
-                yield decorate("node_started", {
-                    "inputs": None, "created_at": int(time.time()),
-                    "component_id": self.path[i],
-                    "component_name": self.get_component_name(self.path[i]),
-                    "component_type": self.get_component_type(self.path[i]),
-                    "thoughts": self.get_component_thoughts(self.path[i])
-                })
-            await _run_batch(idx, to)
+            # node_started is emitted as each component's task is created, early starts included.
+            async for event, dt in _with_events(_run_batch(idx, to)):
+                yield decorate(event, dt)
             to = len(self.path)
             # post-processing of components invocation
             for i in range(idx, to):
@@ -611,6 +872,10 @@ class Canvas(Graph):
                     _extend_path(self.get_component(cpn["parent_id"])["downstream"])
                 elif cpn_obj.component_name.lower() in ["categorize", "switch"]:
                     _extend_path(cpn_obj.output("_next"))
+                elif cpn_obj.component_name.lower() == "iteration" and cpn_obj.parallel():
+                    # Every item already ran inside the component.
+                    yield _node_finished(cpn_obj)
+                    _extend_path(cpn["downstream"])
                 elif cpn_obj.component_name.lower() in ("iteration", "loop"):
                     _append_path(cpn_obj.get_start())
                 elif cpn_obj.component_name.lower() == "exitloop" and cpn_obj.get_parent().component_name.lower() == "loop":
@@ -774,32 +1039,47 @@ class Canvas(Graph):
         if loop and loop.is_running():
             return asyncio.run_coroutine_threadsafe(self.get_files_async(files), loop).result()
 
-        return asyncio.run(self.get_files_async(files))
+        return run_coroutine_sync(self.get_files_async(files))
+
+    @staticmethod
+    def tool_trace_key(task_id, message_id) -> str:
+        return f"{task_id}-{message_id}-tool-trace"
+
+    def emit_event(self, event: str, data: dict):
+        """
+        Send an event to the client while the current batch of components runs, e.g. the
+        progress of a component. Safe to call from component threads.
+        """
+        events = getattr(self, "_events", None)
+        loop = getattr(self, "_loop", None)
+        if events is None or loop is None or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(events.put_nowait, (event, data))
 
     def tool_use_callback(self, agent_id: str, func_name: str, params: dict, result: Any, elapsed_time=None):
         agent_ids = agent_id.split("-->")
         agent_name = self.get_component_name(agent_ids[0])
         path = agent_name if len(agent_ids) < 2 else agent_name+"-->"+"-->".join(agent_ids[1:])
         try:
-            bin = REDIS_CONN.get(f"{self.task_id}-{self.message_id}-logs")
-            if bin:
-                obj = json.loads(bin.encode("utf-8"))
-                if obj[-1]["component_id"] == agent_ids[0]:
-                    obj[-1]["trace"].append({"path": path, "tool_name": func_name, "arguments": params, "result": result, "elapsed_time": elapsed_time})
-                else:
-                    obj.append({
-                    "component_id": agent_ids[0],
-                    "trace": [{"path": path, "tool_name": func_name, "arguments": params, "result": result, "elapsed_time": elapsed_time}]
-                })
-            else:
-                obj = [{
-                    "component_id": agent_ids[0],
-                    "trace": [{"path": path, "tool_name": func_name, "arguments": params, "result": result, "elapsed_time": elapsed_time}]
-                }]
-            REDIS_CONN.set_obj(f"{self.task_id}-{self.message_id}-logs", obj, 60*10)
+            # One small append per call: concurrent tool calls never overwrite each other's entries.
+            entry = {"component_id": agent_ids[0], "path": path, "tool_name": func_name, "arguments": params, "result": result, "elapsed_time": elapsed_time}
+            REDIS_CONN.rpush(self.tool_trace_key(self.task_id, self.message_id), json.dumps(entry, ensure_ascii=False, default=str), 60*10, TOOL_TRACE_MAX_ENTRIES)
         except Exception as e:
             logging.exception(e)
 
+    @classmethod
+    def get_tool_trace(cls, task_id, message_id) -> list[dict]:
+        """Tool calls of one message, consecutive calls of the same component grouped under one entry."""
+        obj = []
+        for raw in REDIS_CONN.lrange(cls.tool_trace_key(task_id, message_id)):
+            entry = json.loads(raw)
+            component_id = entry.pop("component_id")
+            if obj and obj[-1]["component_id"] == component_id:
+                obj[-1]["trace"].append(entry)
+            else:
+                obj.append({"component_id": component_id, "trace": [entry]})
+        return obj
+
     def add_reference(self, chunks: list[object], doc_infos: list[object]):
         if not self.retrieval:
             self.retrieval = [{"chunks": {}, "doc_aggs": {}}]
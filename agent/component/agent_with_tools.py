@@ -25,7 +25,7 @@ from typing import Any
 import json_repair
 from timeit import default_timer as timer
 from agent.tools.base import LLMToolPluginCallSession, ToolParamBase, ToolBase, ToolMeta
-from api.db.services.llm_service import LLMBundle
+from api.db.services.llm_service import LLMBundle, run_coroutine_sync
 from api.db.services.tenant_llm_service import TenantLLMService
 from api.db.services.mcp_server_service import MCPServerService
 from common.connection_utils import timeout
@@ -173,7 +173,7 @@ class Agent(LLM, ToolBase):
         return await self._generate_async(fmt_msgs)
 
     def _invoke(self, **kwargs):
-        return asyncio.run(self._invoke_async(**kwargs))
+        return run_coroutine_sync(self._invoke_async(**kwargs))
 
     @timeout(int(os.environ.get("COMPONENT_EXEC_TIMEOUT", 20*60)))
     async def _invoke_async(self, **kwargs):
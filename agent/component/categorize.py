@@ -13,14 +13,13 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 #
-import asyncio
 import logging
 import os
 import re
 from abc import ABC
 
 from common.constants import LLMType
-from api.db.services.llm_service import LLMBundle
+from api.db.services.llm_service import LLMBundle, run_coroutine_sync
 from agent.component.llm import LLMParam, LLM
 from common.connection_utils import timeout
 from rag.llm.chat_model import ERROR_PREFIX
@@ -157,7 +156,7 @@ class Categorize(LLM, ABC):
 
     @timeout(int(os.environ.get("COMPONENT_EXEC_TIMEOUT", 10*60)))
     def _invoke(self, **kwargs):
-        return asyncio.run(self._invoke_async(**kwargs))
+        return run_coroutine_sync(self._invoke_async(**kwargs))
 
     def thoughts(self) -> str:
         return "Which should it falls into {}? ...".format(",".join([f"`{c}`" for c, _ in self._param.category_description.items()]))
@@ -13,7 +13,10 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 #
+import asyncio
+import time
 from abc import ABC
+from copy import deepcopy
 from agent.component.base import ComponentBase, ComponentParamBase
 
 """
@@ -33,6 +36,8 @@ class IterationParam(ComponentParamBase):
         super().__init__()
         self.items_ref = ""
         self.variable={}
+        # >1 maps the items through the body concurrently instead of one by one.
+        self.parallelism = 1
 
     def get_input_form(self) -> dict[str, dict]:
         return {
@@ -43,9 +48,14 @@ class IterationParam(ComponentParamBase):
         }
 
     def check(self):
+        self.check_positive_integer(self.parallelism, "[Iteration] Parallelism")
         return True
 
 
+# Body components that need the canvas run loop (streaming, user input, nested scopes).
+_SEQUENTIAL_ONLY = ("message", "userfillup", "iteration", "loop", "exitloop")
+
+
 class Iteration(ComponentBase, ABC):
     component_name = "Iteration"
 
@@ -56,6 +66,20 @@ class Iteration(ComponentBase, ABC):
             if self._canvas.get_component(cid)["parent_id"] == self._id:
                 return cid
 
+    def _body(self) -> list[str]:
+        return [cid for cid, cpn in self._canvas.components.items() if cpn.get("parent_id") == self._id]
+
+    def parallel(self) -> bool:
+        """
+        Whether items run concurrently inside this component. Items must be independent:
+        each gets private copies of the body components, so nothing one item writes to a
+        body component is visible to another. Loop has no such mode, because every turn
+        of a loop reads the loop variables the previous turn assigned.
+        """
+        if self._param.parallelism <= 1:
+            return False
+        return not any(self._canvas.get_component_obj(cid).component_name.lower() in _SEQUENTIAL_ONLY for cid in self._body())
+
     def _invoke(self, **kwargs):
         if self.check_if_canceled("Iteration processing"):
             return
@@ -64,6 +88,85 @@ class Iteration(ComponentBase, ABC):
         if not isinstance(arr, list):
             self.set_output("_ERROR", self._param.items_ref + " must be an array, but its type is "+str(type(arr)))
 
+    async def _invoke_async(self, **kwargs):
+        self._invoke(**kwargs)
+        if self.error() or not self.parallel() or self.is_canceled():
+            return
+
+        arr = self._canvas.get_variable_value(self._param.items_ref)
+        refs = {k: o["ref"].split("@") for k, o in self._param.outputs.items() if "ref" in o}
+        results = {k: [None] * len(arr) for k in refs}
+        sem = asyncio.Semaphore(self._param.parallelism)
+
+        async def _map_one(idx, item):
+            async with sem:
+                if self.check_if_canceled("Iteration processing"):
+                    return
+                st = time.perf_counter()
+                scope = await self._run_item(idx, item)
+                for k, (cid, var) in refs.items():
+                    if cid in scope.components:
+                        results[k][idx] = scope.get_component_obj(cid).output(var)
+                    # Partial results: finished items are readable while others still run.
+                    self.set_output(k, results[k])
+                self._canvas.emit_event("iteration_item_finished", {
+                    "component_id": self._id,
+                    "component_name": self._canvas.get_component_name(self._id),
+                    "component_type": self.component_name,
+                    "index": idx,
+                    "inputs": {"item": item},
+                    "outputs": {k: v[idx] for k, v in results.items()},
+                    "elapsed_time": time.perf_counter() - st,
+                    "created_at": st,
+                })
+
+        tasks = [asyncio.create_task(_map_one(idx, item)) for idx, item in enumerate(arr)]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # The first failure fails the iteration; stop the other items before it reports
+            # _ERROR so none of them publishes partial outputs afterwards.
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    async def _run_item(self, idx, item):
+        from agent.canvas import ScopedGraph  # Local import to avoid cyclic dependency
+
+        body = self._body()
+        components = {}
+        scope = ScopedGraph(self._canvas, components)
+        for cid in body:
+            cpn = self._canvas.get_component(cid)
+            components[cid] = {k: v for k, v in cpn.items() if k != "obj"}
+            components[cid]["obj"] = type(cpn["obj"])(scope, cid, deepcopy(cpn["obj"]._param))
+
+        start = self.get_start()
+        scope.get_component_obj(start).set_output("item", item)
+        scope.get_component_obj(start).set_output("index", idx)
+
+        queue, seen = list(components[start]["downstream"]), set()
+        while queue:
+            cid = queue.pop(0)
+            if cid in seen or cid not in components:
+                continue
+            if self.check_if_canceled("Iteration processing"):
+                break
+            seen.add(cid)
+            obj = scope.get_component_obj(cid)
+            await obj.invoke_async(**obj.get_input())
+            if obj.error():
+                ex = obj.exception_handler()
+                if not (ex and ex["goto"]):
+                    raise Exception(f"Item {idx}: {obj.error()}")
+                queue.extend(ex["goto"])
+            elif obj.component_name.lower() in ("categorize", "switch"):
+                queue.extend(obj.output("_next") or [])
+            else:
+                queue.extend(components[cid]["downstream"])
+        return scope
+
     def thoughts(self) -> str:
         return "Need to process {} items.".format(len(self._canvas.get_variable_value(self._param.items_ref)))
 
@@ -41,6 +41,11 @@ class LoopParam(ComponentParamBase):
 
 
 class Loop(ComponentBase, ABC):
+    """
+    Runs its body until a termination condition holds. Turns are always sequential:
+    each turn reads the loop variables the previous one assigned. For independent
+    per-item work use Iteration with `parallelism` > 1.
+    """
     component_name = "Loop"
 
     def get_start(self):
@@ -13,7 +13,6 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 #
-import asyncio
 import nest_asyncio
 nest_asyncio.apply()
 import inspect
@@ -34,6 +33,7 @@ from common.misc_utils import get_uuid
 from common import settings
 
 from api.db.joint_services.memory_message_service import queue_save_to_memory_task
+from api.db.services.llm_service import run_coroutine_sync
 
 
 class MessageParam(ComponentParamBase):
@@ -75,7 +75,7 @@ class Message(ComponentBase):
             if isinstance(v, partial):
                 iter_obj = v()
                 if inspect.isasyncgen(iter_obj):
-                    ans = asyncio.run(self._consume_async_gen(iter_obj))
+                    ans = run_coroutine_sync(self._consume_async_gen(iter_obj))
                 else:
                     for t in iter_obj:
                         ans += t
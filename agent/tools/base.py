@@ -30,6 +30,7 @@ from timeit import default_timer as timer
 
 
 from common.misc_utils import thread_pool_exec
+from api.db.services.llm_service import run_coroutine_sync
 
 class ToolParameter(TypedDict):
     type: str
@@ -53,7 +54,7 @@ class LLMToolPluginCallSession(ToolCallSession):
         self.callback = callback
 
     def tool_call(self, name: str, arguments: dict[str, Any]) -> Any:
-        return asyncio.run(self.tool_call_async(name, arguments))
+        return run_coroutine_sync(self.tool_call_async(name, arguments))
 
     async def tool_call_async(self, name: str, arguments: dict[str, Any]) -> Any:
         assert name in self.tools_map, f"LLM tool {name} does not exist"
@@ -14,9 +14,9 @@
 #  limitations under the License.
 #
 from abc import ABC
-import asyncio
 from crawl4ai import AsyncWebCrawler
 from agent.tools.base import ToolParamBase, ToolBase
+from api.db.services.llm_service import run_coroutine_sync
 
 
 
@@ -44,7 +44,7 @@ class Crawler(ToolBase, ABC):
         if not is_valid_url(ans):
             return Crawler.be_output("URL not valid")
         try:
-            result = asyncio.run(self.get_web(ans))
+            result = run_coroutine_sync(self.get_web(ans))
 
             return Crawler.be_output(result)
 
@@ -13,7 +13,6 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 #
-import asyncio
 from functools import partial
 import json
 import os
@@ -24,11 +23,12 @@ from common.constants import LLMType
 from api.db.services.doc_metadata_service import DocMetadataService
 from common.metadata_utils import apply_meta_data_filter
 from api.db.services.knowledgebase_service import KnowledgebaseService
-from api.db.services.llm_service import LLMBundle
+from api.db.services.llm_service import LLMBundle, run_coroutine_sync
 from api.db.services.memory_service import MemoryService
 from api.db.joint_services import memory_message_service
 from common import settings
 from common.connection_utils import timeout
+from common.misc_utils import thread_pool_exec
 from rag.app.tag import label_question
 from rag.prompts.generator import cross_languages, kb_prompt, memory_prompt
 
@@ -94,17 +94,16 @@ class Retrieval(ToolBase, ABC):
             # if kb_nm is a list
             kb_nm_list = kb_nm if isinstance(kb_nm, list) else [kb_nm]
             for nm_or_id in kb_nm_list:
-                e, kb = KnowledgebaseService.get_by_name(nm_or_id,
-                                                         self._canvas._tenant_id)
+                e, kb = await thread_pool_exec(KnowledgebaseService.get_by_name, nm_or_id, self._canvas._tenant_id)
                 if not e:
-                    e, kb = KnowledgebaseService.get_by_id(nm_or_id)
+                    e, kb = await thread_pool_exec(KnowledgebaseService.get_by_id, nm_or_id)
                     if not e:
                         raise Exception(f"Dataset({nm_or_id}) does not exist.")
                 kb_ids.append(kb.id)
 
         filtered_kb_ids: list[str] = list(set([kb_id for kb_id in kb_ids if kb_id]))
 
-        kbs = KnowledgebaseService.get_by_ids(filtered_kb_ids)
+        kbs = await thread_pool_exec(lambda: list(KnowledgebaseService.get_by_ids(filtered_kb_ids)))
         if not kbs:
             raise Exception("No dataset is selected.")
 
@@ -125,7 +124,7 @@ class Retrieval(ToolBase, ABC):
 
         doc_ids = []
         if self._param.meta_data_filter != {}:
-            metas = DocMetadataService.get_flatted_meta_by_kbs(kb_ids)
+            metas = await thread_pool_exec(DocMetadataService.get_flatted_meta_by_kbs, kb_ids)
 
             def _resolve_manual_filter(flt: dict) -> dict:
                 pat = re.compile(self.variable_ref_patt)
@@ -186,7 +185,7 @@ class Retrieval(ToolBase, ABC):
                 doc_ids=doc_ids,
                 aggs=False,
                 rerank_mdl=rerank_mdl,
-                rank_feature=label_question(query, kbs),
+                rank_feature=await thread_pool_exec(label_question, query, kbs),
             )
             if self.check_if_canceled("Retrieval processing"):
                 return
@@ -199,8 +198,8 @@ class Retrieval(ToolBase, ABC):
                     return
                 if cks:
                     kbinfos["chunks"] = cks
-            kbinfos["chunks"] = settings.retriever.retrieval_by_children(kbinfos["chunks"],
-                                                                         [kb.tenant_id for kb in kbs])
+            kbinfos["chunks"] = await thread_pool_exec(settings.retriever.retrieval_by_children, kbinfos["chunks"],
+                                                       [kb.tenant_id for kb in kbs])
             if self._param.use_kg:
                 ck = await settings.kg_retriever.retrieval(query,
                                                      [kb.tenant_id for kb in kbs],
@@ -248,7 +247,7 @@ class Retrieval(ToolBase, ABC):
 
     async def _retrieve_memory(self, query_text: str):
         memory_ids: list[str] = [memory_id for memory_id in self._param.memory_ids]
-        memory_list = MemoryService.get_by_ids(memory_ids)
+        memory_list = await thread_pool_exec(lambda: list(MemoryService.get_by_ids(memory_ids)))
         if not memory_list:
             raise Exception("No memory is selected.")
 
@@ -259,7 +258,7 @@ class Retrieval(ToolBase, ABC):
         vars = {k: o["value"] for k, o in vars.items()}
         query = self.string_format(query_text, vars)
         # query message
-        message_list = memory_message_service.query_message({"memory_id": memory_ids}, {
+        message_list = await thread_pool_exec(memory_message_service.query_message, {"memory_id": memory_ids}, {
             "query": query,
             "similarity_threshold": self._param.similarity_threshold,
             "keywords_similarity_weight": self._param.keywords_similarity_weight,
@@ -296,7 +295,7 @@ class Retrieval(ToolBase, ABC):
 
     @timeout(int(os.environ.get("COMPONENT_EXEC_TIMEOUT", 12)))
     def _invoke(self, **kwargs):
-        return asyncio.run(self._invoke_async(**kwargs))
+        return run_coroutine_sync(self._invoke_async(**kwargs))
 
     def thoughts(self) -> str:
         return """
@@ -553,11 +553,11 @@ def trace():
     cvs_id = request.args.get("canvas_id")
     msg_id = request.args.get("message_id")
     try:
-        binary = REDIS_CONN.get(f"{cvs_id}-{msg_id}-logs")
-        if not binary:
+        trace = Canvas.get_tool_trace(cvs_id, msg_id)
+        if not trace:
             return get_json_result(data={})
 
-        return get_json_result(data=json.loads(binary.encode("utf-8")))
+        return get_json_result(data=trace)
     except Exception as e:
         logging.exception(e)
 
@@ -634,7 +634,9 @@ def get_session(canvas_id, session_id):
             data=False, message='Only owner of canvas authorized for this operation.',
             code=RetCode.OPERATING_ERROR)
     _, conv = API4ConversationService.get_by_id(session_id)
-    return get_json_result(data=conv.to_dict())
+    conv = conv.to_dict()
+    conv["dsl"] = API4ConversationService.session_dsl(conv["dsl"], conv.pop("state", None))
+    return get_json_result(data=conv)
 
 
 @manager.route('/<canvas_id>/sessions/<session_id>', methods=['DELETE'])  # noqa: F821
@@ -41,7 +41,7 @@ from api.utils.api_utils import (
     validate_request,
     get_request_json,
 )
-from api.utils.file_utils import filename_type, thumbnail
+from api.utils.file_utils import filename_type, page_count, thumbnail
 from common.file_utils import get_project_base_directory
 from common.constants import RetCode, VALID_TASK_STATUS, ParserType, TaskStatus
 from api.utils.web_utils import CONTENT_TYPE_MAP, html2pdf, is_valid_url
@@ -157,6 +157,7 @@ async def web_crawl():
             doc["parser_id"] = ParserType.PRESENTATION.value
         if re.search(r"\.(eml)$", filename):
             doc["parser_id"] = ParserType.EMAIL.value
+        doc["page_num"] = page_count(filename, blob, doc["parser_id"])
         DocumentService.insert(doc)
         FileService.add_file_from_kb(doc, kb_folder["id"], kb.tenant_id)
     except Exception as e:
@@ -47,6 +47,7 @@ from api.utils.api_utils import get_json_result
 from rag.nlp import search
 from api.constants import DATASET_NAME_LIMIT
 from rag.utils.redis_conn import REDIS_CONN
+from rag.utils.raptor_utils import remove_raptor_state
 from common.constants import RetCode, PipelineTaskType, StatusEnum, VALID_TASK_STATUS, FileSource, LLMType, PAGERANK_FLD
 from common import settings
 from common.doc_store.doc_store_base import OrderByExpr
@@ -320,6 +321,10 @@ async def rm():
             for kb in kbs:
                 if hasattr(settings.STORAGE_IMPL, 'remove_bucket'):
                     settings.STORAGE_IMPL.remove_bucket(kb.id)
+                try:
+                    remove_raptor_state(kb.id)
+                except Exception as e:
+                    logging.warning(f"Failed to remove RAPTOR state of dataset {kb.id}: {e}")
             return get_json_result(data=True)
 
         return await thread_pool_exec(_rm_sync)
@@ -833,6 +838,7 @@ def delete_kb_task():
             kb_task_finish_at = "raptor_task_finish_at"
             cancel_task(task_id)
             settings.docStoreConn.delete({"raptor_kwd": ["raptor"]}, search.index_name(kb.tenant_id), kb_id)
+            remove_raptor_state(kb_id)
         case PipelineTaskType.MINDMAP:
             kb_task_id_field = "mindmap_task_id"
             task_id = kb.mindmap_task_id
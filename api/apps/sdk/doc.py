@@ -27,7 +27,7 @@ from pydantic import BaseModel, Field, validator
 
 from api.constants import FILE_NAME_LEN_LIMIT
 from api.db import FileType
-from api.db.db_models import APIToken, File, Task
+from api.db.db_models import APIToken, File
 from api.db.services.document_service import DocumentService
 from api.db.services.doc_metadata_service import DocMetadataService
 from api.db.services.file2document_service import File2DocumentService
@@ -35,7 +35,7 @@ from api.db.services.file_service import FileService
 from api.db.services.knowledgebase_service import KnowledgebaseService
 from api.db.services.llm_service import LLMBundle
 from api.db.services.tenant_llm_service import TenantLLMService
-from api.db.services.task_service import TaskService, queue_tasks, cancel_all_task_of
+from api.db.services.task_service import ParseJob, cancel_all_task_of
 from common.metadata_utils import meta_filter, convert_conditions
 from api.utils.api_utils import check_duplicate_ids, construct_json_result, get_error_data_result, get_parser_config, get_result, server_error_response, token_required, \
     get_request_json
@@ -844,7 +844,7 @@ async def parse(tenant_id, dataset_id):
         description: Bearer token for authentication.
     responses:
       200:
-        description: Parsing started successfully.
+        description: Parsing started successfully. `data.job` is the parse job; poll `GET /datasets/{dataset_id}/chunks/jobs/{job_id}` for its progress.
         schema:
           type: object
     """
@@ -857,39 +857,72 @@ async def parse(tenant_id, dataset_id):
     unique_doc_ids, duplicate_messages = check_duplicate_ids(doc_list, "document")
     doc_list = unique_doc_ids
 
-    not_found = []
-    success_count = 0
-    for id in doc_list:
-        doc = DocumentService.query(id=id, kb_id=dataset_id)
-        if not doc:
-            not_found.append(id)
-            continue
-        if not doc:
-            return get_error_data_result(message=f"You don't own the document {id}.")
-        if 0.0 < doc[0].progress < 1.0:
-            return get_error_data_result("Can't parse document that is currently being processed")
-        info = {"run": "1", "progress": 0, "progress_msg": "", "chunk_num": 0, "token_num": 0}
-        DocumentService.update_by_id(id, info)
-        settings.docStoreConn.delete({"doc_id": id}, search.index_name(tenant_id), dataset_id)
-        TaskService.filter_delete([Task.doc_id == id])
-        e, doc = DocumentService.get_by_id(id)
-        doc = doc.to_dict()
-        doc["tenant_id"] = tenant_id
-        bucket, name = File2DocumentService.get_storage_address(doc_id=doc["id"])
-        queue_tasks(doc, bucket, name, 0)
-        success_count += 1
+    found = {
+        d.id: d
+        for d in DocumentService.model.select(DocumentService.model.id, DocumentService.model.progress).where(
+            DocumentService.model.id.in_(doc_list), DocumentService.model.kb_id == dataset_id
+        )
+    }
+    not_found = [id for id in doc_list if id not in found]
+    if any(0.0 < d.progress < 1.0 for d in found.values()):
+        return get_error_data_result("Can't parse document that is currently being processed")
+    doc_list = [id for id in doc_list if id in found]
+    success_count = len(doc_list)
+    job = ParseJob.start(tenant_id, dataset_id, doc_list) if doc_list else None
+    if job and job["status"] == "failed":
+        return server_error_response(Exception(job["error"]))
     if not_found:
         return get_result(message=f"Documents not found: {not_found}", code=RetCode.DATA_ERROR)
     if duplicate_messages:
         if success_count > 0:
             return get_result(
                 message=f"Partially parsed {success_count} documents with {len(duplicate_messages)} errors",
-                data={"success_count": success_count, "errors": duplicate_messages},
+                data={"success_count": success_count, "errors": duplicate_messages, "job": job},
             )
         else:
             return get_error_data_result(message=";".join(duplicate_messages))
 
-    return get_result()
+    return get_result(data={"job": job})
+
+
+@manager.route("/datasets/<dataset_id>/chunks/jobs/<job_id>", methods=["GET"])  # noqa: F821
+@token_required
+async def parse_job_status(tenant_id, dataset_id, job_id):
+    """
+    Report the progress of a parse request.
+    ---
+    tags:
+      - Chunks
+    security:
+      - ApiKeyAuth: []
+    parameters:
+      - in: path
+        name: dataset_id
+        type: string
+        required: true
+        description: ID of the dataset.
+      - in: path
+        name: job_id
+        type: string
+        required: true
+        description: The job returned by the parse request.
+      - in: header
+        name: Authorization
+        type: string
+        required: true
+        description: Bearer token for authentication.
+    responses:
+      200:
+        description: Job status, documents queued so far and tasks created.
+        schema:
+          type: object
+    """
+    if not KnowledgebaseService.accessible(kb_id=dataset_id, user_id=tenant_id):
+        return get_error_data_result(message=f"You don't own the dataset {dataset_id}.")
+    job = ParseJob.get(job_id)
+    if not job or job["kb_id"] != dataset_id:
+        return get_error_data_result(message=f"Parse job {job_id} not found.")
+    return get_result(data=job)
 
 
 @manager.route("/datasets/<dataset_id>/chunks", methods=["DELETE"])  # noqa: F821
@@ -22,6 +22,7 @@ from api.apps import login_required, current_user
 from api.db.db_models import APIToken
 from api.db.services.api_service import APITokenService
 from api.db.services.knowledgebase_service import KnowledgebaseService
+from api.db.services.llm_service import bridge_stats
 from api.db.services.user_service import UserTenantService
 from api.utils.api_utils import (
     get_json_result,
@@ -167,6 +168,7 @@ def status():
     except Exception:
         logging.exception("get task executor heartbeats failed!")
     res["task_executor_heartbeats"] = task_executor_heartbeats
+    res["llm_bridge"] = bridge_stats()
 
     return get_json_result(data=res)
 
@@ -28,10 +28,10 @@ from werkzeug.security import check_password_hash, generate_password_hash
 
 from api.apps.auth import get_auth_client
 from api.db import FileType, UserTenantRole
-from api.db.db_models import TenantLLM
 from api.db.services.file_service import FileService
 from api.db.services.llm_service import get_init_tenant_llm
 from api.db.services.tenant_llm_service import TenantLLMService
+from api.db.services.tenant_model_cache import TenantModelCache
 from api.db.services.user_service import TenantService, UserService, UserTenantService
 from common.time_utils import current_timestamp, datetime_format, get_format_time
 from common.misc_utils import download_img, get_uuid
@@ -620,7 +620,7 @@ def rollback_user_registration(user_id):
     except Exception:
         pass
     try:
-        TenantLLM.delete().where(TenantLLM.tenant_id == user_id).execute()
+        TenantLLMService.delete_by_tenant_id(user_id)
     except Exception:
         pass
 
@@ -842,6 +842,7 @@ async def set_tenant_info():
     try:
         tid = req.pop("tenant_id")
         TenantService.update_by_id(tid, req)
+        TenantModelCache.invalidate(tid)
         return get_json_result(data=True)
     except Exception as e:
         return server_error_response(e)
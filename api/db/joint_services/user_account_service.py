@@ -38,6 +38,7 @@ from api.db.services.user_service import TenantService, UserService, UserTenantS
 from api.db.services.memory_service import MemoryService
 from memory.services.messages import MessageService
 from rag.nlp import search
+from rag.utils.raptor_utils import remove_raptor_state
 from common.constants import ActiveEnum
 from common import settings
 
@@ -167,6 +168,7 @@ def delete_user_data(user_id: str) -> dict:
                 for kb_id in kb_ids:
                     if settings.STORAGE_IMPL.bucket_exists(kb_id):
                         settings.STORAGE_IMPL.remove_bucket(kb_id)
+                    remove_raptor_state(kb_id)
                 done_msg += f"- Removed {len(kb_ids)} dataset's buckets.\n"
                 # step1.1.2 delete file and document info in db
                 doc_ids = DocumentService.get_all_doc_ids_by_kb_ids(kb_ids)
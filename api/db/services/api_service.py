@@ -13,6 +13,7 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 #
+import json
 from datetime import datetime
 
 import peewee
@@ -54,7 +55,7 @@ class API4ConversationService(CommonService):
         if include_dsl:
             sessions = cls.model.select().where(cls.model.dialog_id == dialog_id)
         else:
-            fields = [field for field in cls.model._meta.fields.values() if field.name != 'dsl']
+            fields = [field for field in cls.model._meta.fields.values() if field.name not in ('dsl', 'state')]
             sessions = cls.model.select(*fields).where(cls.model.dialog_id == dialog_id)
         if id:
             sessions = sessions.where(cls.model.id == id)
@@ -73,9 +74,29 @@ class API4ConversationService(CommonService):
         else:
             sessions = sessions.order_by(cls.model.getter_by(orderby).asc())
         count = sessions.count()
-        sessions = sessions.paginate(page_number, items_per_page)
+        sessions = list(sessions.paginate(page_number, items_per_page).dicts())
+        if include_dsl:
+            for sess in sessions:
+                sess["dsl"] = cls.session_dsl(sess.get("dsl"), sess.pop("state", None))
+
+        return count, sessions
 
-        return count, list(sessions.dicts())
+    @staticmethod
+    def session_dsl(dsl, state):
+        """
+        The current DSL of an agent session. The dsl column keeps the DSL the session started
+        with and `state` holds what the runs changed since (see `Graph.session_state`). Updates `dsl` in place.
+        """
+        if isinstance(dsl, str):
+            dsl = json.loads(dsl) if dsl else {}
+        if not dsl or not state:
+            return dsl
+        dsl.update(state.get("dsl", {}))
+        for cid, params in state.get("components", {}).items():
+            cpn = dsl.get("components", {}).get(cid)
+            if cpn:
+                cpn["obj"].setdefault("params", {}).update(params)
+        return dsl
     
     @classmethod
     @DB.connection_context()
@@ -203,7 +203,7 @@ async def completion(tenant_id, agent_id, session_id=None, **kwargs):
             conv.message = []
         if not isinstance(conv.dsl, str):
             conv.dsl = json.dumps(conv.dsl, ensure_ascii=False)
-        canvas = Canvas(conv.dsl, tenant_id, agent_id, canvas_id=agent_id, custom_header=custom_header)
+        canvas = Canvas(conv.dsl, tenant_id, agent_id, canvas_id=agent_id, custom_header=custom_header, state=conv.state)
     else:
         e, cvs = UserCanvasService.get_by_id(agent_id)
         assert e, "Agent not found."
@@ -246,8 +246,10 @@ async def completion(tenant_id, agent_id, session_id=None, **kwargs):
     conv.message.append({"role": "assistant", "content": txt, "created_at": time.time(), "id": message_id})
     conv.reference = canvas.get_reference()
     conv.errors = canvas.error
-    conv.dsl = str(canvas)
+    conv.state = canvas.session_state()
     conv = conv.to_dict()
+    # The DSL of a session never changes after creation; only its state delta is written back.
+    conv.pop("dsl", None)
     API4ConversationService.append_message(conv["id"], conv)
 
 
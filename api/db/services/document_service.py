@@ -13,11 +13,14 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 #
-import asyncio
 import json
 import logging
+import math
+import os
 import random
 import re
+import time
+from collections import defaultdict
 from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 from datetime import datetime
@@ -39,9 +42,14 @@ from common.time_utils import current_timestamp, get_format_time
 from common.constants import LLMType, ParserType, StatusEnum, TaskStatus, SVR_CONSUMER_GROUP_NAME
 from rag.nlp import rag_tokenizer, search
 from rag.utils.redis_conn import REDIS_CONN
+from rag.utils.task_scheduler import TaskScheduler
 from common.doc_store.doc_store_base import OrderByExpr
 from common import settings
 
+DOC_PROGRESS_SYNC_BATCH = int(os.environ.get("DOC_PROGRESS_SYNC_BATCH", 500))
+# An unchanged running document still gets its process_duration refreshed this often (seconds).
+DOC_PROGRESS_REFRESH_INTERVAL = int(os.environ.get("DOC_PROGRESS_REFRESH_INTERVAL", 30))
+
 
 class DocumentService(CommonService):
     model = Document
@@ -640,6 +648,11 @@ class DocumentService(CommonService):
     @classmethod
     @DB.connection_context()
     def get_chunking_config(cls, doc_id):
+        return cls.get_chunking_configs([doc_id]).get(doc_id)
+
+    @classmethod
+    @DB.connection_context()
+    def get_chunking_configs(cls, doc_ids: list[str]) -> dict:
         configs = (
             cls.model.select(
                 cls.model.id,
@@ -655,12 +668,9 @@ class DocumentService(CommonService):
             )
             .join(Knowledgebase, on=(cls.model.kb_id == Knowledgebase.id))
             .join(Tenant, on=(Knowledgebase.tenant_id == Tenant.id))
-            .where(cls.model.id == doc_id)
+            .where(cls.model.id.in_(doc_ids))
         )
-        configs = configs.dicts()
-        if not configs:
-            return None
-        return configs[0]
+        return {c["id"]: c for c in configs.dicts()}
 
     @classmethod
     @DB.connection_context()
@@ -749,83 +759,148 @@ class DocumentService(CommonService):
         if not docs:
             return
 
-        cls._sync_progress(docs)
-
+        cls._sync_progress(docs, force=True)
 
     @classmethod
     @DB.connection_context()
-    def _sync_progress(cls, docs:list[dict]):
-        from api.db.services.task_service import TaskService
+    def _sync_progress(cls, docs:list[dict], force=False):
+        """
+        Fold task progress into document progress, DOC_PROGRESS_SYNC_BATCH documents at a time:
+        one task query and one document query per batch, one queue-lag read per priority per
+        sweep, and the changed documents written in one transaction. Unless `force`, a document
+        whose run/progress/message did not change is only rewritten every
+        DOC_PROGRESS_REFRESH_INTERVAL seconds to advance its process_duration.
+        """
+        started = time.perf_counter()
+        queue_lengths = {}
 
+        def queue_length(priority):
+            if priority not in queue_lengths:
+                queue_lengths[priority] = get_queue_length(priority)
+            return queue_lengths[priority]
+
+        written = 0
+        for i in range(0, len(docs), DOC_PROGRESS_SYNC_BATCH):
+            try:
+                written += cls._sync_progress_batch(docs[i:i + DOC_PROGRESS_SYNC_BATCH], queue_length, force)
+            except Exception as e:
+                if str(e).find("'0'") < 0:
+                    logging.exception("fetch task exception")
+
+        if docs:
+            stats = {"docs": len(docs), "written": written, "seconds": round(time.perf_counter() - started, 3), "at": current_timestamp()}
+            logging.debug(f"DocumentService._sync_progress: {stats}")
+            REDIS_CONN.set_obj("doc_progress_sync_stats", stats, 600)
+
+    @classmethod
+    def _sync_progress_batch(cls, docs:list[dict], queue_length, force):
+        doc_ids = [d["id"] for d in docs]
+        tasks = defaultdict(list)
+        for t in Task.select(Task.doc_id, Task.progress, Task.progress_msg, Task.task_type, Task.priority).where(Task.doc_id.in_(doc_ids)).dicts():
+            tasks[t["doc_id"]].append(t)
+        current = {
+            doc["id"]: doc
+            for doc in cls.model.select(cls.model.id, cls.model.run, cls.model.progress, cls.model.progress_msg, cls.model.update_time)
+            .where(cls.model.id.in_(doc_ids))
+            .dicts()
+        }
+
+        now = current_timestamp()
+        updates = []
         for d in docs:
+            tsks = tasks.get(d["id"])
+            doc = current.get(d["id"])
+            if not tsks or not doc:
+                continue
             try:
-                tsks = TaskService.query(doc_id=d["id"], order_by=Task.create_time)
-                if not tsks:
-                    continue
-                msg = []
-                prg = 0
-                finished = True
-                bad = 0
-                e, doc = DocumentService.get_by_id(d["id"])
-                status = doc.run  # TaskStatus.RUNNING.value
-                if status == TaskStatus.CANCEL.value:
-                    continue
-                doc_progress = doc.progress if doc and doc.progress else 0.0
-                special_task_running = False
-                priority = 0
-                for t in tsks:
-                    task_type = (t.task_type or "").lower()
-                    if task_type in PIPELINE_SPECIAL_PROGRESS_FREEZE_TASK_TYPES:
-                        special_task_running = True
-                    if 0 <= t.progress < 1:
-                        finished = False
-                    if t.progress == -1:
-                        bad += 1
-                    prg += t.progress if t.progress >= 0 else 0
-                    if t.progress_msg.strip():
-                        msg.append(t.progress_msg)
-                    priority = max(priority, t.priority)
-                prg /= len(tsks)
-                if finished and bad:
-                    prg = -1
-                    status = TaskStatus.FAIL.value
-                elif finished:
-                    prg = 1
-                    status = TaskStatus.DONE.value
-
-                # only for special task and parsed docs and unfinished
-                freeze_progress = special_task_running and doc_progress >= 1 and not finished
-                msg = "\n".join(sorted(msg))
-                begin_at = d.get("process_begin_at")
-                if not begin_at:
-                    begin_at = datetime.now()
-                    # fallback
-                    cls.update_by_id(d["id"], {"process_begin_at": begin_at})
-
-                info = {
-                    "process_duration": max(datetime.timestamp(datetime.now()) - begin_at.timestamp(), 0),
-                    "run": status}
-                if prg != 0 and not freeze_progress:
-                    info["progress"] = prg
-                if msg:
-                    info["progress_msg"] = msg
-                    if msg.endswith("created task graphrag") or msg.endswith("created task raptor") or msg.endswith("created task mindmap"):
-                        info["progress_msg"] += "\n%d tasks are ahead in the queue..."%get_queue_length(priority)
-                else:
-                    info["progress_msg"] = "%d tasks are ahead in the queue..."%get_queue_length(priority)
-                info["update_time"] = current_timestamp()
-                info["update_date"] = get_format_time()
-                (
-                    cls.model.update(info)
-                    .where(
-                        (cls.model.id == d["id"])
-                        & ((cls.model.run.is_null(True)) | (cls.model.run != TaskStatus.CANCEL.value))
-                    )
-                    .execute()
-                )
+                info = cls._progress_info(d, tsks, doc, queue_length, now, force)
             except Exception as e:
                 if str(e).find("'0'") < 0:
                     logging.exception("fetch task exception")
+                continue
+            if info:
+                updates.append((d["id"], info))
+
+        if updates:
+            with DB.atomic():
+                # Rows are locked in id order, so overlapping sweeps of two servers cannot deadlock.
+                for doc_id, info in sorted(updates, key=lambda u: u[0]):
+                    (
+                        cls.model.update(info)
+                        .where(
+                            (cls.model.id == doc_id)
+                            & ((cls.model.run.is_null(True)) | (cls.model.run != TaskStatus.CANCEL.value))
+                        )
+                        .execute()
+                    )
+        return len(updates)
+
+    @staticmethod
+    def _progress_field_changed(stored, value) -> bool:
+        # progress is a single-precision FLOAT column: what is read back is only close to what was written.
+        if isinstance(stored, float) and isinstance(value, (int, float)) and not isinstance(value, bool):
+            return not math.isclose(stored, value, abs_tol=1e-6)
+        return stored != value
+
+    @classmethod
+    def _progress_info(cls, d:dict, tsks:list[dict], doc:dict, queue_length, now, force):
+        msg = []
+        prg = 0
+        finished = True
+        bad = 0
+        status = doc["run"]  # TaskStatus.RUNNING.value
+        if status == TaskStatus.CANCEL.value:
+            return None
+        doc_progress = doc["progress"] or 0.0
+        special_task_running = False
+        priority = 0
+        for t in tsks:
+            task_type = (t["task_type"] or "").lower()
+            if task_type in PIPELINE_SPECIAL_PROGRESS_FREEZE_TASK_TYPES:
+                special_task_running = True
+            if 0 <= t["progress"] < 1:
+                finished = False
+            if t["progress"] == -1:
+                bad += 1
+            prg += t["progress"] if t["progress"] >= 0 else 0
+            if t["progress_msg"].strip():
+                msg.append(t["progress_msg"])
+            priority = max(priority, t["priority"])
+        prg /= len(tsks)
+        if finished and bad:
+            prg = -1
+            status = TaskStatus.FAIL.value
+        elif finished:
+            prg = 1
+            status = TaskStatus.DONE.value
+
+        # only for special task and parsed docs and unfinished
+        freeze_progress = special_task_running and doc_progress >= 1 and not finished
+        msg = "\n".join(sorted(msg))
+        info = {"run": status}
+        if prg != 0 and not freeze_progress:
+            info["progress"] = prg
+        if msg:
+            info["progress_msg"] = msg
+            if msg.endswith("created task graphrag") or msg.endswith("created task raptor") or msg.endswith("created task mindmap"):
+                info["progress_msg"] += "\n%d tasks are ahead in the queue..."%queue_length(priority)
+        else:
+            info["progress_msg"] = "%d tasks are ahead in the queue..."%queue_length(priority)
+
+        begin_at = d.get("process_begin_at")
+        changed = force or any(cls._progress_field_changed(doc[k], v) for k, v in info.items())
+        if not begin_at:
+            # fallback
+            begin_at = datetime.now()
+            info["process_begin_at"] = begin_at
+            changed = True
+        if not changed and now - (doc["update_time"] or 0) < DOC_PROGRESS_REFRESH_INTERVAL * 1000:
+            return None
+
+        info["process_duration"] = max(datetime.timestamp(datetime.now()) - begin_at.timestamp(), 0)
+        info["update_time"] = now
+        info["update_date"] = get_format_time()
+        return info
 
     @classmethod
     @DB.connection_context()
@@ -965,15 +1040,18 @@ def queue_raptor_o_graphrag_tasks(sample_doc_id, ty, priority, fake_doc_id="", d
     task["doc_id"] = fake_doc_id
     task["doc_ids"] = doc_ids
     DocumentService.begin2parse(sample_doc_id["id"], keep_progress=True)
-    assert REDIS_CONN.queue_product(settings.get_svr_queue_name(priority), message=task), "Can't access Redis. Please check the Redis' status."
+    assert TaskScheduler.enqueue(priority, chunking_config["tenant_id"], task), "Can't access Redis. Please check the Redis' status."
     return task["id"]
 
 
 def get_queue_length(priority):
-    group_info = REDIS_CONN.queue_info(settings.get_svr_queue_name(priority), SVR_CONSUMER_GROUP_NAME)
+    queue_name = settings.get_svr_queue_name(priority)
+    # Tasks still waiting in the tenant queues are ahead too, not only the stream lag.
+    waiting = TaskScheduler.queued(queue_name)
+    group_info = REDIS_CONN.queue_info(queue_name, SVR_CONSUMER_GROUP_NAME)
     if not group_info:
-        return 0
-    return int(group_info.get("lag", 0) or 0)
+        return waiting
+    return int(group_info.get("lag", 0) or 0) + waiting
 
 
 def doc_upload_and_parse(conversation_id, file_objs, user_id):
@@ -981,7 +1059,7 @@ def doc_upload_and_parse(conversation_id, file_objs, user_id):
     from api.db.services.conversation_service import ConversationService
     from api.db.services.dialog_service import DialogService
     from api.db.services.file_service import FileService
-    from api.db.services.llm_service import LLMBundle
+    from api.db.services.llm_service import LLMBundle, run_coroutine_sync
     from api.db.services.user_service import TenantService
     from rag.app import audio, email, naive, picture, presentation
 
@@ -1085,7 +1163,7 @@ def doc_upload_and_parse(conversation_id, file_objs, user_id):
             from rag.graphrag.general.mind_map_extractor import MindMapExtractor
             mindmap = MindMapExtractor(llm_bdl)
             try:
-                mind_map = asyncio.run(mindmap([c["content_with_weight"] for c in docs if c["doc_id"] == doc_id]))
+                mind_map = run_coroutine_sync(mindmap([c["content_with_weight"] for c in docs if c["doc_id"] == doc_id]))
                 mind_map = json.dumps(mind_map.output, ensure_ascii=False, indent=2)
                 if len(mind_map) < 32:
                     raise Exception("Few content: " + mind_map)
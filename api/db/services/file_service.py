@@ -35,7 +35,7 @@ from common.misc_utils import get_uuid
 from common.constants import TaskStatus, FileSource, ParserType
 from api.db.services.knowledgebase_service import KnowledgebaseService
 from api.db.services.task_service import TaskService
-from api.utils.file_utils import filename_type, read_potential_broken_pdf, thumbnail_img, sanitize_path
+from api.utils.file_utils import filename_type, page_count, read_potential_broken_pdf, thumbnail_img, sanitize_path
 from rag.llm.cv_model import GptV4
 from common import settings
 
@@ -445,6 +445,7 @@ class FileService(CommonService):
                 blob = file.read()
                 settings.STORAGE_IMPL.put(kb.id, doc.location, blob, kb.tenant_id)
                 doc.size = len(blob)
+                doc.page_num = page_count(doc.name, blob, doc.parser_id)
                 doc = doc.to_dict()
                 DocumentService.update_by_id(doc["id"], doc)
                 continue
@@ -486,6 +487,7 @@ class FileService(CommonService):
                     "size": len(blob),
                     "thumbnail": thumbnail_location,
                 }
+                doc["page_num"] = page_count(filename, blob, doc["parser_id"])
                 DocumentService.insert(doc)
 
                 FileService.add_file_from_kb(doc, kb_folder["id"], kb.tenant_id)
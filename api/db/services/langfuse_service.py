@@ -20,6 +20,7 @@ import peewee
 
 from api.db.db_models import DB, TenantLangfuse
 from api.db.services.common_service import CommonService
+from api.db.services.tenant_model_cache import TenantModelCache
 from common.time_utils import current_timestamp, datetime_format
 
 
@@ -54,13 +55,17 @@ class TenantLangfuseService(CommonService):
     @classmethod
     @DB.connection_context()
     def delete_ty_tenant_id(cls, tenant_id):
-        return cls.model.delete().where(cls.model.tenant_id == tenant_id).execute()
+        num = cls.model.delete().where(cls.model.tenant_id == tenant_id).execute()
+        TenantModelCache.invalidate(tenant_id)
+        return num
 
     @classmethod
     def update_by_tenant(cls, tenant_id, langfuse_keys):
         langfuse_keys["update_time"] = current_timestamp()
         langfuse_keys["update_date"] = datetime_format(datetime.now())
-        return cls.model.update(**langfuse_keys).where(cls.model.tenant_id == tenant_id).execute()
+        num = cls.model.update(**langfuse_keys).where(cls.model.tenant_id == tenant_id).execute()
+        TenantModelCache.invalidate(tenant_id)
+        return num
 
     @classmethod
     def save(cls, **kwargs):
@@ -72,8 +77,10 @@ class TenantLangfuseService(CommonService):
         kwargs["update_time"] = current_ts
         kwargs["update_date"] = current_date
         obj = cls.model.create(**kwargs)
+        TenantModelCache.invalidate(kwargs.get("tenant_id"))
         return obj
 
     @classmethod
     def delete_model(cls, langfuse_model):
         langfuse_model.delete_instance()
+        TenantModelCache.invalidate(langfuse_model.tenant_id)
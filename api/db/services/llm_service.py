@@ -16,9 +16,12 @@
 import asyncio
 import inspect
 import logging
+import os
 import queue
 import re
 import threading
+import time
+from collections import Counter
 from functools import partial
 from typing import Generator
 
@@ -26,7 +29,220 @@ from api.db.db_models import LLM
 from api.db.services.common_service import CommonService
 from api.db.services.tenant_llm_service import LLM4Tenant, TenantLLMService
 from common.constants import LLMType
-from common.token_utils import num_tokens_from_string
+from common.token_utils import num_tokens_from_string, within_token_budget
+
+LLM_BRIDGE_LOOPS = int(os.environ.get("LLM_BRIDGE_LOOPS", 4))
+# Items a bridged stream may run ahead of its consumer before the producer waits.
+LLM_BRIDGE_QUEUE_SIZE = int(os.environ.get("LLM_BRIDGE_QUEUE_SIZE", 64))
+# A bridge loop that has not run its watchdog tick for this long is reported as stalled
+# and gets no new work while another loop is responsive.
+LLM_BRIDGE_STALL_SECONDS = float(os.environ.get("LLM_BRIDGE_STALL_SECONDS", 1.0))
+_BRIDGE_TICK_SECONDS = 0.1
+
+
+class _LoopBridge:
+    """
+    Long-lived event loops on daemon threads for running coroutines from sync code,
+    instead of a fresh thread and event loop per call. Work goes to the responsive loop
+    with the fewest coroutines in flight.
+
+    The loops are shared, so bridged coroutines must not block: synchronous I/O, sleeps
+    and heavy CPU work inside them go through thread_pool_exec. A coroutine that blocks
+    anyway delays every other coroutine on its loop; each loop runs a watchdog tick so a
+    stalled loop is logged, counted in the stats and skipped by new work until it recovers.
+    """
+
+    def __init__(self, size: int):
+        self._size = max(1, size)
+        self._lock = threading.Lock()
+        self._loops: list = []
+        self._thread_ids: set = set()
+        self._in_flight: Counter = Counter()
+        self._ticks: dict = {}
+        self._stats: Counter = Counter()
+
+    def _start(self):
+        for i in range(self._size):
+            loop = asyncio.new_event_loop()
+            started = threading.Event()
+
+            def serve(loop=loop, started=started):
+                asyncio.set_event_loop(loop)
+                self._thread_ids.add(threading.get_ident())
+                self._tick(loop)
+                started.set()
+                loop.run_forever()
+
+            threading.Thread(target=serve, name=f"llm_bridge_{i}", daemon=True).start()
+            started.wait()
+            self._loops.append(loop)
+
+    def _tick(self, loop):
+        now = time.monotonic()
+        last = self._ticks.get(id(loop))
+        if last is not None and now - last > _BRIDGE_TICK_SECONDS + LLM_BRIDGE_STALL_SECONDS:
+            with self._lock:
+                self._stats["stalls"] += 1
+            logging.warning(f"LLM bridge loop stalled for {now - last - _BRIDGE_TICK_SECONDS:.1f}s: a bridged coroutine ran blocking code on it")
+        self._ticks[id(loop)] = now
+        loop.call_later(_BRIDGE_TICK_SECONDS, self._tick, loop)
+
+    def _responsive(self, loop, now: float) -> bool:
+        return now - self._ticks.get(id(loop), now) <= _BRIDGE_TICK_SECONDS + LLM_BRIDGE_STALL_SECONDS
+
+    def _pick(self):
+        with self._lock:
+            if not self._loops:
+                self._start()
+            now = time.monotonic()
+            loops = [lp for lp in self._loops if self._responsive(lp, now)] or self._loops
+            loop = min(loops, key=lambda lp: self._in_flight[id(lp)])
+            self._in_flight[id(loop)] += 1
+        return loop
+
+    def _done(self, loop, started: float, kind: str):
+        waited = time.monotonic() - started
+        with self._lock:
+            self._in_flight[id(loop)] -= 1
+            self._stats[kind] += 1
+            self._stats[f"{kind}_seconds"] += waited
+            self._stats[f"{kind}_max_seconds"] = max(self._stats[f"{kind}_max_seconds"], waited)
+
+    def in_bridge_thread(self) -> bool:
+        return threading.get_ident() in self._thread_ids
+
+    def run(self, coro):
+        """Run `coro` to completion on a bridge loop and return its result."""
+        if self.in_bridge_thread():
+            # Blocking here would deadlock the loop the coroutine needs; fall back to a private thread.
+            with self._lock:
+                self._stats["fallback"] += 1
+            return _run_in_new_thread(coro)
+        loop = self._pick()
+        started = time.monotonic()
+        try:
+            return asyncio.run_coroutine_threadsafe(coro, loop).result()
+        finally:
+            self._done(loop, started, "calls")
+
+    def iterate(self, async_gen_fn, *args, **kwargs) -> Generator:
+        """
+        Consume an async generator from sync code. The producer runs on a bridge loop and
+        stays at most LLM_BRIDGE_QUEUE_SIZE items ahead; closing the generator cancels it.
+        """
+        if self.in_bridge_thread():
+            # Same deadlock as in `run`: the producer would need the loop this thread is blocking.
+            with self._lock:
+                self._stats["fallback"] += 1
+            yield from _iterate_in_new_thread(async_gen_fn, *args, **kwargs)
+            return
+        items: queue.Queue = queue.Queue()
+        loop = self._pick()
+        credits = None
+
+        async def produce():
+            nonlocal credits
+            credits = asyncio.Semaphore(max(1, LLM_BRIDGE_QUEUE_SIZE))
+            try:
+                async for item in async_gen_fn(*args, **kwargs):
+                    await credits.acquire()
+                    items.put(item)
+            except Exception as e:
+                items.put(e)
+            finally:
+                items.put(StopIteration)
+
+        started = time.monotonic()
+        future = asyncio.run_coroutine_threadsafe(produce(), loop)
+        try:
+            while True:
+                item = items.get()
+                if item is StopIteration:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                loop.call_soon_threadsafe(credits.release)
+                yield item
+        finally:
+            future.cancel()
+            self._done(loop, started, "streams")
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["loops"] = len(self._loops)
+            stats["in_flight"] = sum(self._in_flight.values())
+            now = time.monotonic()
+            stats["stalled_loops"] = sum(1 for lp in self._loops if not self._responsive(lp, now))
+        for kind in ("calls", "streams"):
+            if stats.get(kind):
+                stats[f"{kind}_avg_seconds"] = stats[f"{kind}_seconds"] / stats[kind]
+        return stats
+
+
+def _run_in_new_thread(coro):
+    result_queue: queue.Queue = queue.Queue()
+
+    def runner():
+        try:
+            result_queue.put((True, asyncio.run(coro)))
+        except Exception as e:
+            result_queue.put((False, e))
+
+    thread = threading.Thread(target=runner, daemon=True)
+    thread.start()
+    thread.join()
+
+    success, value = result_queue.get_nowait()
+    if success:
+        return value
+    raise value
+
+
+def _iterate_in_new_thread(async_gen_fn, *args, **kwargs) -> Generator:
+    items: queue.Queue = queue.Queue()
+    closed = threading.Event()
+
+    async def produce():
+        try:
+            async for item in async_gen_fn(*args, **kwargs):
+                if closed.is_set():
+                    break
+                items.put(item)
+        except Exception as e:
+            items.put(e)
+        finally:
+            items.put(StopIteration)
+
+    threading.Thread(target=lambda: asyncio.run(produce()), daemon=True).start()
+    try:
+        while True:
+            item = items.get()
+            if item is StopIteration:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        closed.set()
+
+
+_BRIDGE = _LoopBridge(LLM_BRIDGE_LOOPS)
+
+
+def run_coroutine_sync(coro):
+    """Run a coroutine from sync code on the shared bridge loops and return its result."""
+    return _BRIDGE.run(coro)
+
+
+def iterate_async_gen(async_gen_fn, *args, **kwargs) -> Generator:
+    """Iterate an async generator from sync code on the shared bridge loops."""
+    return _BRIDGE.iterate(async_gen_fn, *args, **kwargs)
+
+
+def bridge_stats() -> dict:
+    """Call/stream counts and latency of the sync-to-async bridge."""
+    return _BRIDGE.stats()
 
 
 class LLMService(CommonService):
@@ -98,8 +314,7 @@ class LLMBundle(LLM4Tenant):
 
         safe_texts = []
         for text in texts:
-            token_size = num_tokens_from_string(text)
-            if token_size > self.max_length:
+            if not within_token_budget(text, self.max_length):
                 target_len = int(self.max_length * 0.95)
                 safe_texts.append(text[:target_len])
             else:
@@ -136,7 +351,7 @@ class LLMBundle(LLM4Tenant):
         if self.langfuse:
             generation = self.langfuse.start_generation(trace_context=self.trace_context, name="similarity", model=self.llm_name, input={"query": query, "texts": texts})
 
-        sim, used_tokens = self.mdl.similarity(query, texts)
+        sim, used_tokens = self.mdl.cached_similarity(query, texts)
         if not TenantLLMService.increase_usage(self.tenant_id, self.llm_type, used_tokens):
             logging.error("LLMBundle.similarity can't update token usage for {}/RERANK used_tokens: {}".format(self.tenant_id, used_tokens))
 
@@ -295,74 +510,6 @@ class LLMBundle(LLM4Tenant):
         else:
             return {k: v for k, v in kwargs.items() if k in allowed_params}
 
-    def _run_coroutine_sync(self, coro):
-        try:
-            asyncio.get_running_loop()
-        except RuntimeError:
-            return asyncio.run(coro)
-
-        result_queue: queue.Queue = queue.Queue()
-
-        def runner():
-            try:
-                result_queue.put((True, asyncio.run(coro)))
-            except Exception as e:
-                result_queue.put((False, e))
-
-        thread = threading.Thread(target=runner, daemon=True)
-        thread.start()
-        thread.join()
-
-        success, value = result_queue.get_nowait()
-        if success:
-            return value
-        raise value
-
-    def _sync_from_async_stream(self, async_gen_fn, *args, **kwargs):
-        result_queue: queue.Queue = queue.Queue()
-
-        def runner():
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-
-            async def consume():
-                try:
-                    async for item in async_gen_fn(*args, **kwargs):
-                        result_queue.put(item)
-                except Exception as e:
-                    result_queue.put(e)
-                finally:
-                    result_queue.put(StopIteration)
-
-            loop.run_until_complete(consume())
-            loop.close()
-
-        threading.Thread(target=runner, daemon=True).start()
-
-        while True:
-            item = result_queue.get()
-            if item is StopIteration:
-                break
-            if isinstance(item, Exception):
-                raise item
-            yield item
-
-    def _bridge_sync_stream(self, gen):
-        loop = asyncio.get_running_loop()
-        queue: asyncio.Queue = asyncio.Queue()
-
-        def worker():
-            try:
-                for item in gen:
-                    loop.call_soon_threadsafe(queue.put_nowait, item)
-            except Exception as e:
-                loop.call_soon_threadsafe(queue.put_nowait, e)
-            finally:
-                loop.call_soon_threadsafe(queue.put_nowait, StopAsyncIteration)
-
-        threading.Thread(target=worker, daemon=True).start()
-        return queue
-
     async def async_chat(self, system: str, history: list, gen_conf: dict = {}, **kwargs):
         if self.is_tools and getattr(self.mdl, "is_tools", False) and hasattr(self.mdl, "async_chat_with_tools"):
             base_fn = self.mdl.async_chat_with_tools
@@ -13,30 +13,43 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 #
+import atexit
+import json
 import logging
 import os
 import random
+import socket
+import threading
+import time
 import xxhash
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 from api.db.db_utils import bulk_insert_into_db
-from deepdoc.parser import PdfParser
 from peewee import JOIN
 from api.db.db_models import DB, File2Document, File
 from api.db import FileType
 from api.db.db_models import Task, Document, Knowledgebase, Tenant
 from api.db.services.common_service import CommonService
 from api.db.services.document_service import DocumentService
-from common.misc_utils import get_uuid
-from common.time_utils import current_timestamp
+from common.misc_utils import get_uuid, once
+from common.time_utils import current_timestamp, get_format_time
 from common.constants import StatusEnum, TaskStatus
-from deepdoc.parser.excel_parser import RAGFlowExcelParser
 from rag.utils.redis_conn import REDIS_CONN
+from rag.utils.task_scheduler import TaskScheduler
 from common import settings
 from rag.nlp import search
 
 CANVAS_DEBUG_DOC_ID = "dataflow_x"
 GRAPH_RAPTOR_FAKE_DOC_ID = "graph_raptor_x"
+TASK_PROGRESS_FLUSH_INTERVAL = float(os.environ.get("TASK_PROGRESS_FLUSH_INTERVAL", 2))
+PARSE_JOB_BATCH = int(os.environ.get("PARSE_JOB_BATCH", 200))
+# Re-parse requests of up to this many documents are done before the API call returns.
+PARSE_JOB_SYNC_LIMIT = int(os.environ.get("PARSE_JOB_SYNC_LIMIT", 64))
+PARSE_JOB_TTL = int(os.environ.get("PARSE_JOB_TTL", 24 * 3600))
+# Seconds between liveness beats of the process running a parse job; a running job missing
+# three beats is reported as failed.
+PARSE_JOB_HEARTBEAT = int(os.environ.get("PARSE_JOB_HEARTBEAT", 10))
 
 def trim_header_by_lines(text: str, max_length) -> str:
     # Trim header text to maximum length while preserving line breaks
@@ -298,9 +311,10 @@ class TaskService(CommonService):
     def update_progress(cls, id, info):
         """Update the progress information for a task.
 
-        This method updates both the progress message and completion percentage of a task.
-        It handles platform-specific behavior (macOS vs others) and uses database locking
-        when necessary to ensure thread safety.
+        This method updates both the progress message and completion percentage of a task
+        in one statement, holding a row lock on the task (SELECT ... FOR UPDATE) so that
+        concurrent writers of the same task do not lose messages. Writers of different
+        tasks never wait for each other. With MACOS set, no lock is taken, as before.
 
         Update Rules:
             - progress_msg: Always appends the new message to the existing one, and trims the result to max 3000 lines.
@@ -314,13 +328,12 @@ class TaskService(CommonService):
                         - progress_msg (str, optional): Progress message to append
                         - progress (float, optional): Progress percentage (0.0 to 1.0)
         """
-        task = cls.model.get_by_id(id)
-        if not task:
-            logging.warning("Update_progress error: task not found")
-            return
-
         if os.environ.get("MACOS"):
-            if info["progress_msg"]:
+            task = cls.model.get_or_none(cls.model.id == id)
+            if not task:
+                logging.warning("Update_progress error: task not found")
+                return
+            if info.get("progress_msg"):
                 progress_msg = trim_header_by_lines(task.progress_msg + "\n" + info["progress_msg"], 3000)
                 cls.model.update(progress_msg=progress_msg).where(cls.model.id == id).execute()
             if "progress" in info:
@@ -332,23 +345,24 @@ class TaskService(CommonService):
                             ((prog == -1) | (prog > cls.model.progress))
                     )
                 ).execute()
-        else:
-            with DB.lock("update_progress", -1):
-                if info["progress_msg"]:
-                    progress_msg = trim_header_by_lines(task.progress_msg + "\n" + info["progress_msg"], 3000)
-                    cls.model.update(progress_msg=progress_msg).where(cls.model.id == id).execute()
-                if "progress" in info:
-                    prog = info["progress"]
-                    cls.model.update(progress=prog).where(
-                        (cls.model.id == id) &
-                        (
-                            (cls.model.progress != -1) &
-                            ((prog == -1) | (prog > cls.model.progress))
-                        )
-                    ).execute()
+            process_duration = (datetime.now() - task.begin_at).total_seconds()
+            cls.model.update(process_duration=process_duration).where(cls.model.id == id).execute()
+            return
+
+        with DB.atomic():
+            task = cls.model.select().where(cls.model.id == id).for_update().first()
+            if not task:
+                logging.warning("Update_progress error: task not found")
+                return
 
-        process_duration = (datetime.now() - task.begin_at).total_seconds()
-        cls.model.update(process_duration=process_duration).where(cls.model.id == id).execute()
+            updates = {"process_duration": (datetime.now() - task.begin_at).total_seconds()}
+            if info.get("progress_msg"):
+                updates["progress_msg"] = trim_header_by_lines(task.progress_msg + "\n" + info["progress_msg"], 3000)
+            if "progress" in info:
+                prog = info["progress"]
+                if task.progress != -1 and (prog == -1 or prog > task.progress):
+                    updates["progress"] = prog
+            cls.model.update(**updates).where(cls.model.id == id).execute()
 
     @classmethod
     @DB.connection_context()
@@ -357,26 +371,8 @@ class TaskService(CommonService):
         return cls.model.delete().where(cls.model.doc_id.in_(doc_ids)).execute()
 
 
-def queue_tasks(doc: dict, bucket: str, name: str, priority: int):
-    """Create and queue document processing tasks.
-
-    This function creates processing tasks for a document based on its type and configuration.
-    It handles different document types (PDF, Excel, etc.) differently and manages task
-    chunking and configuration. It also implements task reuse optimization by checking
-    for previously completed tasks.
-
-    Args:
-        doc (dict): Document dictionary containing metadata and configuration.
-        bucket (str): Storage bucket name where the document is stored.
-        name (str): File name of the document.
-        priority (int, optional): Priority level for task queueing (default is 0).
-
-    Note:
-        - For PDF documents, tasks are created per page range based on configuration
-        - For Excel documents, tasks are created per row range
-        - Task digests are calculated for optimization and reuse
-        - Previous task chunks may be reused if available
-    """
+def _plan_parse_tasks(doc: dict, chunking_config: dict, priority: int) -> list[dict]:
+    """Split a document into its page/row range tasks, each stamped with the digest used for chunk reuse."""
 
     def new_task():
         return {
@@ -385,17 +381,22 @@ def queue_tasks(doc: dict, bucket: str, name: str, priority: int):
             "progress": 0.0,
             "from_page": 0,
             "to_page": 100000000,
+            "task_type": "",
             "begin_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         }
 
     parse_task_array = []
-
-    if doc["type"] == FileType.PDF.value:
-        file_bin = settings.STORAGE_IMPL.get(bucket, name)
+    splittable = doc["type"] == FileType.PDF.value or doc["parser_id"] == "table"
+    if splittable and doc.get("page_num") is None:
+        # Uploaded before counts were stored: let an executor count and plan instead of
+        # downloading the file here.
+        task = new_task()
+        task["task_type"] = "plan"
+        parse_task_array.append(task)
+
+    elif doc["type"] == FileType.PDF.value:
         do_layout = doc["parser_config"].get("layout_recognize", "DeepDOC")
-        pages = PdfParser.total_page_number(doc["name"], file_bin)
-        if pages is None:
-            pages = 0
+        pages = doc["page_num"]
         page_size = doc["parser_config"].get("task_page_size") or 12
         if doc["parser_id"] == "paper":
             page_size = doc["parser_config"].get("task_page_size") or 22
@@ -413,8 +414,7 @@ def queue_tasks(doc: dict, bucket: str, name: str, priority: int):
                 parse_task_array.append(task)
 
     elif doc["parser_id"] == "table":
-        file_bin = settings.STORAGE_IMPL.get(bucket, name)
-        rn = RAGFlowExcelParser.row_number(doc["name"], file_bin)
+        rn = doc["page_num"]
         for i in range(0, rn, 3000):
             task = new_task()
             task["from_page"] = i
@@ -423,7 +423,6 @@ def queue_tasks(doc: dict, bucket: str, name: str, priority: int):
     else:
         parse_task_array.append(new_task())
 
-    chunking_config = DocumentService.get_chunking_config(doc["id"])
     for task in parse_task_array:
         hasher = xxhash.xxh64()
         for field in sorted(chunking_config.keys()):
@@ -438,13 +437,43 @@ def queue_tasks(doc: dict, bucket: str, name: str, priority: int):
         task["digest"] = task_digest
         task["progress"] = 0.0
         task["priority"] = priority
+    return parse_task_array
+
 
-    prev_tasks = TaskService.get_tasks(doc["id"])
+def queue_tasks(doc: dict, bucket: str, name: str, priority: int, keep_task_id: str | None = None):
+    """Create and queue document processing tasks.
+
+    This function creates processing tasks for a document based on its type and configuration.
+    It handles different document types (PDF, Excel, etc.) differently and manages task
+    chunking and configuration. It also implements task reuse optimization by checking
+    for previously completed tasks.
+
+    Args:
+        doc (dict): Document dictionary containing metadata and configuration.
+        bucket (str): Storage bucket name where the document is stored.
+        name (str): File name of the document.
+        priority (int, optional): Priority level for task queueing (default is 0).
+        keep_task_id (str, optional): A task of the document left in place, e.g. the
+            running "plan" task, which its handler removes once it returns.
+
+    Note:
+        - For PDF documents, tasks are created per page range based on configuration
+        - For Excel documents, tasks are created per row range
+        - Page/row counts come from doc["page_num"], counted at upload; without it a single
+          "plan" task is queued and the task executor counts and calls this again
+        - Task digests are calculated for optimization and reuse
+        - Previous task chunks may be reused if available
+    """
+
+    chunking_config = DocumentService.get_chunking_config(doc["id"])
+    parse_task_array = _plan_parse_tasks(doc, chunking_config, priority)
+
+    prev_tasks = [t for t in TaskService.get_tasks(doc["id"]) or [] if t["id"] != keep_task_id]
     ck_num = 0
     if prev_tasks:
         for task in parse_task_array:
             ck_num += reuse_prev_task_chunks(task, prev_tasks, chunking_config)
-        TaskService.filter_delete([Task.doc_id == doc["id"]])
+        TaskService.filter_delete([Task.doc_id == doc["id"], Task.id != keep_task_id] if keep_task_id else [Task.doc_id == doc["id"]])
         pre_chunk_ids = []
         for pre_task in prev_tasks:
             if pre_task["chunk_ids"]:
@@ -459,8 +488,8 @@ def queue_tasks(doc: dict, bucket: str, name: str, priority: int):
 
     unfinished_task_array = [task for task in parse_task_array if task["progress"] < 1.0]
     for unfinished_task in unfinished_task_array:
-        assert REDIS_CONN.queue_product(
-            settings.get_svr_queue_name(priority), message=unfinished_task
+        assert TaskScheduler.enqueue(
+            priority, chunking_config["tenant_id"], unfinished_task
         ), "Can't access Redis. Please check the Redis' status."
 
 
@@ -511,6 +540,175 @@ def reuse_prev_task_chunks(task: dict, prev_tasks: list[dict], chunking_config:
     return len(task["chunk_ids"].split())
 
 
+@DB.connection_context()
+def reparse_documents(tenant_id: str, kb_id: str, doc_ids: list[str], priority: int = 0) -> int:
+    """
+    Drop the chunks and tasks of `doc_ids` and queue them for parsing again. One doc-store
+    delete-by-query, one task delete, one bulk task insert, one document update and one
+    pipelined Redis enqueue for the whole batch. Returns the number of tasks queued.
+    """
+    settings.docStoreConn.delete({"doc_id": doc_ids}, search.index_name(tenant_id), kb_id)
+    TaskService.filter_delete([Task.doc_id.in_(doc_ids)])
+
+    configs = DocumentService.get_chunking_configs(doc_ids)
+    tasks_by_tenant = {}
+    for doc in Document.select().where(Document.id.in_(doc_ids)).dicts():
+        config = configs.get(doc["id"])
+        if config:
+            tasks_by_tenant.setdefault(config["tenant_id"], []).extend(_plan_parse_tasks(doc, config, priority))
+    tasks = [t for tenant_tasks in tasks_by_tenant.values() for t in tenant_tasks]
+    try:
+        if tasks:
+            bulk_insert_into_db(Task, tasks, True)
+
+        Document.update(
+            run=TaskStatus.RUNNING.value,
+            progress=random.random() * 1 / 100.,
+            progress_msg="Task is queued...",
+            process_begin_at=get_format_time(),
+            chunk_num=0,
+            token_num=0,
+            update_time=current_timestamp(),
+            update_date=get_format_time(),
+        ).where(Document.id.in_(doc_ids)).execute()
+
+        for task_tenant_id, tenant_tasks in tasks_by_tenant.items():
+            assert TaskScheduler.enqueue_many(priority, task_tenant_id, tenant_tasks), "Can't access Redis. Please check the Redis' status."
+    except Exception as e:
+        # Their chunks are already gone: leave the documents unparsed rather than "queued" forever.
+        # Tasks that did reach Redis are dropped by the executor once their rows are gone.
+        TaskService.filter_delete([Task.doc_id.in_(doc_ids)])
+        Document.update(
+            run=TaskStatus.UNSTART.value,
+            progress=0,
+            progress_msg=f"Failed to queue the document for parsing: {e}",
+            chunk_num=0,
+            token_num=0,
+            update_time=current_timestamp(),
+            update_date=get_format_time(),
+        ).where(Document.id.in_(doc_ids)).execute()
+        raise
+    return len(tasks)
+
+
+@once
+def _parse_job_executor():
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="parse_job")
+
+
+class ParseJob:
+    """
+    Bulk re-parse of a dataset's documents, run PARSE_JOB_BATCH documents at a time through
+    `reparse_documents`. Small jobs finish inline, larger ones in a background thread. The
+    job record lives in Redis so any API server can report its progress.
+
+    The job runs in the API server that accepted it. While it is queued or running, that
+    process keeps a short-lived liveness key alive; once the key expires with the job still
+    running (the server stopped), `get` reports the job as failed with the documents done.
+    Batches are committed one by one, so the documents not counted in `done` are untouched
+    and can be submitted again.
+    """
+
+    _owned: set = set()
+    _owned_lock = threading.Lock()
+    _heartbeat = None
+    _owner = f"{socket.gethostname()}:{os.getpid()}"
+
+    @staticmethod
+    def _key(job_id: str) -> str:
+        return f"parse_job:{job_id}"
+
+    @staticmethod
+    def _alive_key(job_id: str) -> str:
+        return f"parse_job:{job_id}:alive"
+
+    @classmethod
+    def _beat(cls, job_id: str):
+        REDIS_CONN.set(cls._alive_key(job_id), cls._owner, PARSE_JOB_HEARTBEAT * 3)
+
+    @classmethod
+    def _run_heartbeat(cls):
+        while True:
+            time.sleep(PARSE_JOB_HEARTBEAT)
+            with cls._owned_lock:
+                owned = list(cls._owned)
+            for job_id in owned:
+                cls._beat(job_id)
+
+    @classmethod
+    def _own(cls, job_id: str):
+        cls._beat(job_id)
+        with cls._owned_lock:
+            cls._owned.add(job_id)
+            if cls._heartbeat is None:
+                cls._heartbeat = threading.Thread(target=cls._run_heartbeat, name="parse_job_heartbeat", daemon=True)
+                cls._heartbeat.start()
+
+    @classmethod
+    def _release(cls, job_id: str):
+        with cls._owned_lock:
+            cls._owned.discard(job_id)
+        REDIS_CONN.delete(cls._alive_key(job_id))
+
+    @classmethod
+    def _save(cls, job: dict):
+        job["update_time"] = current_timestamp()
+        REDIS_CONN.set_obj(cls._key(job["id"]), job, PARSE_JOB_TTL)
+
+    @classmethod
+    def start(cls, tenant_id: str, kb_id: str, doc_ids: list[str], priority: int = 0) -> dict:
+        job = {
+            "id": get_uuid(),
+            "kb_id": kb_id,
+            "status": "running",
+            "total": len(doc_ids),
+            "done": 0,
+            "tasks": 0,
+            "error": "",
+            "owner": cls._owner,
+            "create_time": current_timestamp(),
+        }
+        cls._own(job["id"])
+        cls._save(job)
+        if len(doc_ids) <= PARSE_JOB_SYNC_LIMIT:
+            return cls._run(job, tenant_id, doc_ids, priority)
+        _parse_job_executor().submit(cls._run, dict(job), tenant_id, doc_ids, priority)
+        return job
+
+    @classmethod
+    def get(cls, job_id: str) -> dict | None:
+        job = REDIS_CONN.get(cls._key(job_id))
+        if not job:
+            return None
+        job = json.loads(job)
+        # exist() is None when Redis could not be asked; only a missing key means the owner is gone.
+        if job["status"] == "running" and REDIS_CONN.exist(cls._alive_key(job_id)) == 0:
+            # Read again: a job that just finished saves its status before dropping its key.
+            job = json.loads(REDIS_CONN.get(cls._key(job_id)) or "null") or job
+            if job["status"] == "running":
+                job["status"] = "failed"
+                job["error"] = f"The server process {job.get('owner', '')} running this job stopped after {job['done']}/{job['total']} documents; the rest were not re-parsed."
+                cls._save(job)
+        return job
+
+    @classmethod
+    def _run(cls, job: dict, tenant_id: str, doc_ids: list[str], priority: int) -> dict:
+        try:
+            for i in range(0, len(doc_ids), PARSE_JOB_BATCH):
+                batch = doc_ids[i:i + PARSE_JOB_BATCH]
+                job["tasks"] += reparse_documents(tenant_id, job["kb_id"], batch, priority)
+                job["done"] += len(batch)
+                cls._save(job)
+            job["status"] = "done"
+        except Exception as e:
+            logging.exception(f"ParseJob {job['id']} failed after {job['done']}/{job['total']} documents")
+            job["status"] = "failed"
+            job["error"] = str(e)
+        cls._save(job)
+        cls._release(job["id"])
+        return job
+
+
 def cancel_all_task_of(doc_id):
     for t in TaskService.query(doc_id=doc_id):
         try:
@@ -519,6 +717,100 @@ def cancel_all_task_of(doc_id):
             logging.exception(e)
 
 
+class TaskProgressBuffer:
+    """
+    In-process coalescing of task progress events.
+
+    `add` appends the event to the task's pending messages and folds its progress
+    into the pending value with the same rules as `TaskService.update_progress`
+    (-1 is final, otherwise progress only grows). A daemon thread materializes the
+    pending state every TASK_PROGRESS_FLUSH_INTERVAL seconds with one
+    `update_progress` per task, so a task emitting progress per batch costs at most
+    one row update per interval. Terminal events (progress -1 or >= 1) are written
+    at once, so readers see a task finish without delay.
+    """
+
+    # Reentrant, so code run from a signal handler on the main thread (atexit flushes after
+    # sys.exit) can take them while the interrupted `add` or `flush` holds them.
+    _lock = threading.RLock()
+    _flush_lock = threading.RLock()
+    _pending: dict = {}
+    _wakeup = threading.Event()
+    _thread = None
+
+    @staticmethod
+    def _merge(current, prog):
+        if current is None:
+            return prog
+        return -1 if -1 in (current, prog) else max(current, prog)
+
+    @classmethod
+    def add(cls, task_id, info: dict):
+        prog = info.get("progress")
+        with cls._lock:
+            pending = cls._pending.setdefault(task_id, {"msgs": [], "progress": None})
+            if info.get("progress_msg"):
+                pending["msgs"].append(info["progress_msg"])
+            if prog is not None:
+                pending["progress"] = cls._merge(pending["progress"], prog)
+            if cls._thread is None:
+                if TASK_PROGRESS_FLUSH_INTERVAL > 0:
+                    cls._thread = threading.Thread(target=cls._run, name="task_progress_flusher", daemon=True)
+                    cls._thread.start()
+                else:
+                    cls._thread = False
+                atexit.register(cls.flush)
+        if TASK_PROGRESS_FLUSH_INTERVAL <= 0 or (prog is not None and (prog == -1 or prog >= 1)):
+            cls.flush(task_id)
+
+    @classmethod
+    def _run(cls):
+        while True:
+            cls._wakeup.wait(TASK_PROGRESS_FLUSH_INTERVAL)
+            cls._wakeup.clear()
+            cls.flush()
+
+    @classmethod
+    def flush(cls, task_id=None):
+        """Write the pending progress of `task_id`, or of every task when None."""
+        # Serialized so an immediate flush never overtakes an older batch of the same task.
+        with cls._flush_lock:
+            with cls._lock:
+                if task_id is None:
+                    pending, cls._pending = cls._pending, {}
+                else:
+                    pending = {task_id: cls._pending.pop(task_id)} if task_id in cls._pending else {}
+            done = set()
+            try:
+                # Tasks are written in id order, so concurrent flushes lock rows in the same order.
+                for tid, p in sorted(pending.items()):
+                    info = {"progress_msg": "\n".join(p["msgs"])}
+                    if p["progress"] is not None:
+                        info["progress"] = p["progress"]
+                    try:
+                        TaskService.update_progress(tid, info)
+                    except Exception:
+                        logging.exception(f"TaskProgressBuffer.flush({tid}) failed, keep its progress for the next flush")
+                        cls._requeue(tid, p)
+                    done.add(tid)
+            finally:
+                # Interrupted (e.g. SystemExit from a signal handler): what this flush took but
+                # did not write goes back, for the final flush at exit.
+                for tid, p in pending.items():
+                    if tid not in done:
+                        cls._requeue(tid, p)
+        return len(pending)
+
+    @classmethod
+    def _requeue(cls, tid, p):
+        with cls._lock:
+            newer = cls._pending.get(tid)
+            if newer:
+                p["msgs"].extend(newer["msgs"])
+                p["progress"] = cls._merge(p["progress"], newer["progress"]) if newer["progress"] is not None else p["progress"]
+            cls._pending[tid] = p
+
+
 def has_canceled(task_id):
     try:
         if REDIS_CONN.get(f"{task_id}-cancel"):
@@ -550,9 +842,7 @@ def queue_dataflow(tenant_id:str, flow_id:str, task_id:str, doc_id:str=CANVAS_DE
     task["dataflow_id"] = flow_id
     task["file"] = file
 
-    if not REDIS_CONN.queue_product(
-            settings.get_svr_queue_name(priority), message=task
-    ):
+    if not TaskScheduler.enqueue(priority, tenant_id, task):
         return False, "Can't access Redis. Please check the Redis' status."
 
     return True, ""
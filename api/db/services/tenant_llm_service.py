@@ -13,9 +13,13 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 #
+import atexit
+import copy
 import os
 import json
 import logging
+import threading
+from collections import defaultdict
 from peewee import IntegrityError
 from langfuse import Langfuse
 from common import settings
@@ -23,9 +27,14 @@ from common.constants import MINERU_DEFAULT_CONFIG, MINERU_ENV_KEYS, PADDLEOCR_D
 from api.db.db_models import DB, LLMFactories, TenantLLM
 from api.db.services.common_service import CommonService
 from api.db.services.langfuse_service import TenantLangfuseService
+from api.db.services.tenant_model_cache import TenantModelCache
 from api.db.services.user_service import TenantService
 from rag.llm import ChatModel, CvModel, EmbeddingModel, OcrModel, RerankModel, Seq2txtModel, TTSModel
 
+# 0 writes every increase_usage straight to the DB.
+TOKEN_USAGE_FLUSH_INTERVAL = float(os.environ.get("TOKEN_USAGE_FLUSH_INTERVAL", 5))
+TOKEN_USAGE_FLUSH_MAX_KEYS = int(os.environ.get("TOKEN_USAGE_FLUSH_MAX_KEYS", 512))
+
 
 class LLMFactoriesService(CommonService):
     model = LLMFactories
@@ -34,6 +43,78 @@ class LLMFactoriesService(CommonService):
 class TenantLLMService(CommonService):
     model = TenantLLM
 
+    # Every write to tenant_llm goes through one of the overrides below so the
+    # cached model configs and instances of the affected tenants are dropped.
+
+    @classmethod
+    def _invalidate(cls, tenant_ids):
+        for tenant_id in set(tenant_ids):
+            if tenant_id:
+                TenantModelCache.invalidate(tenant_id)
+
+    @classmethod
+    @DB.connection_context()
+    def _tenant_ids_where(cls, *filters):
+        return [r.tenant_id for r in cls.model.select(cls.model.tenant_id).where(*filters).distinct()]
+
+    @classmethod
+    def save(cls, **kwargs):
+        obj = super().save(**kwargs)
+        cls._invalidate([kwargs.get("tenant_id")])
+        return obj
+
+    @classmethod
+    def insert(cls, **kwargs):
+        obj = super().insert(**kwargs)
+        cls._invalidate([kwargs.get("tenant_id")])
+        return obj
+
+    @classmethod
+    def insert_many(cls, data_list, batch_size=100):
+        super().insert_many(data_list, batch_size)
+        cls._invalidate([d.get("tenant_id") for d in data_list])
+
+    @classmethod
+    def update_many_by_id(cls, data_list):
+        tenant_ids = cls._tenant_ids_where(cls.model.id.in_([d["id"] for d in data_list]))
+        super().update_many_by_id(data_list)
+        cls._invalidate(tenant_ids + [d.get("tenant_id") for d in data_list])
+
+    @classmethod
+    def update_by_id(cls, pid, data):
+        tenant_ids = cls._tenant_ids_where(cls.model.id == pid)
+        num = super().update_by_id(pid, data)
+        cls._invalidate(tenant_ids + [data.get("tenant_id")])
+        return num
+
+    @classmethod
+    def delete_by_id(cls, pid):
+        tenant_ids = cls._tenant_ids_where(cls.model.id == pid)
+        num = super().delete_by_id(pid)
+        cls._invalidate(tenant_ids)
+        return num
+
+    @classmethod
+    def delete_by_ids(cls, pids):
+        tenant_ids = cls._tenant_ids_where(cls.model.id.in_(pids))
+        num = super().delete_by_ids(pids)
+        cls._invalidate(tenant_ids)
+        return num
+
+    @classmethod
+    def filter_delete(cls, filters):
+        tenant_ids = cls._tenant_ids_where(*filters)
+        num = super().filter_delete(filters)
+        cls._invalidate(tenant_ids)
+        return num
+
+    @classmethod
+    def filter_update(cls, filters, update_data):
+        tenant_ids = cls._tenant_ids_where(*filters)
+        num = super().filter_update(filters, update_data)
+        cls._invalidate(tenant_ids + [update_data.get("tenant_id")])
+        return num
+
     @classmethod
     @DB.connection_context()
     def get_api_key(cls, tenant_id, model_name):
@@ -85,8 +166,13 @@ class TenantLLMService(CommonService):
         return model_name, None
 
     @classmethod
-    @DB.connection_context()
     def get_model_config(cls, tenant_id, llm_type, llm_name=None):
+        model_config = TenantModelCache.get_or_create("config", (tenant_id, str(llm_type), llm_name), lambda: cls._get_model_config(tenant_id, llm_type, llm_name))
+        return dict(model_config)
+
+    @classmethod
+    @DB.connection_context()
+    def _get_model_config(cls, tenant_id, llm_type, llm_name=None):
         from api.db.services.llm_service import LLMService
 
         e, tenant = TenantService.get_by_id(tenant_id)
@@ -132,8 +218,15 @@ class TenantLLMService(CommonService):
         return model_config
 
     @classmethod
-    @DB.connection_context()
     def model_instance(cls, tenant_id, llm_type, llm_name=None, lang="Chinese", **kwargs):
+        key = (tenant_id, str(llm_type), llm_name, lang, json.dumps(kwargs, sort_keys=True, default=str))
+        mdl = TenantModelCache.get_or_create("model", key, lambda: cls._model_instance(tenant_id, llm_type, llm_name, lang, **kwargs))
+        # Share the provider client and its connection pool, but not per-bundle state such as bound tools.
+        return copy.copy(mdl) if mdl is not None else None
+
+    @classmethod
+    @DB.connection_context()
+    def _model_instance(cls, tenant_id, llm_type, llm_name=None, lang="Chinese", **kwargs):
         model_config = TenantLLMService.get_model_config(tenant_id, llm_type, llm_name)
         kwargs.update({"provider": model_config["llm_factory"]})
         if llm_type == LLMType.EMBEDDING.value:
@@ -182,10 +275,9 @@ class TenantLLMService(CommonService):
         return None
 
     @classmethod
-    @DB.connection_context()
     def increase_usage(cls, tenant_id, llm_type, used_tokens, llm_name=None):
-        e, tenant = TenantService.get_by_id(tenant_id)
-        if not e:
+        tenant = TenantModelCache.get_or_create("tenant", (tenant_id,), lambda: TenantService.get_by_id(tenant_id)[1])
+        if not tenant:
             logging.error(f"Tenant not found: {tenant_id}")
             return 0
 
@@ -205,7 +297,14 @@ class TenantLLMService(CommonService):
             return 0
 
         llm_name, llm_factory = TenantLLMService.split_model_name_and_factory(mdlnm)
+        if TOKEN_USAGE_FLUSH_INTERVAL <= 0:
+            return cls._add_used_tokens(tenant_id, llm_name, llm_factory, used_tokens)
+        TokenUsageBuffer.add(tenant_id, llm_name, llm_factory, used_tokens)
+        return 1
 
+    @classmethod
+    @DB.connection_context()
+    def _add_used_tokens(cls, tenant_id, llm_name, llm_factory, used_tokens):
         try:
             num = (
                 cls.model.update(used_tokens=cls.model.used_tokens + used_tokens)
@@ -351,7 +450,9 @@ class TenantLLMService(CommonService):
     @classmethod
     @DB.connection_context()
     def delete_by_tenant_id(cls, tenant_id):
-        return cls.model.delete().where(cls.model.tenant_id == tenant_id).execute()
+        num = cls.model.delete().where(cls.model.tenant_id == tenant_id).execute()
+        TenantModelCache.invalidate(tenant_id)
+        return num
 
     @staticmethod
     def llm_id2llm_type(llm_id: str) -> str | None:
@@ -375,6 +476,97 @@ class TenantLLMService(CommonService):
         return None
 
 
+class TokenUsageBuffer:
+    """
+    In-process accumulator for TenantLLM.used_tokens.
+
+    `increase_usage` only adds the delta to a dict keyed by (tenant, model, factory).
+    A daemon thread flushes the sums every TOKEN_USAGE_FLUSH_INTERVAL seconds, or
+    earlier once TOKEN_USAGE_FLUSH_MAX_KEYS keys are pending, as one transaction of
+    `used_tokens = used_tokens + n` updates. The updates are relative, so any number
+    of API servers and task executors can flush concurrently and the totals stay exact.
+    A failed flush puts its deltas back for the next round. A process that dies without
+    reaching `flush()` (atexit calls it) loses at most one interval.
+    """
+
+    # Reentrant, so code run from a signal handler on the main thread can take it while the
+    # interrupted `add` holds it.
+    _lock = threading.RLock()
+    _pending: dict = defaultdict(int)
+    _wakeup = threading.Event()
+    _thread = None
+
+    @classmethod
+    def add(cls, tenant_id, llm_name, llm_factory, used_tokens):
+        if not used_tokens:
+            return
+        with cls._lock:
+            cls._pending[(tenant_id, llm_name, llm_factory)] += int(used_tokens)
+            if len(cls._pending) >= TOKEN_USAGE_FLUSH_MAX_KEYS:
+                cls._wakeup.set()
+            if cls._thread is None:
+                cls._thread = threading.Thread(target=cls._run, name="token_usage_flusher", daemon=True)
+                cls._thread.start()
+                atexit.register(cls.flush)
+
+    @classmethod
+    def _run(cls):
+        while True:
+            cls._wakeup.wait(TOKEN_USAGE_FLUSH_INTERVAL)
+            cls._wakeup.clear()
+            cls.flush()
+
+    @classmethod
+    def flush(cls):
+        with cls._lock:
+            pending, cls._pending = cls._pending, defaultdict(int)
+        if not pending:
+            return 0
+        try:
+            with DB.connection_context():
+                with DB.atomic():
+                    # Rows are locked in primary key order, so concurrent flushes from other processes cannot deadlock.
+                    for (tenant_id, llm_name, llm_factory), used_tokens in sorted(pending.items(), key=lambda kv: (kv[0][0], kv[0][2] or "", kv[0][1])):
+                        TenantLLM.update(used_tokens=TenantLLM.used_tokens + used_tokens).where(
+                            TenantLLM.tenant_id == tenant_id, TenantLLM.llm_name == llm_name, TenantLLM.llm_factory == llm_factory if llm_factory else True
+                        ).execute()
+        except BaseException as e:
+            # The transaction rolled back, so every delta goes back; that includes an
+            # interruption such as SystemExit, which the final flush at exit then writes.
+            with cls._lock:
+                for k, v in pending.items():
+                    cls._pending[k] += v
+            if not isinstance(e, Exception):
+                raise
+            logging.exception(f"TokenUsageBuffer.flush failed, keep {len(pending)} usage deltas for the next flush")
+            return 0
+        return len(pending)
+
+
+LANGFUSE_AUTH_FAILURE_TTL = int(os.environ.get("LANGFUSE_AUTH_FAILURE_TTL", 60))
+
+
+def _verified_langfuse(tenant_id):
+    """The tenant's Langfuse client if its keys pass `auth_check`, cached so bundles don't re-verify."""
+
+    def verify():
+        langfuse_keys = TenantLangfuseService.filter_by_tenant(tenant_id=tenant_id)
+        if not langfuse_keys:
+            return "no_keys"
+        langfuse = Langfuse(public_key=langfuse_keys.public_key, secret_key=langfuse_keys.secret_key, host=langfuse_keys.host)
+        try:
+            if langfuse.auth_check():
+                return langfuse
+        except Exception:
+            # Skip langfuse tracing if connection fails
+            pass
+        return "auth_failed"
+
+    # A failed check may be a transient outage, so it is retried sooner than a missing key is re-read.
+    langfuse = TenantModelCache.get_or_create("langfuse", (tenant_id,), verify, ttl=lambda v: LANGFUSE_AUTH_FAILURE_TTL if v == "auth_failed" else None)
+    return None if isinstance(langfuse, str) else langfuse
+
+
 class LLM4Tenant:
     def __init__(self, tenant_id, llm_type, llm_name=None, lang="Chinese", **kwargs):
         self.tenant_id = tenant_id
@@ -388,15 +580,7 @@ class LLM4Tenant:
         self.is_tools = model_config.get("is_tools", False)
         self.verbose_tool_use = kwargs.get("verbose_tool_use")
 
-        langfuse_keys = TenantLangfuseService.filter_by_tenant(tenant_id=tenant_id)
-        self.langfuse = None
-        if langfuse_keys:
-            langfuse = Langfuse(public_key=langfuse_keys.public_key, secret_key=langfuse_keys.secret_key, host=langfuse_keys.host)
-            try:
-                if langfuse.auth_check():
-                    self.langfuse = langfuse
-                    trace_id = self.langfuse.create_trace_id()
-                    self.trace_context = {"trace_id": trace_id}
-            except Exception:
-                # Skip langfuse tracing if connection fails
-                pass
+        self.langfuse = _verified_langfuse(tenant_id)
+        if self.langfuse:
+            trace_id = self.langfuse.create_trace_id()
+            self.trace_context = {"trace_id": trace_id}
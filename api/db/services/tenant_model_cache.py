@@ -0,0 +1,119 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import logging
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Callable
+
+from rag.utils.redis_conn import REDIS_CONN
+
+TENANT_MODEL_CACHE_TTL = int(os.environ.get("TENANT_MODEL_CACHE_TTL", 600))
+TENANT_MODEL_CACHE_SIZE = int(os.environ.get("TENANT_MODEL_CACHE_SIZE", 1024))
+# How long a process trusts its last read of a tenant's config version before asking Redis again.
+TENANT_MODEL_VERSION_CHECK_INTERVAL = float(os.environ.get("TENANT_MODEL_VERSION_CHECK_INTERVAL", 5))
+
+
+class TenantModelCache:
+    """
+    Process-level cache of resolved tenant model configs, model instances and Langfuse clients.
+
+    Entries are keyed by (kind, tenant_id, ...) and tagged with the tenant's config
+    version, a Redis counter bumped by `invalidate` whenever the tenant's LLM or
+    Langfuse settings change. A version mismatch or an expired TTL rebuilds the entry,
+    so every API server and task executor picks up a settings change within
+    TENANT_MODEL_VERSION_CHECK_INTERVAL seconds.
+    """
+
+    _lock = threading.Lock()
+    _entries: OrderedDict = OrderedDict()
+    _versions: dict = {}
+    _stats: Counter = Counter()
+
+    @staticmethod
+    def _version_key(tenant_id) -> str:
+        return f"tenant_llm_version:{tenant_id}"
+
+    @classmethod
+    def _version(cls, tenant_id) -> str:
+        now = time.monotonic()
+        with cls._lock:
+            known = cls._versions.get(tenant_id)
+        if known and now - known[1] < TENANT_MODEL_VERSION_CHECK_INTERVAL:
+            return known[0]
+        version = REDIS_CONN.get(cls._version_key(tenant_id))
+        version = version.decode() if isinstance(version, bytes) else str(version or 0)
+        with cls._lock:
+            cls._versions[tenant_id] = (version, now)
+        return version
+
+    @classmethod
+    def get_or_create(cls, kind: str, key: tuple, factory: Callable, ttl: int | Callable | None = None):
+        """
+        Return the cached value of (kind, *key), building it with `factory()` on a miss.
+        None is never cached. `ttl` may be a callable taking the built value.
+        """
+        tenant_id = key[0]
+        version = cls._version(tenant_id)
+        cache_key = (kind, *key)
+        now = time.monotonic()
+        with cls._lock:
+            entry = cls._entries.get(cache_key)
+            if entry and entry[1] == version and entry[2] > now:
+                cls._entries.move_to_end(cache_key)
+                cls._stats[f"{kind}_hit"] += 1
+                return entry[0]
+            cls._stats[f"{kind}_miss"] += 1
+
+        value = factory()
+        if value is None:
+            return None
+        if callable(ttl):
+            ttl = ttl(value)
+        with cls._lock:
+            cls._entries[cache_key] = (value, version, now + (TENANT_MODEL_CACHE_TTL if ttl is None else ttl))
+            cls._entries.move_to_end(cache_key)
+            while len(cls._entries) > TENANT_MODEL_CACHE_SIZE:
+                cls._entries.popitem(last=False)
+                cls._stats["evicted"] += 1
+        return value
+
+    @classmethod
+    def invalidate(cls, tenant_id):
+        """Drop everything cached for the tenant here and make other processes drop theirs."""
+        try:
+            REDIS_CONN.incrby(cls._version_key(tenant_id), 1)
+        except Exception as e:
+            logging.warning(f"TenantModelCache.invalidate({tenant_id}) could not bump the config version: {e}")
+        with cls._lock:
+            cls._versions.pop(tenant_id, None)
+            for k in [k for k in cls._entries if k[1] == tenant_id]:
+                del cls._entries[k]
+            cls._stats["invalidated"] += 1
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._entries.clear()
+            cls._versions.clear()
+
+    @classmethod
+    def stats(cls) -> dict:
+        with cls._lock:
+            stats = dict(cls._stats)
+            stats["size"] = len(cls._entries)
+        return stats
@@ -69,6 +69,7 @@ def update_progress():
 def signal_handler(sig, frame):
     logging.info("Received interrupt signal, shutting down...")
     shutdown_all_mcp_sessions()
+    # Buffered token usage is flushed at exit (atexit), outside signal context.
     stop_event.set()
     stop_event.wait(1)
     sys.exit(0)
@@ -17,6 +17,7 @@
 
 # Standard library imports
 import base64
+import logging
 import re
 import shutil
 import subprocess
@@ -27,6 +28,7 @@ from io import BytesIO
 
 import pdfplumber
 from PIL import Image
+from pypdf import PdfReader
 
 # Local imports
 from api.constants import IMG_BASE64_PREFIX
@@ -144,6 +146,30 @@ def read_potential_broken_pdf(blob):
     return blob
 
 
+def page_count(filename, blob, parser_id=None):
+    """
+    Pages of a PDF, or rows of a spreadsheet/csv/txt parsed with the table parser: the
+    unit `queue_tasks` splits on. Returns None for other files, other parsers of tabular
+    files (nothing splits them by rows), or when the count fails.
+    """
+    filename = filename.lower()
+    try:
+        if re.match(r".*\.pdf$", filename):
+            try:
+                return len(PdfReader(BytesIO(blob)).pages)
+            except Exception:
+                with sys.modules[LOCK_KEY_pdfplumber]:
+                    with pdfplumber.open(BytesIO(blob)) as pdf:
+                        return len(pdf.pages)
+        if parser_id == "table" and re.match(r".*\.(xls|xlsx|xlsm|csv|txt)$", filename):
+            from deepdoc.parser.excel_parser import RAGFlowExcelParser
+
+            return RAGFlowExcelParser.row_number(filename, blob)
+    except Exception as e:
+        logging.warning(f"page_count({filename}) failed: {e}")
+    return None
+
+
 def sanitize_path(raw_path: str | None) -> str:
     """Normalize and sanitize a user-provided path segment.
 
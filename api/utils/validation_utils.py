@@ -334,6 +334,7 @@ class RaptorConfig(Base):
     max_cluster: Annotated[int, Field(default=64, ge=1, le=1024)]
     random_seed: Annotated[int, Field(default=0, ge=0)]
     auto_disable_for_structured_data: Annotated[bool, Field(default=True)]
+    incremental: Annotated[bool, Field(default=False)]
 
 
 class GraphragConfig(Base):
@@ -12,9 +12,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import asyncio
+import importlib.util
 import logging
 import os
+import threading
 import time
+import urllib.request
+import weakref
+from http.cookiejar import CookieJar, DefaultCookiePolicy
 from typing import Any, Dict, Optional
 from urllib.parse import urlparse, urlunparse
 
@@ -35,6 +40,18 @@ DEFAULT_BACKOFF_FACTOR = float(os.environ.get("HTTP_CLIENT_BACKOFF_FACTOR", "0.5
 DEFAULT_PROXY = os.environ.get("HTTP_CLIENT_PROXY")
 DEFAULT_USER_AGENT = os.environ.get("HTTP_CLIENT_USER_AGENT", "ragflow-http-client")
 
+# Shared connection pools (see get_pooled_client). One pool per origin (scheme://host:port) serves
+# the whole process, every tenant and model included, so the connection cap is the OpenAI SDK's own
+# default rather than a per-client one. A request finding the pool full waits at most
+# HTTP_POOL_ACQUIRE_TIMEOUT seconds for a connection and then fails with httpx.PoolTimeout,
+# whatever timeout the caller asked for.
+HTTP_POOL_TIMEOUT = float(os.environ.get("HTTP_POOL_TIMEOUT", "600"))
+HTTP_POOL_MAX_CONNECTIONS_PER_HOST = int(os.environ.get("HTTP_POOL_MAX_CONNECTIONS_PER_HOST", "1000"))
+HTTP_POOL_MAX_KEEPALIVE_PER_HOST = int(os.environ.get("HTTP_POOL_MAX_KEEPALIVE_PER_HOST", "100"))
+HTTP_POOL_ACQUIRE_TIMEOUT = float(os.environ.get("HTTP_POOL_ACQUIRE_TIMEOUT", "10"))
+HTTP_POOL_KEEPALIVE_EXPIRY = float(os.environ.get("HTTP_POOL_KEEPALIVE_EXPIRY", "30"))
+HTTP_POOL_HTTP2 = bool(int(os.environ.get("HTTP_POOL_HTTP2", "0")))
+
 
 def _clean_headers(
     headers: Optional[Dict[str, str]], auth_token: Optional[str] = None
@@ -244,9 +261,324 @@ def sync_request(
         raise last_exc  # pragma: no cover
 
 
+class _NoCookies(CookieJar):
+    """Cookie jar that never stores anything, so a shared client cannot leak one tenant's session to another."""
+
+    def __init__(self):
+        super().__init__(policy=DefaultCookiePolicy(allowed_domains=[]))
+
+
+class _PoolMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.pool_timeouts = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.seconds = 0.0
+
+    def start(self) -> float:
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        return time.monotonic()
+
+    def finish(self, started: float, failed: bool, pool_timeout: bool = False):
+        with self._lock:
+            self.in_flight -= 1
+            self.seconds += time.monotonic() - started
+            if failed:
+                self.errors += 1
+            if pool_timeout:
+                self.pool_timeouts += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "pool_timeouts": self.pool_timeouts,
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "avg_seconds": self.seconds / self.requests if self.requests else 0.0,
+            }
+
+
+def _cap_pool_wait(request: httpx.Request):
+    # SDKs send their own per-request timeout (600s for OpenAI), which would also bound the
+    # wait for a free connection; cap that part so a full pool fails fast instead.
+    timeout = dict(request.extensions.get("timeout") or {})
+    pool = timeout.get("pool")
+    if pool is None or pool > HTTP_POOL_ACQUIRE_TIMEOUT:
+        timeout["pool"] = HTTP_POOL_ACQUIRE_TIMEOUT
+        request.extensions["timeout"] = timeout
+
+
+class _MeteredTransport(httpx.BaseTransport):
+    def __init__(self, transport: httpx.BaseTransport, metrics: _PoolMetrics):
+        self._transport = transport
+        self._metrics = metrics
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        _cap_pool_wait(request)
+        started = self._metrics.start()
+        failed, pool_timeout = True, False
+        try:
+            response = self._transport.handle_request(request)
+            failed = response.status_code >= 500
+            return response
+        except httpx.PoolTimeout:
+            pool_timeout = True
+            raise
+        finally:
+            self._metrics.finish(started, failed, pool_timeout)
+
+    def close(self):
+        self._transport.close()
+
+
+class _LoopLocalTransport(httpx.AsyncBaseTransport):
+    """
+    Async transport holding one connection pool per event loop.
+
+    httpx async pools are bound to the loop that opened their connections, while
+    provider instances are built outside any loop and reused from several (the API
+    server loop, asyncio.run in worker threads). Pools are created lazily for the
+    running loop and dropped together with it.
+    """
+
+    def __init__(self, factory, metrics: _PoolMetrics):
+        self._factory = factory
+        self._metrics = metrics
+        self._transports = weakref.WeakKeyDictionary()
+
+    def _transport(self) -> httpx.AsyncBaseTransport:
+        loop = asyncio.get_running_loop()
+        transport = self._transports.get(loop)
+        if transport is None:
+            transport = self._transports[loop] = self._factory()
+        return transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        transport = self._transport()
+        _cap_pool_wait(request)
+        started = self._metrics.start()
+        failed, pool_timeout = True, False
+        try:
+            response = await transport.handle_async_request(request)
+            failed = response.status_code >= 500
+            return response
+        except httpx.PoolTimeout:
+            pool_timeout = True
+            raise
+        finally:
+            self._metrics.finish(started, failed, pool_timeout)
+
+    async def aclose(self):
+        transport = self._transports.pop(asyncio.get_running_loop(), None)
+        if transport is not None:
+            await transport.aclose()
+
+
+class _SharedClient(httpx.Client):
+    # Provider SDKs may close the client they were handed; shared pools are only closed by close_pools().
+    def close(self):
+        pass
+
+
+class _SharedAsyncClient(httpx.AsyncClient):
+    async def aclose(self):
+        pass
+
+
+_pool_lock = threading.Lock()
+_sync_clients: Dict[str, httpx.Client] = {}
+_async_clients: Dict[str, httpx.AsyncClient] = {}
+_pool_metrics: Dict[str, _PoolMetrics] = {}
+_http2_checked: Optional[bool] = None
+
+
+def _http2_enabled() -> bool:
+    global _http2_checked
+    if _http2_checked is None:
+        _http2_checked = HTTP_POOL_HTTP2 and importlib.util.find_spec("h2") is not None
+        if HTTP_POOL_HTTP2 and not _http2_checked:
+            logger.warning("HTTP_POOL_HTTP2 is set but the h2 package is not installed; shared pools use HTTP/1.1")
+    return _http2_checked
+
+
+def _origin(url: Optional[str]) -> str:
+    parsed = urlparse(url or "")
+    if not parsed.scheme or not parsed.hostname:
+        return "default"
+    port = parsed.port or (443 if parsed.scheme == "https" else 80)
+    return f"{parsed.scheme.lower()}://{parsed.hostname.lower()}:{port}"
+
+
+def _origin_proxy(origin: str) -> Any:
+    if DEFAULT_PROXY:
+        return DEFAULT_PROXY
+    # A custom transport disables httpx's own environment proxy lookup, so honour HTTP(S)_PROXY/NO_PROXY here.
+    proxies = urllib.request.getproxies()
+    if origin == "default":
+        return proxies.get("https") or proxies.get("all")
+    parsed = urlparse(origin)
+    if urllib.request.proxy_bypass(parsed.hostname):
+        return None
+    return proxies.get(parsed.scheme) or proxies.get("all")
+
+
+def _pool_kwargs(origin: str) -> Dict[str, Any]:
+    return {
+        "limits": httpx.Limits(
+            max_connections=HTTP_POOL_MAX_CONNECTIONS_PER_HOST,
+            max_keepalive_connections=HTTP_POOL_MAX_KEEPALIVE_PER_HOST,
+            keepalive_expiry=HTTP_POOL_KEEPALIVE_EXPIRY,
+        ),
+        "http2": _http2_enabled(),
+        "proxy": _origin_proxy(origin),
+    }
+
+
+def get_pooled_client(url: Optional[str] = None) -> httpx.Client:
+    """
+    Process-wide httpx.Client for the origin of `url`, with keep-alive and a per-host connection limit.
+
+    The client carries no credentials, default headers or cookies, so it is safe to share
+    between tenants: pass it as `http_client=` to OpenAI-compatible SDKs, or use pooled_request.
+    """
+    origin = _origin(url)
+    with _pool_lock:
+        client = _sync_clients.get(origin)
+        if client is None:
+            metrics = _pool_metrics.setdefault(origin, _PoolMetrics())
+            transport = _MeteredTransport(httpx.HTTPTransport(**_pool_kwargs(origin)), metrics)
+            client = _sync_clients[origin] = _SharedClient(
+                transport=transport,
+                timeout=HTTP_POOL_TIMEOUT,
+                follow_redirects=DEFAULT_FOLLOW_REDIRECTS,
+                max_redirects=DEFAULT_MAX_REDIRECTS,
+                cookies=_NoCookies(),
+            )
+        return client
+
+
+def get_pooled_async_client(url: Optional[str] = None) -> httpx.AsyncClient:
+    """Async counterpart of get_pooled_client; safe to use from any event loop."""
+    origin = _origin(url)
+    with _pool_lock:
+        client = _async_clients.get(origin)
+        if client is None:
+            metrics = _pool_metrics.setdefault(origin, _PoolMetrics())
+            kwargs = _pool_kwargs(origin)
+            transport = _LoopLocalTransport(lambda: httpx.AsyncHTTPTransport(**kwargs), metrics)
+            client = _async_clients[origin] = _SharedAsyncClient(
+                transport=transport,
+                timeout=HTTP_POOL_TIMEOUT,
+                follow_redirects=DEFAULT_FOLLOW_REDIRECTS,
+                max_redirects=DEFAULT_MAX_REDIRECTS,
+                cookies=_NoCookies(),
+            )
+        return client
+
+
+_RETRYABLE_POOL_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+
+
+def pooled_request(
+    method: str,
+    url: str,
+    *,
+    timeout: float | httpx.Timeout | None = None,
+    headers: Optional[Dict[str, str]] = None,
+    retries: Optional[int] = None,
+    backoff_factor: Optional[float] = None,
+    **kwargs: Any,
+) -> httpx.Response:
+    """
+    Like sync_request, but over the shared keep-alive pool of the url's origin.
+    Only connection failures are retried, since the request never reached the server.
+    """
+    client = get_pooled_client(url)
+    retries = DEFAULT_MAX_RETRIES if retries is None else max(retries, 0)
+    backoff_factor = DEFAULT_BACKOFF_FACTOR if backoff_factor is None else backoff_factor
+    timeout = httpx.USE_CLIENT_DEFAULT if timeout is None else timeout
+    headers = _clean_headers(headers)
+    for attempt in range(retries + 1):
+        try:
+            return client.request(method, url, headers=headers, timeout=timeout, **kwargs)
+        except _RETRYABLE_POOL_ERRORS as exc:
+            if attempt >= retries:
+                raise
+            delay = _get_delay(backoff_factor, attempt)
+            logger.warning(f"pooled_request attempt {attempt + 1}/{retries + 1} failed for {method} {_redact_sensitive_url_params(url)}: {exc}; retrying in {delay:.2f}s")
+            time.sleep(delay)
+
+
+async def async_pooled_request(
+    method: str,
+    url: str,
+    *,
+    timeout: float | httpx.Timeout | None = None,
+    headers: Optional[Dict[str, str]] = None,
+    retries: Optional[int] = None,
+    backoff_factor: Optional[float] = None,
+    **kwargs: Any,
+) -> httpx.Response:
+    """Async counterpart of pooled_request."""
+    client = get_pooled_async_client(url)
+    retries = DEFAULT_MAX_RETRIES if retries is None else max(retries, 0)
+    backoff_factor = DEFAULT_BACKOFF_FACTOR if backoff_factor is None else backoff_factor
+    timeout = httpx.USE_CLIENT_DEFAULT if timeout is None else timeout
+    headers = _clean_headers(headers)
+    for attempt in range(retries + 1):
+        try:
+            return await client.request(method, url, headers=headers, timeout=timeout, **kwargs)
+        except _RETRYABLE_POOL_ERRORS as exc:
+            if attempt >= retries:
+                raise
+            delay = _get_delay(backoff_factor, attempt)
+            logger.warning(f"async_pooled_request attempt {attempt + 1}/{retries + 1} failed for {method} {_redact_sensitive_url_params(url)}: {exc}; retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+
+def pool_stats() -> Dict[str, dict]:
+    """Per-origin request counters of the shared pools, for logging and health endpoints."""
+    with _pool_lock:
+        items = list(_pool_metrics.items())
+    return {origin: {**m.snapshot(), "http2": bool(_http2_checked)} for origin, m in items}
+
+
+async def aclose_loop_pools():
+    """Close the running loop's connections in every shared async pool, e.g. before asyncio.run returns."""
+    with _pool_lock:
+        clients = list(_async_clients.values())
+    for client in clients:
+        await client._transport.aclose()
+
+
+def close_pools():
+    """Close the shared sync pools. Async pools are released by aclose_loop_pools or with their event loop."""
+    with _pool_lock:
+        clients = list(_sync_clients.values())
+        _sync_clients.clear()
+        _async_clients.clear()
+    for client in clients:
+        httpx.Client.close(client)
+
+
 __all__ = [
     "async_request",
     "sync_request",
+    "get_pooled_client",
+    "get_pooled_async_client",
+    "pooled_request",
+    "async_pooled_request",
+    "pool_stats",
+    "aclose_loop_pools",
+    "close_pools",
     "DEFAULT_TIMEOUT",
     "DEFAULT_FOLLOW_REDIRECTS",
     "DEFAULT_MAX_REDIRECTS",
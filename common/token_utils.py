@@ -16,6 +16,9 @@
 
 
 import os
+import threading
+from collections import Counter, OrderedDict
+
 import tiktoken
 
 from common.file_utils import get_project_base_directory
@@ -25,14 +28,111 @@ os.environ["TIKTOKEN_CACHE_DIR"] = tiktoken_cache_dir
 # encoder = tiktoken.encoding_for_model("gpt-3.5-turbo")
 encoder = tiktoken.get_encoding("cl100k_base")
 
+TOKEN_COUNT_CACHE_SIZE = int(os.environ.get("TOKEN_COUNT_CACHE_SIZE", 65536))
+# Shorter texts are encoded directly, a cache lookup saves little on them.
+TOKEN_COUNT_CACHE_MIN_LEN = int(os.environ.get("TOKEN_COUNT_CACHE_MIN_LEN", 64))
+# encode_batch starts a thread pool per call; it only pays off for larger batches on several cores.
+TOKEN_COUNT_BATCH_THREADS = min(8, os.cpu_count() or 1)
+TOKEN_COUNT_BATCH_MIN = 16
+
+# LRU of token counts keyed by (hash, length) of the text, so cached texts are not kept alive.
+_token_counts: OrderedDict = OrderedDict()
+_token_counts_lock = threading.Lock()
+_token_counts_stats: Counter = Counter()
+
+
+def _count(string) -> int:
+    try:
+        return len(encoder.encode(string))
+    except Exception:
+        return 0
+
+
+def _cache_key(string):
+    if not isinstance(string, str) or len(string) < TOKEN_COUNT_CACHE_MIN_LEN or TOKEN_COUNT_CACHE_SIZE <= 0:
+        return None
+    return hash(string), len(string)
+
+
+def _cache_put(items):
+    with _token_counts_lock:
+        for key, n in items:
+            _token_counts[key] = n
+            _token_counts.move_to_end(key)
+        while len(_token_counts) > TOKEN_COUNT_CACHE_SIZE:
+            _token_counts.popitem(last=False)
+
 
 def num_tokens_from_string(string: str) -> int:
     """Returns the number of tokens in a text string."""
+    key = _cache_key(string)
+    if key is None:
+        return _count(string)
+    with _token_counts_lock:
+        n = _token_counts.get(key)
+        if n is not None:
+            _token_counts.move_to_end(key)
+            _token_counts_stats["hit"] += 1
+            return n
+        _token_counts_stats["miss"] += 1
+    n = _count(string)
+    _cache_put([(key, n)])
+    return n
+
+
+def num_tokens_from_strings(strings: list[str]) -> list[int]:
+    """`num_tokens_from_string` of every text; the ones not cached are encoded in one `encode_batch`."""
+    counts = [0] * len(strings)
+    todo = []
+    with _token_counts_lock:
+        for i, string in enumerate(strings):
+            key = _cache_key(string)
+            n = _token_counts.get(key) if key is not None else None
+            if n is None:
+                todo.append((i, key))
+                continue
+            _token_counts.move_to_end(key)
+            _token_counts_stats["hit"] += 1
+            counts[i] = n
+        _token_counts_stats["miss"] += sum(1 for _, key in todo if key is not None)
+    if not todo:
+        return counts
+
+    texts = [strings[i] if isinstance(strings[i], str) else "" for i, _ in todo]
     try:
-        code_list = encoder.encode(string)
-        return len(code_list)
+        if TOKEN_COUNT_BATCH_THREADS > 1 and len(texts) >= TOKEN_COUNT_BATCH_MIN:
+            lens = [len(codes) for codes in encoder.encode_batch(texts, num_threads=TOKEN_COUNT_BATCH_THREADS)]
+        else:
+            lens = [len(encoder.encode(t)) for t in texts]
     except Exception:
-        return 0
+        # One text the encoder refuses must not fail the others.
+        lens = [_count(strings[i]) for i, _ in todo]
+    for (i, _), n in zip(todo, lens):
+        counts[i] = n
+    _cache_put([(key, n) for (_, key), n in zip(todo, lens) if key is not None])
+    return counts
+
+
+def token_upper_bound(string: str) -> int:
+    """Cheap upper bound of `num_tokens_from_string`: every token covers at least one UTF-8 byte."""
+    if string.isascii():
+        return len(string)
+    return len(string.encode("utf-8", "surrogatepass"))
+
+
+def within_token_budget(string: str, budget: int) -> bool:
+    """Whether the text has at most `budget` tokens, without encoding texts that are clearly short enough."""
+    if token_upper_bound(string) <= budget:
+        return True
+    return num_tokens_from_string(string) <= budget
+
+
+def token_count_cache_stats() -> dict:
+    with _token_counts_lock:
+        stats = dict(_token_counts_stats)
+        stats["size"] = len(_token_counts)
+    return stats
+
 
 def total_token_count_from_response(resp):
     """
@@ -84,4 +184,80 @@ def total_token_count_from_response(resp):
 
 def truncate(string: str, max_len: int) -> str:
     """Returns truncated text if the length of text exceed max_len."""
-    return encoder.decode(encoder.encode(string)[:max_len])
+    if max_len >= 0 and token_upper_bound(string) <= max_len:
+        return string
+    tokens = encoder.encode(string)
+    if len(tokens) <= max_len:
+        return string
+    return encoder.decode(tokens[:max_len])
+
+
+if __name__ == "__main__":
+    import argparse
+    import glob
+    import re
+    import time
+
+    parser = argparse.ArgumentParser(description="Token counting with and without the count cache on chunking workloads.")
+    parser.add_argument("--docs", default=os.path.join(get_project_base_directory(), "docs", "**", "*.md"), help="Glob of text files to chunk")
+    parser.add_argument("--chunk-tokens", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=20, help="Retrievals replaying the chunks through prompt budgeting")
+    args = parser.parse_args()
+
+    sections = []
+    for fnm in glob.glob(args.docs, recursive=True):
+        with open(fnm, encoding="utf-8", errors="ignore") as f:
+            sections.extend(s for s in re.split(r"\n\s*\n", f.read()) if s.strip())
+    print(f"{len(sections)} sections")
+
+    def exact(string):
+        try:
+            return len(encoder.encode(string))
+        except Exception:
+            return 0
+
+    def merge(count):
+        # naive_merge: every section is counted once, chunks close at chunk-tokens.
+        chunks, parts, n = [], [], 0
+        for sec in sections:
+            t = count(sec)
+            if parts and n + t > args.chunk_tokens:
+                chunks.append("\n".join(parts))
+                parts, n = [], 0
+            parts.append(sec)
+            n += t
+        if parts:
+            chunks.append("\n".join(parts))
+        return chunks
+
+    def timed(fn):
+        st = time.perf_counter()
+        res = fn()
+        return res, time.perf_counter() - st
+
+    chunks, t_old = timed(lambda: merge(exact))
+    chunks_new, t_new = timed(lambda: merge(num_tokens_from_string))
+    assert chunks == chunks_new
+    print(f"{'merge':>8} exact {t_old:8.3f}s  cached {t_new:8.3f}s")
+
+    old, t_old = timed(lambda: [exact(c) > 8191 for c in chunks])
+    new, t_new = timed(lambda: [not within_token_budget(c, 8191) for c in chunks])
+    assert old == new
+    print(f"{'embed':>8} exact {t_old:8.3f}s  bound  {t_new:8.3f}s")
+
+    old, t_old = timed(lambda: [[exact(c) for c in chunks] for _ in range(args.queries)])
+    new, t_new = timed(lambda: [[num_tokens_from_string(c) for c in chunks] for _ in range(args.queries)])
+    assert old == new
+    print(f"{'prompt':>8} exact {t_old:8.3f}s  cached {t_new:8.3f}s")
+
+    _token_counts.clear()
+    old, t_old = timed(lambda: [exact(c) for c in chunks])
+    new, t_new = timed(lambda: num_tokens_from_strings(chunks))
+    assert old == new
+    print(f"{'batch':>8} exact {t_old:8.3f}s  batch  {t_new:8.3f}s")
+
+    old, t_old = timed(lambda: [encoder.decode(encoder.encode(c)[:args.chunk_tokens * 2]) for c in chunks])
+    new, t_new = timed(lambda: [truncate(c, args.chunk_tokens * 2) for c in chunks])
+    assert old == new
+    print(f"{'truncate':>8} before {t_old:7.3f}s  now    {t_new:8.3f}s")
+    print(token_count_cache_stats())
@@ -21,7 +21,7 @@ import random
 from timeit import default_timer as timer
 from agent.canvas import Graph
 from api.db.services.document_service import DocumentService
-from api.db.services.task_service import has_canceled, TaskService, CANVAS_DEBUG_DOC_ID
+from api.db.services.task_service import has_canceled, TaskProgressBuffer, CANVAS_DEBUG_DOC_ID
 from rag.utils.redis_conn import REDIS_CONN
 
 
@@ -92,7 +92,7 @@ class Pipeline(Graph):
                     msg += f"\n-------------------------------------\n[{self.get_component_name(o['component_id'])}]:\n"
                 t = obj[-1]["trace"][-1]
                 msg += "%s: %s\n" % (t["datetime"], t["message"])
-                TaskService.update_progress(self.task_id, {"progress": finished, "progress_msg": msg})
+                TaskProgressBuffer.add(self.task_id, {"progress": finished, "progress_msg": msg})
             elif component_name == "END" and not self._doc_id:
                 obj[-1]["trace"][-1]["dsl"] = json.loads(str(self))
             REDIS_CONN.set_obj(log_key, obj, 60 * 30)
@@ -130,7 +130,7 @@ class Pipeline(Graph):
                 self.callback(cpn_obj.component_name, -1, self.error)
 
         if self._doc_id:
-            TaskService.update_progress(self.task_id, {
+            TaskProgressBuffer.add(self.task_id, {
                 "progress": random.randint(0, 5) / 100.0,
                 "progress_msg": "Start the pipeline...",
                 "begin_at": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")})
@@ -168,7 +168,7 @@ class Pipeline(Graph):
         if not self.error:
             return self.get_component_obj(self.path[-1]).output()
 
-        TaskService.update_progress(self.task_id, {
+        TaskProgressBuffer.add(self.task_id, {
             "progress": -1,
             "progress_msg": f"[ERROR]: {self.error}"})
 
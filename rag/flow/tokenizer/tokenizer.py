@@ -22,12 +22,10 @@ from common.constants import LLMType
 from api.db.services.knowledgebase_service import KnowledgebaseService
 from api.db.services.llm_service import LLMBundle
 from api.db.services.user_service import TenantService
-from common.connection_utils import timeout
 from rag.flow.base import ProcessBase, ProcessParamBase
 from rag.flow.tokenizer.schema import TokenizerFromUpstream
 from rag.nlp import rag_tokenizer
-from common import settings
-from rag.svr.task_executor import embed_limiter
+from rag.svr.task_executor import broker_encode, embedding_broker
 from common.token_utils import truncate
 
 from common.misc_utils import thread_pool_exec
@@ -76,22 +74,11 @@ class Tokenizer(ProcessBase):
         token_count += c
         tts = np.concatenate([vts[0] for _ in range(len(texts))], axis=0)
 
-        @timeout(60)
-        def batch_encode(txts):
-            nonlocal embedding_model
-            return embedding_model.encode([truncate(c, embedding_model.max_length - 10) for c in txts])
-
-        cnts_ = np.array([])
-        for i in range(0, len(texts), settings.EMBEDDING_BATCH_SIZE):
-            async with embed_limiter:
-                vts, c = await thread_pool_exec(batch_encode,texts[i : i + settings.EMBEDDING_BATCH_SIZE],)
-            if len(cnts_) == 0:
-                cnts_ = vts
-            else:
-                cnts_ = np.concatenate((cnts_, vts), axis=0)
-            token_count += c
-            if i % 33 == 32:
-                self.callback(i * 1.0 / len(texts) / parts / settings.EMBEDDING_BATCH_SIZE + 0.5 * (parts - 1))
+        texts = await thread_pool_exec(lambda: [truncate(t, embedding_model.max_length - 10) for t in texts])
+        vts, c = await broker_encode(embedding_broker(), embedding_model, texts,
+                                     on_progress=lambda frac: self.callback(frac / parts + 0.5 * (parts - 1)))
+        cnts_ = np.concatenate(vts, axis=0) if vts else np.array([])
+        token_count += c
 
         cnts = cnts_
         title_w = float(self._param.filename_embd_weight)
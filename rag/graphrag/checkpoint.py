@@ -0,0 +1,139 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import asyncio
+import json
+import logging
+import os
+from collections import defaultdict
+
+import xxhash
+
+from common.misc_utils import thread_pool_exec
+from rag.utils.redis_conn import REDIS_CONN
+
+GRAPHRAG_CHECKPOINT_TTL = int(os.environ.get("GRAPHRAG_CHECKPOINT_TTL", 3 * 24 * 3600))
+
+
+class ExtractionCheckpoint:
+    """
+    Per-chunk entity/relation extraction results of one document, kept in a Redis hash.
+
+    Each finished chunk is written as one hash field keyed by the chunk content hash,
+    so an interrupted task resumes from the chunks it already extracted. The key also
+    covers the extractor, the LLM and the entity types, so a configuration change
+    never reuses stale results.
+    """
+
+    def __init__(self, doc_id: str, extractor_name: str, llm_name: str, entity_types: list[str]):
+        hasher = xxhash.xxh64()
+        for v in [extractor_name, llm_name, *sorted(entity_types)]:
+            hasher.update(str(v).encode("utf-8"))
+        self._key = f"graphrag_extract:{doc_id}:{hasher.hexdigest()}"
+        self._done = None
+
+    @staticmethod
+    def chunk_key(content: str) -> str:
+        return xxhash.xxh64(content.encode("utf-8")).hexdigest()
+
+    def load(self) -> dict:
+        if self._done is None:
+            self._done = REDIS_CONN.hgetall(self._key) or {}
+        return self._done
+
+    def get(self, content: str):
+        raw = self.load().get(self.chunk_key(content))
+        if not raw:
+            return None
+        try:
+            nodes, edges, token_count = json.loads(raw)
+            return dict(nodes), {tuple(k): v for k, v in edges}, token_count
+        except Exception:
+            logging.warning(f"Ignore corrupted extraction checkpoint in {self._key}")
+            return None
+
+    def save(self, content: str, result: tuple):
+        nodes, edges, token_count = result
+        payload = json.dumps([list(nodes.items()), [[list(k), v] for k, v in edges.items()], token_count], ensure_ascii=False, separators=(",", ":"))
+        REDIS_CONN.hset(self._key, self.chunk_key(content), payload, GRAPHRAG_CHECKPOINT_TTL)
+
+    def clear(self):
+        REDIS_CONN.delete(self._key)
+        self._done = None
+
+
+class ExtractionResults:
+    """
+    Streaming sink for per-chunk extraction results.
+
+    Results are merged into the running node/edge maps as soon as a chunk finishes
+    instead of being kept per chunk until the whole document is done.
+    """
+
+    def __init__(self):
+        self.nodes = defaultdict(list)
+        self.edges = defaultdict(list)
+        self.token_count = 0
+        self.skipped = 0
+        self.extracted = 0
+        self._count = 0
+        self._writes = set()
+
+    def __len__(self):
+        return self._count
+
+    def merge(self, result: tuple, from_checkpoint: bool = False):
+        m_nodes, m_edges, token_count = result
+        for k, v in m_nodes.items():
+            self.nodes[k].extend(v)
+        for k, v in m_edges.items():
+            self.edges[tuple(sorted(k))].extend(v)
+        self.token_count += token_count
+        self._count += 1
+        if from_checkpoint:
+            self.skipped += 1
+        else:
+            self.extracted += 1
+
+    def for_chunk(self, content: str, checkpoint: ExtractionCheckpoint | None):
+        return _ChunkSink(self, content, checkpoint)
+
+    def save_in_background(self, checkpoint: ExtractionCheckpoint, content: str, result: tuple):
+        """Write a chunk's checkpoint on the thread pool; the Redis round-trip must not block the event loop."""
+        task = asyncio.get_running_loop().create_task(thread_pool_exec(checkpoint.save, content, result))
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    async def flush(self):
+        """Wait for the checkpoint writes still in flight."""
+        if self._writes:
+            await asyncio.gather(*self._writes, return_exceptions=True)
+
+
+class _ChunkSink:
+    """`out_results` handed to `_process_single_content`: checkpoints, then merges."""
+
+    def __init__(self, results: ExtractionResults, content: str, checkpoint: ExtractionCheckpoint | None):
+        self._results = results
+        self._content = content
+        self._checkpoint = checkpoint
+
+    def __len__(self):
+        return len(self._results)
+
+    def append(self, result: tuple):
+        if self._checkpoint:
+            self._results.save_in_background(self._checkpoint, self._content, result)
+        self._results.merge(result)
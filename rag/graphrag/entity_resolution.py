@@ -23,6 +23,7 @@ from typing import Any, Callable
 
 import networkx as nx
 
+from rag.graphrag.general.csr_graph import CSRGraph
 from rag.graphrag.general.extractor import Extractor
 from rag.nlp import is_english
 import editdistance
@@ -179,7 +180,7 @@ class EntityResolution(Extractor):
             raise
 
         # Update pagerank
-        pr = nx.pagerank(graph)
+        pr = CSRGraph.from_networkx(graph).pagerank()
         for node_name, pagerank in pr.items():
             graph.nodes[node_name]["pagerank"] = pagerank
 
@@ -155,4 +155,58 @@ where 1, 5, 7, 23, 2, 34, 46, and 64 represent the id (not the index) of the rel
 
 Do not include information where the supporting evidence for it is not provided.
 
-Output:"""
\ No newline at end of file
+Output:"""
+
+COMMUNITY_REPORT_BATCH_PROMPT = """
+You are an AI assistant that helps a human analyst to perform general information discovery. Information discovery is the process of identifying and assessing relevant information associated with certain entities (e.g., organizations and individuals) within a network.
+
+# Goal
+Write one comprehensive report for EACH of the communities below. Every community comes with a list of its entities and their relationships. The communities are independent: a report must only use the data of its own community. The reports will be used to inform decision-makers about information associated with the community and their potential impact.
+
+Each report should include the following sections:
+
+- TITLE: community's name that represents its key entities - title should be short but specific. When possible, include representative named entities in the title.
+- SUMMARY: An executive summary of the community's overall structure, how its entities are related to each other, and significant information associated with its entities.
+- IMPACT SEVERITY RATING: a float score between 0-10 that represents the severity of IMPACT posed by entities within the community.  IMPACT is the scored importance of a community.
+- RATING EXPLANATION: Give a single sentence explanation of the IMPACT severity rating.
+- DETAILED FINDINGS: A list of 2-5 key insights about the community. Each insight should have a short summary followed by explanatory text grounded according to the grounding rules below.
+
+Return output as a well-formed JSON array with exactly one element per community, in the same order as the input (in language of 'Text' content):
+    [
+        {{
+            "community_id": <the id in the community header>,
+            "title": <report_title>,
+            "summary": <executive_summary>,
+            "rating": <impact_severity_rating>,
+            "rating_explanation": <rating_explanation>,
+            "findings": [
+                {{
+                    "summary":<insight_1_summary>,
+                    "explanation": <insight_1_explanation>
+                }}
+            ]
+        }}
+    ]
+
+# Grounding Rules
+
+Points supported by data should list their data references as follows:
+
+"This is an example sentence supported by multiple data references [Data: <dataset name> (record ids); <dataset name> (record ids)]."
+
+Do not list more than 5 record ids in a single reference. Instead, list the top 5 most relevant record ids and add "+more" to indicate that there are more.
+
+where the record ids are the id (not the index) of the relevant data record in the community's own tables.
+
+Do not include information where the supporting evidence for it is not provided.
+
+
+# Real Data
+
+Use the following text for your answer. Do not make anything up in your answer.
+
+Text:
+
+{communities}
+
+Output:"""
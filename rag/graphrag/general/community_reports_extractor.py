@@ -9,6 +9,8 @@ Reference:
 """
 
 import asyncio
+import csv
+import io
 import logging
 import json
 import os
@@ -16,18 +18,25 @@ import re
 from typing import Callable
 from dataclasses import dataclass
 import networkx as nx
-import pandas as pd
+import xxhash
 
 from api.db.services.task_service import has_canceled
 from common.exceptions import TaskCanceledException
 from common.connection_utils import timeout
 from rag.graphrag.general import leiden
-from rag.graphrag.general.community_report_prompt import COMMUNITY_REPORT_PROMPT
+from rag.graphrag.general.community_report_prompt import COMMUNITY_REPORT_PROMPT, COMMUNITY_REPORT_BATCH_PROMPT
 from rag.graphrag.general.extractor import Extractor
 from rag.graphrag.general.leiden import add_community_info2graph
 from rag.llm.chat_model import Base as CompletionLLM
 from rag.graphrag.utils import perform_variable_replacements, dict_has_keys_with_types, chat_limiter
 from common.token_utils import num_tokens_from_string
+from rag.utils.redis_conn import REDIS_CONN
+
+# Communities whose tables are under this many tokens are packed into shared requests.
+GRAPHRAG_COMMUNITY_SMALL_TOKENS = int(os.environ.get("GRAPHRAG_COMMUNITY_SMALL_TOKENS", 1024))
+GRAPHRAG_COMMUNITY_BATCH_SIZE = int(os.environ.get("GRAPHRAG_COMMUNITY_BATCH_SIZE", 4))
+GRAPHRAG_COMMUNITY_CACHE_TTL = int(os.environ.get("GRAPHRAG_COMMUNITY_CACHE_TTL", 7 * 24 * 3600))
+
 
 @dataclass
 class CommunityReportsResult:
@@ -55,6 +64,79 @@ class CommunityReportsExtractor(Extractor):
         self._extraction_prompt = COMMUNITY_REPORT_PROMPT
         self._max_report_length = max_report_length or 1500
 
+    def _community_tables(self, graph: nx.Graph, ents: list[str]) -> tuple[str, str]:
+        """Entity and relation tables of one community, in the CSV layout the prompts expect."""
+        ent_buf = io.StringIO()
+        writer = csv.writer(ent_buf, lineterminator="\n")
+        writer.writerow(["id", "entity", "description"])
+        for i, ent in enumerate(ents):
+            writer.writerow([i, ent, graph.nodes[ent]["description"]])
+
+        rel_buf = io.StringIO()
+        writer = csv.writer(rel_buf, lineterminator="\n")
+        writer.writerow(["id", "source", "target", "description"])
+        position = {ent: i for i, ent in enumerate(ents)}
+        k = 0
+        for i, ent in enumerate(ents):
+            if k >= 10000:
+                break
+            for j in sorted(position[nbr] for nbr in graph.neighbors(ent) if position.get(nbr, -1) > i):
+                if k >= 10000:
+                    break
+                writer.writerow([k, ents[i], ents[j], graph.get_edge_data(ents[i], ents[j])["description"]])
+                k += 1
+        return ent_buf.getvalue(), rel_buf.getvalue()
+
+    def _cache_key(self, ent_csv: str, rel_csv: str) -> str:
+        hasher = xxhash.xxh64()
+        for v in [self._llm.llm_name, ent_csv, rel_csv]:
+            hasher.update(str(v).encode("utf-8"))
+        return "community_report:" + hasher.hexdigest()
+
+    def _pack(self, items: list[dict]) -> list[list[dict]]:
+        """
+        Small communities are packed, largest first, into batches that stay within the
+        token budget; communities above GRAPHRAG_COMMUNITY_SMALL_TOKENS go alone.
+        """
+        budget = int(self._llm.max_length * 0.5) - num_tokens_from_string(COMMUNITY_REPORT_BATCH_PROMPT)
+        units, batch, used = [], [], 0
+        for it in sorted(items, key=lambda x: x["tokens"], reverse=True):
+            if GRAPHRAG_COMMUNITY_BATCH_SIZE <= 1 or it["tokens"] > GRAPHRAG_COMMUNITY_SMALL_TOKENS:
+                units.append([it])
+                continue
+            if batch and (len(batch) >= GRAPHRAG_COMMUNITY_BATCH_SIZE or used + it["tokens"] > budget):
+                units.append(batch)
+                batch, used = [], 0
+            batch.append(it)
+            used += it["tokens"]
+        if batch:
+            units.append(batch)
+        return units
+
+    @staticmethod
+    def _parse_json(response: str, opening: str, closing: str):
+        response = re.sub(r"^[^" + re.escape(opening) + "]*", "", response)
+        response = re.sub(r"[^" + re.escape(closing) + "]*$", "", response)
+        response = re.sub(r"\{\{", "{", response)
+        response = re.sub(r"\}\}", "}", response)
+        logging.debug(response)
+        try:
+            return json.loads(response)
+        except json.JSONDecodeError as e:
+            logging.error(f"Failed to parse JSON response: {e}")
+            logging.error(f"Response content: {response}")
+            return None
+
+    @staticmethod
+    def _is_report(response) -> bool:
+        return isinstance(response, dict) and dict_has_keys_with_types(response, [
+            ("title", str),
+            ("summary", str),
+            ("findings", list),
+            ("rating", float),
+            ("rating_explanation", str),
+        ])
+
     async def __call__(self, graph: nx.Graph, callback: Callable | None = None, task_id: str = ""):
         enable_timeout_assertion = os.environ.get("ENABLE_TIMEOUT_ASSERTION")
         for node_degree in graph.degree:
@@ -65,90 +147,120 @@ class CommunityReportsExtractor(Extractor):
         res_str = []
         res_dict = []
         over, token_count = 0, 0
-        @timeout(120)
-        async def extract_community_report(community):
-            nonlocal res_str, res_dict, over, token_count
-            if task_id:
-                if has_canceled(task_id):
-                    logging.info(f"Task {task_id} cancelled during community report extraction.")
-                    raise TaskCanceledException(f"Task {task_id} was cancelled")
-
-            cm_id, cm = community
-            weight = cm["weight"]
-            ents = cm["nodes"]
-            if len(ents) < 2:
-                return
-            ent_list = [{"entity": ent, "description": graph.nodes[ent]["description"]} for ent in ents]
-            ent_df = pd.DataFrame(ent_list)
+        stats = {"llm_calls": 0, "solo": 0, "batched": 0, "cached": 0}
+        cache_writes = set()
 
-            rela_list = []
-            k = 0
-            for i in range(0, len(ents)):
-                if k >= 10000:
-                    break
-                for j in range(i + 1, len(ents)):
-                    if k >= 10000:
-                        break
-                    edge = graph.get_edge_data(ents[i], ents[j])
-                    if edge is None:
-                        continue
-                    rela_list.append({"source": ents[i], "target": ents[j], "description": edge["description"]})
-                    k += 1
-            rela_df = pd.DataFrame(rela_list)
+        def check_canceled(msg):
+            if task_id and has_canceled(task_id):
+                logging.info(f"Task {task_id} cancelled {msg}.")
+                raise TaskCanceledException(f"Task {task_id} was cancelled")
 
-            prompt_variables = {
-                "entity_df": ent_df.to_csv(index_label="id"),
-                "relation_df": rela_df.to_csv(index_label="id")
-            }
-            text = perform_variable_replacements(self._extraction_prompt, variables=prompt_variables)
+        def add_report(item, response, cached=False):
+            nonlocal over
+            if not self._is_report(response):
+                return False
+            response = {k: v for k, v in response.items() if k != "community_id"}
+            if not cached:
+                write = asyncio.get_running_loop().create_task(thread_pool_exec(
+                    REDIS_CONN.set, item["key"], json.dumps(response, ensure_ascii=False), GRAPHRAG_COMMUNITY_CACHE_TTL))
+                cache_writes.add(write)
+                write.add_done_callback(cache_writes.discard)
+            response["weight"] = item["weight"]
+            response["entities"] = item["ents"]
+            add_community_info2graph(graph, item["ents"], response["title"])
+            res_str.append(self._get_text_output(response))
+            res_dict.append(response)
+            over += 1
+            if callback:
+                callback(msg=f"Communities: {over}/{total}, used tokens: {token_count}")
+            return True
+
+        async def chat(text):
+            nonlocal token_count
             async with chat_limiter:
                 try:
                     timeout = 180 if enable_timeout_assertion else 1000000000
                     response = await asyncio.wait_for(thread_pool_exec(self._chat,text,[{"role": "user", "content": "Output:"}],{},task_id),timeout=timeout)
                 except asyncio.TimeoutError:
                     logging.warning("extract_community_report._chat timeout, skipping...")
-                    return
+                    return None
                 except Exception as e:
                     logging.error(f"extract_community_report._chat failed: {e}")
-                    return
+                    return None
+            stats["llm_calls"] += 1
             token_count += num_tokens_from_string(text + response)
-            response = re.sub(r"^[^\{]*", "", response)
-            response = re.sub(r"[^\}]*$", "", response)
-            response = re.sub(r"\{\{", "{", response)
-            response = re.sub(r"\}\}", "}", response)
-            logging.debug(response)
-            try:
-                response = json.loads(response)
-            except json.JSONDecodeError as e:
-                logging.error(f"Failed to parse JSON response: {e}")
-                logging.error(f"Response content: {response}")
-                return
-            if not dict_has_keys_with_types(response, [
-                        ("title", str),
-                        ("summary", str),
-                        ("findings", list),
-                        ("rating", float),
-                        ("rating_explanation", str),
-                    ]):
+            return response
+
+        @timeout(120)
+        async def extract_community_report(item):
+            check_canceled("during community report extraction")
+            prompt_variables = {
+                "entity_df": item["ent_csv"],
+                "relation_df": item["rel_csv"]
+            }
+            text = perform_variable_replacements(self._extraction_prompt, variables=prompt_variables)
+            response = await chat(text)
+            if response is None:
                 return
-            response["weight"] = weight
-            response["entities"] = ents
-            add_community_info2graph(graph, ents, response["title"])
-            res_str.append(self._get_text_output(response))
-            res_dict.append(response)
-            over += 1
-            if callback:
-                callback(msg=f"Communities: {over}/{total}, used tokens: {token_count}")
+            if add_report(item, self._parse_json(response, "{", "}")):
+                stats["solo"] += 1
+
+        @timeout(300)
+        async def extract_community_reports(items):
+            check_canceled("during community report extraction")
+            communities_text = "\n\n".join(
+                f"## Community {i}\n\n-Entities-\n{it['ent_csv']}\n-Relationships-\n{it['rel_csv']}" for i, it in enumerate(items)
+            )
+            text = perform_variable_replacements(COMMUNITY_REPORT_BATCH_PROMPT, variables={"communities": communities_text})
+            response = await chat(text)
+            reports = self._parse_json(response, "[", "]") if response is not None else None
+            by_id = {}
+            for rep in reports if isinstance(reports, list) else []:
+                if isinstance(rep, dict) and str(rep.get("community_id", "")).isdigit():
+                    by_id[int(rep["community_id"])] = rep
+            missed = []
+            for i, it in enumerate(items):
+                if add_report(it, by_id.get(i)):
+                    stats["batched"] += 1
+                else:
+                    missed.append(it)
+            if missed:
+                logging.info(f"Batched community report request missed {len(missed)}/{len(items)} communities, retrying them one by one")
+                await asyncio.gather(*[extract_community_report(it) for it in missed])
 
         st = asyncio.get_running_loop().time()
-        tasks = []
+        items = []
         for level, comm in communities.items():
             logging.info(f"Level {level}: Community: {len(comm.keys())}")
-            for community in comm.items():
-                if task_id and has_canceled(task_id):
-                    logging.info(f"Task {task_id} cancelled before community processing.")
-                    raise TaskCanceledException(f"Task {task_id} was cancelled")
-                tasks.append(asyncio.create_task(extract_community_report(community)))
+            for cm_id, cm in comm.items():
+                check_canceled("before community processing")
+                ents = cm["nodes"]
+                if len(ents) < 2:
+                    continue
+                ent_csv, rel_csv = self._community_tables(graph, ents)
+                items.append({
+                    "weight": cm["weight"],
+                    "ents": ents,
+                    "ent_csv": ent_csv,
+                    "rel_csv": rel_csv,
+                    "key": self._cache_key(ent_csv, rel_csv),
+                })
+
+        pending = []
+        cached_reports = await thread_pool_exec(REDIS_CONN.mget, [it["key"] for it in items])
+        for item, cached in zip(items, cached_reports):
+            if cached and add_report(item, json.loads(cached), cached=True):
+                stats["cached"] += 1
+                continue
+            item["tokens"] = num_tokens_from_string(item["ent_csv"] + item["rel_csv"])
+            pending.append(item)
+
+        tasks = []
+        for unit in self._pack(pending):
+            if len(unit) == 1:
+                tasks.append(asyncio.create_task(extract_community_report(unit[0])))
+            else:
+                tasks.append(asyncio.create_task(extract_community_reports(unit)))
         try:
             await asyncio.gather(*tasks, return_exceptions=False)
         except Exception as e:
@@ -157,8 +269,14 @@ class CommunityReportsExtractor(Extractor):
                 t.cancel()
             await asyncio.gather(*tasks, return_exceptions=True)
             raise
+        finally:
+            await asyncio.gather(*cache_writes, return_exceptions=True)
+        elapsed = asyncio.get_running_loop().time() - st
+        logging.info(f"Community reports: {stats}, {over / max(elapsed, 1e-6):.2f} communities/s")
         if callback:
-            callback(msg=f"Community reports done in {asyncio.get_running_loop().time() - st:.2f}s, used tokens: {token_count}")
+            callback(msg=f"Community reports done in {elapsed:.2f}s, used tokens: {token_count}, "
+                         f"LLM calls: {stats['llm_calls']}, solo: {stats['solo']}, batched: {stats['batched']}, cached: {stats['cached']}, "
+                         f"{over / max(elapsed, 1e-6):.2f} communities/s")
 
         return CommunityReportsResult(
             structured_output=res_dict,
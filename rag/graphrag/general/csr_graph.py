@@ -0,0 +1,210 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Array-backed graph for the GraphRAG analytics passes.
+
+NetworkX keeps every node and edge as nested Python dicts, which dominates memory
+and time on large knowledge graphs, and the analytics passes copy it several times.
+CSRGraph interns node names to integer ids once and stores the undirected weighted
+adjacency as a scipy CSR matrix. PageRank, largest connected component, Leiden and
+n-hop path extraction run on the arrays; conversion happens only at the boundaries
+(`from_networkx` in, name-keyed dicts out).
+"""
+
+import html
+import heapq
+import itertools
+
+import networkx as nx
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+
+
+def normalize_node_name(name) -> str:
+    return html.unescape(str(name).upper().strip())
+
+
+class CSRGraph:
+    def __init__(self, nodes: list, adjacency: sparse.csr_matrix):
+        self.nodes = nodes
+        self.index = {n: i for i, n in enumerate(nodes)}
+        self.adjacency = adjacency
+
+    def __len__(self):
+        return len(self.nodes)
+
+    @property
+    def num_edges(self) -> int:
+        return int(sparse.triu(self.adjacency).nnz)
+
+    @classmethod
+    def from_networkx(cls, graph: nx.Graph, weight: str = "weight", normalize: bool = False) -> "CSRGraph":
+        """
+        Build from a NetworkX graph. Nodes are sorted so the same graph always gets
+        the same ids. With `normalize`, names are upper-cased, stripped and unescaped
+        like `leiden.normalize_node_names`; colliding names collapse into one node.
+        """
+        if normalize:
+            names = sorted(set(normalize_node_name(n) for n in graph.nodes()))
+        else:
+            names = sorted(graph.nodes(), key=str)
+        index = {n: i for i, n in enumerate(names)}
+        rename = normalize_node_name if normalize else (lambda x: x)
+
+        n_edges = graph.number_of_edges()
+        rows = np.empty(n_edges, dtype=np.int32)
+        cols = np.empty(n_edges, dtype=np.int32)
+        vals = np.empty(n_edges, dtype=np.float64)
+        for k, (u, v, w) in enumerate(graph.edges(data=weight, default=1.0)):
+            rows[k] = index[rename(u)]
+            cols[k] = index[rename(v)]
+            vals[k] = w if w is not None else 1.0
+        # Undirected: mirror every off-diagonal edge. Parallel edges from name collisions are summed.
+        off = rows != cols
+        r = np.concatenate([rows, cols[off]])
+        c = np.concatenate([cols, rows[off]])
+        v = np.concatenate([vals, vals[off]])
+        adjacency = sparse.coo_matrix((v, (r, c)), shape=(len(names), len(names))).tocsr()
+        return cls(names, adjacency)
+
+    def subgraph(self, idx: np.ndarray) -> "CSRGraph":
+        idx = np.sort(idx)
+        return CSRGraph([self.nodes[i] for i in idx], self.adjacency[idx][:, idx].tocsr())
+
+    def largest_connected_component(self) -> "CSRGraph":
+        if not len(self):
+            return self
+        _, labels = connected_components(self.adjacency, directed=False)
+        largest = np.argmax(np.bincount(labels))
+        return self.subgraph(np.flatnonzero(labels == largest))
+
+    def pagerank(self, alpha: float = 0.85, max_iter: int = 100, tol: float = 1.0e-6) -> dict:
+        """Weighted PageRank, same iteration and convergence test as networkx.pagerank."""
+        n = len(self)
+        if n == 0:
+            return {}
+        out = np.asarray(self.adjacency.sum(axis=1)).ravel()
+        inv = np.zeros(n)
+        inv[out != 0] = 1.0 / out[out != 0]
+        transition = sparse.diags(inv) @ self.adjacency
+        dangling = out == 0
+        p = np.full(n, 1.0 / n)
+        x = p.copy()
+        for _ in range(max_iter):
+            last = x
+            x = alpha * (x @ transition + x[dangling].sum() * p) + (1 - alpha) * p
+            if np.abs(x - last).sum() < n * tol:
+                x = x / x.sum()
+                return dict(zip(self.nodes, x.tolist()))
+        raise nx.PowerIterationFailedConvergence(max_iter)
+
+    def leiden(self, max_cluster_size: int, seed: int):
+        """Hierarchical Leiden on the adjacency matrix. Returns {level: {node name: cluster}}."""
+        from graspologic.partition import hierarchical_leiden
+
+        results: dict[int, dict] = {}
+        if self.adjacency.nnz == 0:
+            return results
+        # graspologic reads sparse matrices one element at a time; an edge list of the upper triangle is much faster.
+        upper = sparse.triu(self.adjacency).tocoo()
+        edges = list(zip(upper.row.tolist(), upper.col.tolist(), upper.data.tolist()))
+        for partition in hierarchical_leiden(edges, max_cluster_size=max_cluster_size, random_seed=seed):
+            results.setdefault(partition.level, {})[self.nodes[partition.node]] = partition.cluster
+        return results
+
+    def n_hop_paths(self, node, n_hops: int = 2, max_paths: int = 16, max_branch: int = 32) -> list[dict]:
+        """
+        Simple paths of 2..n_hops+1 nodes starting at `node`, as {"path": [...], "weights": [...]}
+        where weights[i] is the weight of edge (path[i], path[i+1]). Only the `max_branch`
+        heaviest edges of each node are followed, and the `max_paths` paths with the highest
+        mean edge weight are kept.
+        """
+        if node not in self.index or n_hops < 1:
+            return []
+        indptr, indices, data = self.adjacency.indptr, self.adjacency.indices, self.adjacency.data
+        seq = itertools.count()
+        best = []
+        stack = [([self.index[node]], [])]
+        while stack:
+            path, weights = stack.pop()
+            u = path[-1]
+            lo, hi = indptr[u], indptr[u + 1]
+            for k in lo + np.argsort(-data[lo:hi], kind="stable")[:max_branch]:
+                v = int(indices[k])
+                if v in path:
+                    continue
+                p, w = path + [v], weights + [float(data[k])]
+                item = (sum(w) / len(w), -next(seq), p, w)
+                if len(best) < max_paths:
+                    heapq.heappush(best, item)
+                else:
+                    heapq.heappushpop(best, item)
+                if len(w) < n_hops:
+                    stack.append((p, w))
+        best.sort(reverse=True)
+        return [{"path": [self.nodes[i] for i in p], "weights": w} for _, _, p, w in best]
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    import tracemalloc
+
+    parser = argparse.ArgumentParser(description="Compare CSRGraph against NetworkX for the GraphRAG analytics passes.")
+    parser.add_argument("--nodes", default="1000,10000,100000", help="Comma separated node counts")
+    parser.add_argument("--degree", type=int, default=4, help="Edges attached per new node (Barabasi-Albert)")
+    parser.add_argument("--leiden", action="store_true", help="Also time Leiden (needs graspologic)")
+    args = parser.parse_args()
+
+    def measure(fn):
+        tracemalloc.start()
+        st = time.perf_counter()
+        res = fn()
+        elapsed = time.perf_counter() - st
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return res, elapsed, peak / 1024 / 1024
+
+    print(f"{'nodes':>8} {'pass':>10} {'nx(s)':>8} {'nx(MB)':>8} {'csr(s)':>8} {'csr(MB)':>8}")
+    for n in [int(x) for x in args.nodes.split(",") if x.strip()]:
+        g = nx.barabasi_albert_graph(n, args.degree, seed=0)
+        g = nx.relabel_nodes(g, {i: f"entity {i}" for i in g.nodes()})
+        for u, v in g.edges():
+            g.edges[u, v]["weight"] = float((hash((u, v)) % 7) + 1)
+
+        csr, t, m = measure(lambda: CSRGraph.from_networkx(g))
+        print(f"{n:>8} {'convert':>10} {'-':>8} {'-':>8} {t:>8.2f} {m:>8.1f}")
+
+        pr_nx, t_nx, m_nx = measure(lambda: nx.pagerank(g))
+        pr_csr, t_csr, m_csr = measure(csr.pagerank)
+        drift = max(abs(pr_nx[k] - pr_csr[k]) for k in pr_nx)
+        print(f"{n:>8} {'pagerank':>10} {t_nx:>8.2f} {m_nx:>8.1f} {t_csr:>8.2f} {m_csr:>8.1f}  max|diff|={drift:.2e}")
+
+        from rag.graphrag.general import leiden as leiden_mod
+
+        _, t_nx, m_nx = measure(lambda: leiden_mod.stable_largest_connected_component(g))
+        _, t_csr, m_csr = measure(lambda: CSRGraph.from_networkx(g, normalize=True).largest_connected_component())
+        print(f"{n:>8} {'lcc':>10} {t_nx:>8.2f} {m_nx:>8.1f} {t_csr:>8.2f} {m_csr:>8.1f}")
+
+        sample = list(g.nodes())[: min(1000, n)]
+        _, t_csr, m_csr = measure(lambda: [csr.n_hop_paths(s) for s in sample])
+        print(f"{n:>8} {'n-hop x' + str(len(sample)):>10} {'-':>8} {'-':>8} {t_csr:>8.2f} {m_csr:>8.1f}")
+
+        if args.leiden:
+            _, t_nx, m_nx = measure(lambda: leiden_mod.run(g, {"backend": "networkx"}))
+            _, t_csr, m_csr = measure(lambda: leiden_mod.run(g, {}))
+            print(f"{n:>8} {'leiden':>10} {t_nx:>8.2f} {m_nx:>8.1f} {t_csr:>8.2f} {m_csr:>8.1f}")
@@ -39,6 +39,7 @@ from rag.graphrag.utils import (
     split_string_by_multi_markers,
 )
 from common.misc_utils import thread_pool_exec
+from rag.graphrag.checkpoint import ExtractionCheckpoint, ExtractionResults
 from rag.llm.chat_model import Base as CompletionLLM
 from rag.prompts.generator import message_fit_in
 from common.exceptions import TaskCanceledException
@@ -61,6 +62,7 @@ class Extractor:
         self._llm = llm_invoker
         self._language = language
         self._entity_types = entity_types or DEFAULT_ENTITY_TYPES
+        self.checkpoint = None
 
     @timeout(60 * 20)
     def _chat(self, system, history, gen_conf={}, task_id=""):
@@ -111,8 +113,10 @@ class Extractor:
         self.callback = callback
         start_ts = asyncio.get_running_loop().time()
 
+        self.checkpoint = ExtractionCheckpoint(doc_id, self.__class__.__module__ + "." + self.__class__.__name__, self._llm.llm_name, self._entity_types)
+
         async def extract_all(doc_id, chunks, max_concurrency=MAX_CONCURRENT_PROCESS_AND_EXTRACT_CHUNK, task_id=""):
-            out_results = []
+            results = ExtractionResults()
             error_count = 0
             max_errors = int(os.environ.get("GRAPHRAG_MAX_ERRORS", 3))
 
@@ -126,7 +130,7 @@ class Extractor:
                         raise TaskCanceledException(f"Task {task_id} was cancelled during entity extraction")
 
                     try:
-                        await self._process_single_content(chunk_key_dp, idx, total, out_results, task_id)
+                        await self._process_single_content(chunk_key_dp, idx, total, results.for_chunk(chunk_key_dp[1], self.checkpoint), task_id)
                     except Exception as e:
                         error_count += 1
                         error_msg = f"Error processing chunk {idx + 1}/{total}: {str(e)}"
@@ -137,9 +141,20 @@ class Extractor:
                         if error_count > max_errors:
                             raise Exception(f"Maximum error count ({max_errors}) reached. Last errors: {str(e)}")
 
+            await thread_pool_exec(self.checkpoint.load)
+            pending = []
+            for i, ck in enumerate(chunks):
+                done = self.checkpoint.get(ck)
+                if done:
+                    results.merge(done, from_checkpoint=True)
+                else:
+                    pending.append((i, ck))
+            if results.skipped and self.callback:
+                self.callback(msg=f"Resumed entity extraction from checkpoint: {results.skipped}/{len(chunks)} chunks skipped, {len(pending)} to extract.")
+
             tasks = [
                 asyncio.create_task(worker((doc_id, ck), i, len(chunks), task_id))
-                for i, ck in enumerate(chunks)
+                for i, ck in pending
             ]
 
             try:
@@ -150,6 +165,9 @@ class Extractor:
                     t.cancel()
                 await asyncio.gather(*tasks, return_exceptions=True)
                 raise
+            finally:
+                # Let the checkpoints of finished chunks land, so a retry resumes from them.
+                await results.flush()
 
             if error_count > 0:
                 warning_msg = f"Completed with {error_count} errors (out of {len(chunks)} chunks processed)"
@@ -157,25 +175,18 @@ class Extractor:
                 if self.callback:
                     self.callback(msg=warning_msg)
 
-            return out_results
+            return results
 
         if task_id and has_canceled(task_id):
             raise TaskCanceledException(f"Task {task_id} was cancelled before entity extraction")
 
-        out_results = await extract_all(doc_id, chunks, max_concurrency=MAX_CONCURRENT_PROCESS_AND_EXTRACT_CHUNK, task_id=task_id)
+        results = await extract_all(doc_id, chunks, max_concurrency=MAX_CONCURRENT_PROCESS_AND_EXTRACT_CHUNK, task_id=task_id)
 
         if task_id and has_canceled(task_id):
             raise TaskCanceledException(f"Task {task_id} was cancelled after entity extraction")
 
-        maybe_nodes = defaultdict(list)
-        maybe_edges = defaultdict(list)
-        sum_token_count = 0
-        for m_nodes, m_edges, token_count in out_results:
-            for k, v in m_nodes.items():
-                maybe_nodes[k].extend(v)
-            for k, v in m_edges.items():
-                maybe_edges[tuple(sorted(k))].extend(v)
-            sum_token_count += token_count
+        maybe_nodes, maybe_edges, sum_token_count = results.nodes, results.edges, results.token_count
+        logging.info(f"Entity extraction of doc {doc_id}: {results.skipped} chunks from checkpoint, {results.extracted} extracted")
         now = asyncio.get_running_loop().time()
         if self.callback:
             self.callback(msg=f"Entities and relationships extraction done, {len(maybe_nodes)} nodes, {len(maybe_edges)} edges, {sum_token_count} tokens, {now - start_ts:.2f}s.")
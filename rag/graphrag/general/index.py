@@ -27,6 +27,7 @@ from common.misc_utils import get_uuid
 from common.connection_utils import timeout
 from rag.graphrag.entity_resolution import EntityResolution
 from rag.graphrag.general.community_reports_extractor import CommunityReportsExtractor
+from rag.graphrag.general.csr_graph import CSRGraph
 from rag.graphrag.general.extractor import Extractor
 from rag.graphrag.general.graph_extractor import GraphExtractor as GeneralKGExt
 from rag.graphrag.light.graph_extractor import GraphExtractor as LightKGExt
@@ -463,6 +464,8 @@ async def generate_subgraph(
     cid = chunk_id(chunk)
     await thread_pool_exec(settings.docStoreConn.delete,{"knowledge_graph_kwd": "subgraph", "source_id": doc_id},search.index_name(tenant_id),kb_id,)
     await thread_pool_exec(settings.docStoreConn.insert,[{"id": cid, **chunk}],search.index_name(tenant_id),kb_id,)
+    # The subgraph is persisted, so the per-chunk extraction checkpoint is no longer needed.
+    await thread_pool_exec(ext.checkpoint.clear)
     now = asyncio.get_running_loop().time()
     callback(msg=f"generated subgraph for doc {doc_id} in {now - start:.2f} seconds.")
     return subgraph
@@ -488,7 +491,7 @@ async def merge_subgraph(
         new_graph = subgraph
         change.added_updated_nodes = set(new_graph.nodes())
         change.added_updated_edges = set(new_graph.edges())
-    pr = nx.pagerank(new_graph)
+    pr = CSRGraph.from_networkx(new_graph).pagerank()
     for node_name, pagerank in pr.items():
         new_graph.nodes[node_name]["pagerank"] = pagerank
 
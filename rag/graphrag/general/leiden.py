@@ -13,6 +13,8 @@ from graspologic.utils import largest_connected_component
 import networkx as nx
 from networkx import is_empty
 
+from rag.graphrag.general.csr_graph import CSRGraph
+
 
 def _stabilize_graph(graph: nx.Graph) -> nx.Graph:
     """Ensure an undirected graph with the same relationships will always be read the same way."""
@@ -74,11 +76,18 @@ def _compute_leiden_communities(
         max_cluster_size: int,
         use_lcc: bool,
         seed=0xDEADBEEF,
+        backend: str = "csr",
 ) -> dict[int, dict[str, int]]:
     """Return Leiden root communities."""
     results: dict[int, dict[str, int]] = {}
     if is_empty(graph):
         return results
+    if backend != "networkx" and not graph.is_directed():
+        csr = CSRGraph.from_networkx(graph, normalize=use_lcc)
+        if use_lcc:
+            csr = csr.largest_connected_component()
+        return csr.leiden(max_cluster_size, seed)
+
     if use_lcc:
         graph = stable_largest_connected_component(graph)
 
@@ -109,6 +118,7 @@ def run(graph: nx.Graph, args: dict[str, Any]) -> dict[int, dict[str, dict]]:
         max_cluster_size=max_cluster_size,
         use_lcc=use_lcc,
         seed=args.get("seed", 0xDEADBEEF),
+        backend=args.get("backend", "csr"),
     )
     levels = args.get("levels")
 
@@ -32,6 +32,7 @@ from rag.nlp import rag_tokenizer, search
 from rag.utils.redis_conn import REDIS_CONN
 from common import settings
 from common.doc_store.doc_store_base import OrderByExpr
+from rag.graphrag.general.csr_graph import CSRGraph
 
 GRAPH_FIELD_SEP = "<SEP>"
 
@@ -93,22 +94,28 @@ def dict_has_keys_with_types(data: dict, expected_fields: list[tuple[str, type]]
     return True
 
 
-def get_llm_cache(llmnm, txt, history, genconf):
+def _llm_cache_key(llmnm, txt, history, genconf):
     hasher = xxhash.xxh64()
     hasher.update((str(llmnm)+str(txt)+str(history)+str(genconf)).encode("utf-8"))
+    return hasher.hexdigest()
 
-    k = hasher.hexdigest()
-    bin = REDIS_CONN.get(k)
+
+def get_llm_cache(llmnm, txt, history, genconf):
+    bin = REDIS_CONN.get(_llm_cache_key(llmnm, txt, history, genconf))
     if not bin:
         return None
     return bin
 
 
+def get_llm_cache_many(llmnm, items: list[tuple]) -> list:
+    """`get_llm_cache` for a list of (txt, history, genconf) with one MGET."""
+    if not items:
+        return []
+    return [v or None for v in REDIS_CONN.mget([_llm_cache_key(llmnm, *it) for it in items])]
+
+
 def set_llm_cache(llmnm, txt, v, history, genconf):
-    hasher = xxhash.xxh64()
-    hasher.update((str(llmnm)+str(txt)+str(history)+str(genconf)).encode("utf-8"))
-    k = hasher.hexdigest()
-    REDIS_CONN.set(k, v.encode("utf-8"), 24 * 3600)
+    REDIS_CONN.set(_llm_cache_key(llmnm, txt, history, genconf), v.encode("utf-8"), 24 * 3600)
 
 
 def get_embed_cache(llmnm, txt):
@@ -297,7 +304,7 @@ def chunk_id(chunk):
     return xxhash.xxh64((chunk["content_with_weight"] + chunk["kb_id"]).encode("utf-8")).hexdigest()
 
 
-async def graph_node_to_chunk(kb_id, embd_mdl, ent_name, meta, chunks):
+async def graph_node_to_chunk(kb_id, embd_mdl, ent_name, meta, chunks, n_hops=None):
     global chat_limiter
     enable_timeout_assertion = os.environ.get("ENABLE_TIMEOUT_ASSERTION")
     chunk = {
@@ -313,6 +320,8 @@ async def graph_node_to_chunk(kb_id, embd_mdl, ent_name, meta, chunks):
         "kb_id": kb_id,
         "available_int": 0,
     }
+    if n_hops:
+        chunk["n_hop_with_weight"] = json.dumps(n_hops, ensure_ascii=False)
     chunk["content_sm_ltks"] = rag_tokenizer.fine_grained_tokenize(chunk["content_ltks"])
     ebd = get_embed_cache(embd_mdl.llm_name, ent_name)
     if ebd is None:
@@ -496,8 +505,12 @@ async def set_graph(tenant_id: str, kb_id: str, embd_mdl, graph: nx.Graph, chang
     ]
 
     # generate updated subgraphs
+    nodes_by_source = defaultdict(list)
+    for n, source_ids in graph.nodes(data="source_id"):
+        for source in source_ids or []:
+            nodes_by_source[source].append(n)
     for source in graph.graph["source_id"]:
-        subgraph = graph.subgraph([n for n in graph.nodes if source in graph.nodes[n]["source_id"]]).copy()
+        subgraph = graph.subgraph(nodes_by_source.get(source, [])).copy()
         subgraph.graph["source_id"] = [source]
         for n in subgraph.nodes:
             subgraph.nodes[n]["source_id"] = [source]
@@ -513,11 +526,12 @@ async def set_graph(tenant_id: str, kb_id: str, embd_mdl, graph: nx.Graph, chang
             }
         )
 
+    csr = await thread_pool_exec(CSRGraph.from_networkx, graph) if change.added_updated_nodes else None
     tasks = []
     for ii, node in enumerate(change.added_updated_nodes):
         node_attrs = graph.nodes[node]
         tasks.append(asyncio.create_task(
-            graph_node_to_chunk(kb_id, embd_mdl, node, node_attrs, chunks)
+            graph_node_to_chunk(kb_id, embd_mdl, node, node_attrs, chunks, n_hops=csr.n_hop_paths(node))
         ))
         if ii % 100 == 9 and callback:
             callback(msg=f"Get embedding of nodes: {ii}/{len(change.added_updated_nodes)}")
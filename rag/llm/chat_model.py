@@ -30,6 +30,7 @@ import openai
 from openai import AsyncOpenAI, OpenAI
 from strenum import StrEnum
 
+from common.http_client import get_pooled_async_client, get_pooled_client
 from common.token_utils import num_tokens_from_string, total_token_count_from_response
 from rag.llm import FACTORY_DEFAULT_BASE_URL, LITELLM_PROVIDER_PREFIX, SupportedLiteLLMProvider
 from rag.nlp import is_chinese, is_english
@@ -63,8 +64,8 @@ LENGTH_NOTIFICATION_EN = "...\nThe answer is truncated by your chosen LLM due to
 class Base(ABC):
     def __init__(self, key, model_name, base_url, **kwargs):
         timeout = int(os.environ.get("LLM_TIMEOUT_SECONDS", 600))
-        self.client = OpenAI(api_key=key, base_url=base_url, timeout=timeout)
-        self.async_client = AsyncOpenAI(api_key=key, base_url=base_url, timeout=timeout)
+        self.client = OpenAI(api_key=key, base_url=base_url, timeout=timeout, http_client=get_pooled_client(base_url))
+        self.async_client = AsyncOpenAI(api_key=key, base_url=base_url, timeout=timeout, http_client=get_pooled_async_client(base_url))
         self.model_name = model_name
         # Configure retry parameters
         self.max_retries = kwargs.get("max_retries", int(os.environ.get("LLM_MAX_RETRIES", 5)))
@@ -599,7 +600,7 @@ class LocalAIChat(Base):
         if not base_url:
             raise ValueError("Local llm url cannot be None")
         base_url = urljoin(base_url, "v1")
-        self.client = OpenAI(api_key="empty", base_url=base_url)
+        self.client = OpenAI(api_key="empty", base_url=base_url, http_client=get_pooled_client(base_url))
         self.model_name = model_name.split("___")[0]
 
 
@@ -727,7 +728,7 @@ class LmStudioChat(Base):
             raise ValueError("Local llm url cannot be None")
         base_url = urljoin(base_url, "v1")
         super().__init__(key, model_name, base_url, **kwargs)
-        self.client = OpenAI(api_key="lm-studio", base_url=base_url)
+        self.client = OpenAI(api_key="lm-studio", base_url=base_url, http_client=get_pooled_client(base_url))
         self.model_name = model_name
 
 
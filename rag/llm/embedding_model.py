@@ -15,26 +15,100 @@
 #
 import json
 import os
+import random
+import re
 import threading
+import time
 from abc import ABC
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urljoin
 
 import dashscope
 import google.generativeai as genai
 import numpy as np
-import requests
 from ollama import Client
 from openai import OpenAI
 from zhipuai import ZhipuAI
 
+from common.http_client import get_pooled_client, pooled_request
 from common.log_utils import log_exception
+from common.misc_utils import once
 from common.token_utils import num_tokens_from_string, truncate, total_token_count_from_response
 from common import settings
 import logging
 import base64
 
+# Per-model batching overrides keyed by model name or factory name (the model name wins), e.g.
+# {"BAAI/bge-m3": {"batch_size": 128, "batch_tokens": 65536, "concurrency": 4}, "OpenAI": {"concurrency": 8}}
+EMBEDDING_BATCH_CONFIG = json.loads(os.environ.get("EMBEDDING_BATCH_CONFIG") or "{}")
+EMBEDDING_MAX_WORKERS = int(os.environ.get("EMBEDDING_MAX_WORKERS", 32))
+EMBEDDING_RATE_LIMIT_RETRIES = int(os.environ.get("EMBEDDING_RATE_LIMIT_RETRIES", 5))
+EMBEDDING_RATE_LIMIT_DELAY = float(os.environ.get("EMBEDDING_RATE_LIMIT_DELAY", 1.0))
+
+
+@once
+def _batch_executor():
+    return ThreadPoolExecutor(max_workers=EMBEDDING_MAX_WORKERS, thread_name_prefix="embedding_batch")
+
+
+def _is_rate_limited(e: Exception) -> bool:
+    status = getattr(e, "status_code", None) or getattr(getattr(e, "response", None), "status_code", None)
+    if status == 429:
+        return True
+    msg = str(e).lower()
+    # A bare substring match would also catch 429 inside request ids, token counts or URLs.
+    return re.search(r"\b429\b", msg) is not None or "rate limit" in msg or "too many requests" in msg
+
+
+class _AdaptiveConcurrency:
+    """
+    In-flight batch limit shared by every instance of one provider model: halved on
+    each 429, raised by one after `limit` consecutive successes, never above `limit`.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self.current = self.limit
+        self._in_flight = 0
+        self._successes = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self._in_flight >= self.current:
+                self._cond.wait()
+            self._in_flight += 1
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify()
+
+    def succeeded(self):
+        with self._cond:
+            self._successes += 1
+            if self.current < self.limit and self._successes >= self.limit:
+                self.current += 1
+                self._successes = 0
+                self._cond.notify()
+
+    def throttled(self):
+        with self._cond:
+            self.current = max(1, self.current // 2)
+            self._successes = 0
+
+
+_concurrency_lock = threading.Lock()
+_concurrency: dict = {}
+
 
 class Base(ABC):
+    # Batching defaults of the provider; EMBEDDING_BATCH_CONFIG overrides them per model.
+    # batch_tokens of 0 means batches are bounded by batch_size only.
+    _BATCH_SIZE = 16
+    _BATCH_TOKENS = 0
+    _CONCURRENCY = 1
+
     def __init__(self, key, model_name, **kwargs):
         """
         Constructor for abstract base class.
@@ -46,6 +120,102 @@ class Base(ABC):
     def encode(self, texts: list):
         raise NotImplementedError("Please implement encode method!")
 
+    def _encode_batch(self, texts: list) -> tuple[list, int]:
+        """Embed one batch in a single provider call. Returns (embeddings in input order, token count)."""
+        raise NotImplementedError("Please implement _encode_batch method!")
+
+    def _batch_config(self) -> dict:
+        config = {"batch_size": self._BATCH_SIZE, "batch_tokens": self._BATCH_TOKENS, "concurrency": self._CONCURRENCY}
+        factories = getattr(self, "_FACTORY_NAME", [])
+        factories = factories if isinstance(factories, list) else [factories]
+        for name in [*factories, getattr(self, "model_name", "")]:
+            config.update(EMBEDDING_BATCH_CONFIG.get(name, {}))
+        return config
+
+    @staticmethod
+    def _pack_batches(texts: list, batch_size: int, batch_tokens: int) -> list[list[int]]:
+        """
+        Group text indices into batches of at most `batch_size` items and, when `batch_tokens`
+        is set, at most that many tokens. Texts are sorted by length first so each batch holds
+        similarly sized inputs; a single text over the budget gets a batch of its own.
+        """
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+        batches, batch, tokens = [], [], 0
+        for i in order:
+            n = num_tokens_from_string(texts[i]) if batch_tokens and isinstance(texts[i], str) else 0
+            if batch and (len(batch) >= batch_size or (batch_tokens and tokens + n > batch_tokens)):
+                batches.append(batch)
+                batch, tokens = [], 0
+            batch.append(i)
+            tokens += n
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _batched_encode(self, texts: list, encode_batch=None) -> tuple[np.ndarray, int]:
+        """
+        Embed `texts` with `encode_batch` (default `_encode_batch`): pack them into batches,
+        run up to `concurrency` batches at once, back off on 429s and return the embeddings
+        in input order with the summed token count.
+        """
+        if not texts:
+            return np.array([]), 0
+        encode_batch = encode_batch or self._encode_batch
+        config = self._batch_config()
+        batches = self._pack_batches(texts, max(1, int(config["batch_size"])), int(config["batch_tokens"] or 0))
+        limit_key = (type(self).__name__, getattr(self, "model_name", ""))
+        with _concurrency_lock:
+            limiter = _concurrency.get(limit_key)
+            if limiter is None or limiter.limit != max(1, int(config["concurrency"])):
+                limiter = _concurrency[limit_key] = _AdaptiveConcurrency(int(config["concurrency"]))
+
+        def run(batch):
+            try:
+                for attempt in range(EMBEDDING_RATE_LIMIT_RETRIES + 1):
+                    try:
+                        embeddings, token_count = encode_batch([texts[i] for i in batch])
+                        limiter.succeeded()
+                        break
+                    except Exception as e:
+                        if attempt >= EMBEDDING_RATE_LIMIT_RETRIES or not _is_rate_limited(e):
+                            raise
+                        limiter.throttled()
+                        delay = EMBEDDING_RATE_LIMIT_DELAY * 2**attempt * (1 + random.random())
+                        logging.warning(f"{limit_key[0]} {limit_key[1]} rate limited, retrying batch of {len(batch)} in {delay:.1f}s (concurrency {limiter.current})")
+                        time.sleep(delay)
+            finally:
+                limiter.release()
+            if len(embeddings) != len(batch):
+                raise Exception(f"Error: {limit_key[0]} returned {len(embeddings)} embeddings for {len(batch)} texts")
+            return embeddings, token_count
+
+        results = []
+        if limiter.limit == 1 or len(batches) == 1:
+            for batch in batches:
+                limiter.acquire()
+                results.append(run(batch))
+        else:
+            # Slots are taken here, not in the workers, so a throttled model never ties up shared worker threads.
+            futures = []
+            try:
+                for batch in batches:
+                    limiter.acquire()
+                    futures.append(_batch_executor().submit(run, batch))
+                results = [f.result() for f in futures]
+            except Exception:
+                for f in futures:
+                    if f.cancel():
+                        limiter.release()
+                raise
+
+        out = [None] * len(texts)
+        total_tokens = 0
+        for batch, (embeddings, token_count) in zip(batches, results):
+            for i, embedding in zip(batch, embeddings):
+                out[i] = embedding
+            total_tokens += token_count
+        return np.array(out), total_tokens
+
     def encode_queries(self, text: str):
         raise NotImplementedError("Please implement encode method!")
 
@@ -71,18 +241,13 @@ class BuiltinEmbed(Base):
         self._max_tokens = BuiltinEmbed._max_tokens
 
     def encode(self, texts: list):
-        batch_size = 16
+        if not texts:
+            return None, 0
         # TEI is able to auto truncate inputs according to https://github.com/huggingface/text-embeddings-inference.
-        token_count = 0
-        ress = None
-        for i in range(0, len(texts), batch_size):
-            embeddings, token_count_delta = self._model.encode(texts[i : i + batch_size])
-            token_count += token_count_delta
-            if ress is None:
-                ress = embeddings
-            else:
-                ress = np.concatenate((ress, embeddings), axis=0)
-        return ress, token_count
+        return self._batched_encode(texts)
+
+    def _encode_batch(self, texts: list):
+        return self._model.encode(texts)
 
     def encode_queries(self, text: str):
         return self._model.encode_queries(text)
@@ -90,28 +255,25 @@ class BuiltinEmbed(Base):
 
 class OpenAIEmbed(Base):
     _FACTORY_NAME = "OpenAI"
+    _CONCURRENCY = 4
 
     def __init__(self, key, model_name="text-embedding-ada-002", base_url="https://api.openai.com/v1"):
         if not base_url:
             base_url = "https://api.openai.com/v1"
-        self.client = OpenAI(api_key=key, base_url=base_url)
+        self.client = OpenAI(api_key=key, base_url=base_url, http_client=get_pooled_client(base_url))
         self.model_name = model_name
 
     def encode(self, texts: list):
         # OpenAI requires batch size <=16
-        batch_size = 16
-        texts = [truncate(t, 8191) for t in texts]
-        ress = []
-        total_tokens = 0
-        for i in range(0, len(texts), batch_size):
-            res = self.client.embeddings.create(input=texts[i : i + batch_size], model=self.model_name, encoding_format="float", extra_body={"drop_params": True})
-            try:
-                ress.extend([d.embedding for d in res.data])
-                total_tokens += total_token_count_from_response(res)
-            except Exception as _e:
-                log_exception(_e, res)
-                raise Exception(f"Error: {res}")
-        return np.array(ress), total_tokens
+        return self._batched_encode([truncate(t, 8191) for t in texts])
+
+    def _encode_batch(self, texts: list):
+        res = self.client.embeddings.create(input=texts, model=self.model_name, encoding_format="float", extra_body={"drop_params": True})
+        try:
+            return [d.embedding for d in res.data], total_token_count_from_response(res)
+        except Exception as _e:
+            log_exception(_e, res)
+            raise Exception(f"Error: {res}")
 
     def encode_queries(self, text):
         res = self.client.embeddings.create(input=[truncate(text, 8191)], model=self.model_name, encoding_format="float",extra_body={"drop_params": True})
@@ -129,21 +291,21 @@ class LocalAIEmbed(Base):
         if not base_url:
             raise ValueError("Local embedding model url cannot be None")
         base_url = urljoin(base_url, "v1")
-        self.client = OpenAI(api_key="empty", base_url=base_url)
+        self.client = OpenAI(api_key="empty", base_url=base_url, http_client=get_pooled_client(base_url))
         self.model_name = model_name.split("___")[0]
 
     def encode(self, texts: list):
-        batch_size = 16
-        ress = []
-        for i in range(0, len(texts), batch_size):
-            res = self.client.embeddings.create(input=texts[i : i + batch_size], model=self.model_name)
-            try:
-                ress.extend([d.embedding for d in res.data])
-            except Exception as _e:
-                log_exception(_e, res)
-                raise Exception(f"Error: {res}")
+        embeddings, _ = self._batched_encode(texts)
         # local embedding for LmStudio donot count tokens
-        return np.array(ress), 1024
+        return embeddings, 1024
+
+    def _encode_batch(self, texts: list):
+        res = self.client.embeddings.create(input=texts, model=self.model_name)
+        try:
+            return [d.embedding for d in res.data], 0
+        except Exception as _e:
+            log_exception(_e, res)
+            raise Exception(f"Error: {res}")
 
     def encode_queries(self, text):
         embds, cnt = self.encode([text])
@@ -173,43 +335,37 @@ class BaiChuanEmbed(OpenAIEmbed):
 
 class QWenEmbed(Base):
     _FACTORY_NAME = "Tongyi-Qianwen"
+    _BATCH_SIZE = 4
+    _CONCURRENCY = 4
 
     def __init__(self, key, model_name="text_embedding_v2", **kwargs):
         self.key = key
         self.model_name = model_name
 
     def encode(self, texts: list):
-        import time
-
-        import dashscope
+        return self._batched_encode([truncate(t, 2048) for t in texts])
 
-        batch_size = 4
-        res = []
-        token_count = 0
-        texts = [truncate(t, 2048) for t in texts]
-        for i in range(0, len(texts), batch_size):
-            retry_max = 5
-            resp = dashscope.TextEmbedding.call(model=self.model_name, input=texts[i : i + batch_size], api_key=self.key, text_type="document")
-            while (resp["output"] is None or resp["output"].get("embeddings") is None) and retry_max > 0:
-                time.sleep(10)
-                resp = dashscope.TextEmbedding.call(model=self.model_name, input=texts[i : i + batch_size], api_key=self.key, text_type="document")
-                retry_max -= 1
-            if retry_max == 0 and (resp["output"] is None or resp["output"].get("embeddings") is None):
-                if resp.get("message"):
-                    log_exception(ValueError(f"Retry_max reached, calling embedding model failed: {resp['message']}"))
-                else:
-                    log_exception(ValueError("Retry_max reached, calling embedding model failed"))
-                raise
-            try:
-                embds = [[] for _ in range(len(resp["output"]["embeddings"]))]
-                for e in resp["output"]["embeddings"]:
-                    embds[e["text_index"]] = e["embedding"]
-                res.extend(embds)
-                token_count += total_token_count_from_response(resp)
-            except Exception as _e:
-                log_exception(_e, resp)
-                raise
-        return np.array(res), token_count
+    def _encode_batch(self, texts: list):
+        retry_max = 5
+        resp = dashscope.TextEmbedding.call(model=self.model_name, input=texts, api_key=self.key, text_type="document")
+        while (resp["output"] is None or resp["output"].get("embeddings") is None) and retry_max > 0:
+            time.sleep(10)
+            resp = dashscope.TextEmbedding.call(model=self.model_name, input=texts, api_key=self.key, text_type="document")
+            retry_max -= 1
+        if retry_max == 0 and (resp["output"] is None or resp["output"].get("embeddings") is None):
+            if resp.get("message"):
+                log_exception(ValueError(f"Retry_max reached, calling embedding model failed: {resp['message']}"))
+            else:
+                log_exception(ValueError("Retry_max reached, calling embedding model failed"))
+            raise
+        try:
+            embds = [[] for _ in range(len(resp["output"]["embeddings"]))]
+            for e in resp["output"]["embeddings"]:
+                embds[e["text_index"]] = e["embedding"]
+            return embds, total_token_count_from_response(resp)
+        except Exception as _e:
+            log_exception(_e, resp)
+            raise
 
     def encode_queries(self, text):
         resp = dashscope.TextEmbedding.call(model=self.model_name, input=text[:2048], api_key=self.key, text_type="query")
@@ -297,26 +453,24 @@ class OllamaEmbed(Base):
 
 class XinferenceEmbed(Base):
     _FACTORY_NAME = "Xinference"
+    _CONCURRENCY = 2
 
     def __init__(self, key, model_name="", base_url=""):
         base_url = urljoin(base_url, "v1")
-        self.client = OpenAI(api_key=key, base_url=base_url)
+        self.client = OpenAI(api_key=key, base_url=base_url, http_client=get_pooled_client(base_url))
         self.model_name = model_name
 
     def encode(self, texts: list):
-        batch_size = 16
-        ress = []
-        total_tokens = 0
-        for i in range(0, len(texts), batch_size):
-            res = None
-            try:
-                res = self.client.embeddings.create(input=texts[i : i + batch_size], model=self.model_name)
-                ress.extend([d.embedding for d in res.data])
-                total_tokens += total_token_count_from_response(res)
-            except Exception as _e:
-                log_exception(_e, res)
-                raise Exception(f"Error: {res}")
-        return np.array(ress), total_tokens
+        return self._batched_encode(texts)
+
+    def _encode_batch(self, texts: list):
+        res = None
+        try:
+            res = self.client.embeddings.create(input=texts, model=self.model_name)
+            return [d.embedding for d in res.data], total_token_count_from_response(res)
+        except Exception as _e:
+            log_exception(_e, res)
+            raise Exception(f"Error: {res}")
 
     def encode_queries(self, text):
         res = None
@@ -330,21 +484,17 @@ class XinferenceEmbed(Base):
 
 class YoudaoEmbed(Base):
     _FACTORY_NAME = "Youdao"
+    _BATCH_SIZE = 10
     _client = None
 
     def __init__(self, key=None, model_name="maidalun1020/bce-embedding-base_v1", **kwargs):
         pass
 
     def encode(self, texts: list):
-        batch_size = 10
-        res = []
-        token_count = 0
-        for t in texts:
-            token_count += num_tokens_from_string(t)
-        for i in range(0, len(texts), batch_size):
-            embds = YoudaoEmbed._client.encode(texts[i : i + batch_size])
-            res.extend(embds)
-        return np.array(res), token_count
+        return self._batched_encode(texts)
+
+    def _encode_batch(self, texts: list):
+        return list(YoudaoEmbed._client.encode(texts)), sum(num_tokens_from_string(t) for t in texts)
 
     def encode_queries(self, text):
         embds = YoudaoEmbed._client.encode([text])
@@ -353,6 +503,7 @@ class YoudaoEmbed(Base):
 
 class JinaMultiVecEmbed(Base):
     _FACTORY_NAME = "Jina"
+    _CONCURRENCY = 4
 
     def __init__(self, key, model_name="jina-embeddings-v4", base_url="https://api.jina.ai/v1/embeddings"):
         self.base_url = "https://api.jina.ai/v1/embeddings"
@@ -360,9 +511,10 @@ class JinaMultiVecEmbed(Base):
         self.model_name = model_name
 
     def encode(self, texts: list[str|bytes], task="retrieval.passage"):
-        batch_size = 16
+        return self._batched_encode(texts, lambda batch: self._encode_jina_batch(batch, task))
+
+    def _encode_jina_batch(self, texts: list[str|bytes], task: str):
         ress = []
-        token_count = 0
         input = []
         for text in texts:
             if isinstance(text, str):
@@ -375,34 +527,32 @@ class JinaMultiVecEmbed(Base):
                 except Exception:
                     img_b64s = base64.b64encode(text).decode('utf8')
                 input.append({"image": img_b64s})  # base64 encoded image
-        for i in range(0, len(texts), batch_size):
-            data = {"model": self.model_name, "input": input[i : i + batch_size]}
-            if "v4" in self.model_name:
-                data["return_multivector"] = True
+        data = {"model": self.model_name, "input": input}
+        if "v4" in self.model_name:
+            data["return_multivector"] = True
 
-            if "v3" in self.model_name or "v4" in self.model_name:
-                data['task'] = task
-                data['truncate'] = True
+        if "v3" in self.model_name or "v4" in self.model_name:
+            data['task'] = task
+            data['truncate'] = True
 
-            response = requests.post(self.base_url, headers=self.headers, json=data)
-            try:
-                res = response.json()
-                for d in res['data']:
-                    if data.get("return_multivector", False): # v4
-                        token_embs = np.asarray(d['embeddings'], dtype=np.float32)
-                        chunk_emb = token_embs.mean(axis=0)
+        response = pooled_request("POST", self.base_url, headers=self.headers, json=data)
+        try:
+            res = response.json()
+            for d in res['data']:
+                if data.get("return_multivector", False): # v4
+                    token_embs = np.asarray(d['embeddings'], dtype=np.float32)
+                    chunk_emb = token_embs.mean(axis=0)
 
-                    else:
-                        # v2/v3
-                        chunk_emb = np.asarray(d['embedding'], dtype=np.float32)
+                else:
+                    # v2/v3
+                    chunk_emb = np.asarray(d['embedding'], dtype=np.float32)
 
-                    ress.append(chunk_emb)
+                ress.append(chunk_emb)
 
-                token_count += total_token_count_from_response(res)
-            except Exception as _e:
-                log_exception(_e, response)
-                raise Exception(f"Error: {response}")
-        return np.array(ress), token_count
+            return ress, total_token_count_from_response(res)
+        except Exception as _e:
+            log_exception(_e, response)
+            raise Exception(f"Error: {response}")
 
     def encode_queries(self, text):
         embds, cnt = self.encode([text], task="retrieval.query")
@@ -542,25 +692,23 @@ class BedrockEmbed(Base):
 
 class GeminiEmbed(Base):
     _FACTORY_NAME = "Gemini"
+    _CONCURRENCY = 4
 
     def __init__(self, key, model_name="models/text-embedding-004", **kwargs):
         self.key = key
         self.model_name = "models/" + model_name
 
     def encode(self, texts: list):
-        texts = [truncate(t, 2048) for t in texts]
-        token_count = sum(num_tokens_from_string(text) for text in texts)
         genai.configure(api_key=self.key)
-        batch_size = 16
-        ress = []
-        for i in range(0, len(texts), batch_size):
-            result = genai.embed_content(model=self.model_name, content=texts[i : i + batch_size], task_type="retrieval_document", title="Embedding of single string")
-            try:
-                ress.extend(result["embedding"])
-            except Exception as _e:
-                log_exception(_e, result)
-                raise Exception(f"Error: {result}")
-        return np.array(ress), token_count
+        return self._batched_encode([truncate(t, 2048) for t in texts])
+
+    def _encode_batch(self, texts: list):
+        result = genai.embed_content(model=self.model_name, content=texts, task_type="retrieval_document", title="Embedding of single string")
+        try:
+            return result["embedding"], sum(num_tokens_from_string(text) for text in texts)
+        except Exception as _e:
+            log_exception(_e, result)
+            raise Exception(f"Error: {result}")
 
     def encode_queries(self, text):
         genai.configure(api_key=self.key)
@@ -575,6 +723,7 @@ class GeminiEmbed(Base):
 
 class NvidiaEmbed(Base):
     _FACTORY_NAME = "NVIDIA"
+    _CONCURRENCY = 4
 
     def __init__(self, key, model_name, base_url="https://integrate.api.nvidia.com/v1/embeddings"):
         if not base_url:
@@ -594,26 +743,23 @@ class NvidiaEmbed(Base):
             self.base_url = "https://ai.api.nvidia.com/v1/retrieval/snowflake/arctic-embed-l/embeddings"
 
     def encode(self, texts: list):
-        batch_size = 16
-        ress = []
-        token_count = 0
-        for i in range(0, len(texts), batch_size):
-            payload = {
-                "input": texts[i : i + batch_size],
-                "input_type": "query",
-                "model": self.model_name,
-                "encoding_format": "float",
-                "truncate": "END",
-            }
-            response = requests.post(self.base_url, headers=self.headers, json=payload)
-            try:
-                res = response.json()
-                ress.extend([d["embedding"] for d in res["data"]])
-                token_count += total_token_count_from_response(res)
-            except Exception as _e:
-                log_exception(_e, response)
-                raise Exception(f"Error: {response}")
-        return np.array(ress), token_count
+        return self._batched_encode(texts)
+
+    def _encode_batch(self, texts: list):
+        payload = {
+            "input": texts,
+            "input_type": "query",
+            "model": self.model_name,
+            "encoding_format": "float",
+            "truncate": "END",
+        }
+        response = pooled_request("POST", self.base_url, headers=self.headers, json=payload)
+        try:
+            res = response.json()
+            return [d["embedding"] for d in res["data"]], total_token_count_from_response(res)
+        except Exception as _e:
+            log_exception(_e, response)
+            raise Exception(f"Error: {response}")
 
     def encode_queries(self, text):
         embds, cnt = self.encode([text])
@@ -627,7 +773,7 @@ class LmStudioEmbed(LocalAIEmbed):
         if not base_url:
             raise ValueError("Local llm url cannot be None")
         base_url = urljoin(base_url, "v1")
-        self.client = OpenAI(api_key="lm-studio", base_url=base_url)
+        self.client = OpenAI(api_key="lm-studio", base_url=base_url, http_client=get_pooled_client(base_url))
         self.model_name = model_name
 
 
@@ -638,7 +784,7 @@ class OpenAI_APIEmbed(OpenAIEmbed):
         if not base_url:
             raise ValueError("url cannot be None")
         base_url = urljoin(base_url, "v1")
-        self.client = OpenAI(api_key=key, base_url=base_url)
+        self.client = OpenAI(api_key=key, base_url=base_url, http_client=get_pooled_client(base_url))
         self.model_name = model_name.split("___")[0]
 
 
@@ -713,6 +859,7 @@ class UpstageEmbed(OpenAIEmbed):
 
 class SILICONFLOWEmbed(Base):
     _FACTORY_NAME = "SILICONFLOW"
+    _CONCURRENCY = 4
 
     def __init__(self, key, model_name, base_url="https://api.siliconflow.cn/v1/embeddings"):
         if not base_url:
@@ -726,32 +873,26 @@ class SILICONFLOWEmbed(Base):
         self.model_name = model_name
 
     def encode(self, texts: list):
-        batch_size = 16
-        ress = []
-        token_count = 0
-        for i in range(0, len(texts), batch_size):
-            texts_batch = texts[i : i + batch_size]
-            if self.model_name in ["BAAI/bge-large-zh-v1.5", "BAAI/bge-large-en-v1.5"]:
-                # limit 512, 340 is almost safe
-                texts_batch = [" " if not text.strip() else truncate(text, 256) for text in texts_batch]
-            else:
-                texts_batch = [" " if not text.strip() else text for text in texts_batch]
-
-            payload = {
-                "model": self.model_name,
-                "input": texts_batch,
-                "encoding_format": "float",
-            }
-            response = requests.post(self.base_url, json=payload, headers=self.headers)
-            try:
-                res = response.json()
-                ress.extend([d["embedding"] for d in res["data"]])
-                token_count += total_token_count_from_response(res)
-            except Exception as _e:
-                log_exception(_e, response)
-                raise Exception(f"Error: {response}")
+        if self.model_name in ["BAAI/bge-large-zh-v1.5", "BAAI/bge-large-en-v1.5"]:
+            # limit 512, 340 is almost safe
+            texts = [" " if not text.strip() else truncate(text, 256) for text in texts]
+        else:
+            texts = [" " if not text.strip() else text for text in texts]
+        return self._batched_encode(texts)
 
-        return np.array(ress), token_count
+    def _encode_batch(self, texts: list):
+        payload = {
+            "model": self.model_name,
+            "input": texts,
+            "encoding_format": "float",
+        }
+        response = pooled_request("POST", self.base_url, json=payload, headers=self.headers)
+        try:
+            res = response.json()
+            return [d["embedding"] for d in res["data"]], total_token_count_from_response(res)
+        except Exception as _e:
+            log_exception(_e, response)
+            raise Exception(f"Error: {response}")
 
     def encode_queries(self, text):
         payload = {
@@ -759,7 +900,7 @@ class SILICONFLOWEmbed(Base):
             "input": text,
             "encoding_format": "float",
         }
-        response = requests.post(self.base_url, json=payload, headers=self.headers)
+        response = pooled_request("POST", self.base_url, json=payload, headers=self.headers)
         try:
             res = response.json()
             return np.array(res["data"][0]["embedding"]), total_token_count_from_response(res)
@@ -869,7 +1010,7 @@ class HuggingFaceEmbed(Base):
         self.base_url = base_url or "http://127.0.0.1:8080"
 
     def encode(self, texts: list):
-        response = requests.post(f"{self.base_url}/embed", json={"inputs": texts}, headers={"Content-Type": "application/json"})
+        response = pooled_request("POST", f"{self.base_url}/embed", json={"inputs": texts}, headers={"Content-Type": "application/json"})
         if response.status_code == 200:
             embeddings = response.json()
         else:
@@ -877,7 +1018,7 @@ class HuggingFaceEmbed(Base):
         return np.array(embeddings), sum([num_tokens_from_string(text) for text in texts])
 
     def encode_queries(self, text: str):
-        response = requests.post(f"{self.base_url}/embed", json={"inputs": text}, headers={"Content-Type": "application/json"})
+        response = pooled_request("POST", f"{self.base_url}/embed", json={"inputs": text}, headers={"Content-Type": "application/json"})
         if response.status_code == 200:
             embedding = response.json()[0]
             return np.array(embedding), num_tokens_from_string(text)
@@ -922,8 +1063,6 @@ class VolcEngineEmbed(Base):
         return item["embedding"]
 
     def _encode_texts(self, texts: list[str]):
-        from common.http_client import sync_request
-
         url = f"{self.base_url}/embeddings/multimodal"
         headers = {"Content-Type": "application/json", "Authorization": f"Bearer {self.ark_api_key}"}
 
@@ -931,7 +1070,7 @@ class VolcEngineEmbed(Base):
         total_tokens = 0
         for text in texts:
             request_body = {"model": self.model_name, "input": [{"type": "text", "text": text}]}
-            response = sync_request(method="POST", url=url, headers=headers, json=request_body, timeout=60)
+            response = pooled_request("POST", url, headers=headers, json=request_body, timeout=60)
             if response.status_code != 200:
                 raise Exception(f"Error: {response.status_code} - {response.text}")
             result = response.json()
@@ -959,7 +1098,7 @@ class GPUStackEmbed(OpenAIEmbed):
             raise ValueError("url cannot be None")
         base_url = urljoin(base_url, "v1")
 
-        self.client = OpenAI(api_key=key, base_url=base_url)
+        self.client = OpenAI(api_key=key, base_url=base_url, http_client=get_pooled_client(base_url))
         self.model_name = model_name
 
 
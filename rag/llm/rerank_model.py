@@ -14,18 +14,28 @@
 #  limitations under the License.
 #
 import json
+import os
 from abc import ABC
 from urllib.parse import urljoin
 
 import httpx
 import numpy as np
-import requests
+import xxhash
 from yarl import URL
 
+from common.http_client import pooled_request
 from common.log_utils import log_exception
 from common.token_utils import num_tokens_from_string, truncate, total_token_count_from_response
+from rag.utils.redis_conn import REDIS_CONN
+
+# Seconds a (model, query, text) rerank score is reused; 0 disables the cache.
+RERANK_CACHE_TTL = int(os.environ.get("RERANK_CACHE_TTL", 3600))
+
 
 class Base(ABC):
+    # Scores min-max normalized over the candidate list depend on the other candidates and must not be cached.
+    _CACHE_SCORES = True
+
     def __init__(self, key, model_name, **kwargs):
         """
         Abstract base class constructor.
@@ -36,6 +46,50 @@ class Base(ABC):
     def similarity(self, query: str, texts: list):
         raise NotImplementedError("Please implement encode method!")
 
+    def _score_cache_key(self, query: str) -> str:
+        hasher = xxhash.xxh64()
+        for v in [type(self).__name__, getattr(self, "model_name", ""), getattr(self, "base_url", ""), query]:
+            hasher.update(str(v).encode("utf-8"))
+            hasher.update(b"\0")
+        return f"rerank_score:{hasher.hexdigest()}"
+
+    def cached_similarity(self, query: str, texts: list):
+        """
+        `similarity` with identical texts scored once and scores cached per (model, query, text)
+        for RERANK_CACHE_TTL seconds. Only the misses reach the provider, so the returned
+        token count covers just those.
+        """
+        if not texts:
+            return self.similarity(query, texts)
+        unique, index, inverse = [], {}, []
+        for t in texts:
+            if t not in index:
+                index[t] = len(unique)
+                unique.append(t)
+            inverse.append(index[t])
+
+        scores = np.zeros(len(unique), dtype=float)
+        missing = list(range(len(unique)))
+        cache_key, fields = None, None
+        if self._CACHE_SCORES and RERANK_CACHE_TTL > 0:
+            cache_key = self._score_cache_key(query)
+            fields = [xxhash.xxh64(t.encode("utf-8")).hexdigest() for t in unique]
+            cached = REDIS_CONN.hmget(cache_key, fields)
+            missing = [i for i, v in enumerate(cached) if v is None]
+            for i, v in enumerate(cached):
+                if v is not None:
+                    scores[i] = float(v)
+
+        token_count = 0
+        if missing:
+            sim, token_count = self.similarity(query, [unique[i] for i in missing])
+            sim = np.asarray(sim, dtype=float)
+            scores[missing] = sim
+            # Providers log and return all zeros on a failed call; never cache that.
+            if cache_key and np.any(sim):
+                REDIS_CONN.hmset(cache_key, {fields[i]: repr(float(s)) for i, s in zip(missing, sim)}, RERANK_CACHE_TTL)
+        return scores[inverse], token_count
+
     @staticmethod
     def _normalize_rank(rank: np.ndarray) -> np.ndarray:
         """
@@ -64,7 +118,7 @@ class JinaRerank(Base):
     def similarity(self, query: str, texts: list):
         texts = [truncate(t, 8196) for t in texts]
         data = {"model": self.model_name, "query": query, "documents": texts, "top_n": len(texts)}
-        res = requests.post(self.base_url, headers=self.headers, json=data).json()
+        res = pooled_request("POST", self.base_url, headers=self.headers, json=data).json()
         rank = np.zeros(len(texts), dtype=float)
         try:
             for d in res["results"]:
@@ -96,7 +150,7 @@ class XInferenceRerank(Base):
         for _, t in pairs:
             token_count += num_tokens_from_string(t)
         data = {"model": self.model_name, "query": query, "return_documents": "true", "return_len": "true", "documents": texts}
-        res = requests.post(self.base_url, headers=self.headers, json=data).json()
+        res = pooled_request("POST", self.base_url, headers=self.headers, json=data).json()
         rank = np.zeros(len(texts), dtype=float)
         try:
             for d in res["results"]:
@@ -108,6 +162,7 @@ class XInferenceRerank(Base):
 
 class LocalAIRerank(Base):
     _FACTORY_NAME = "LocalAI"
+    _CACHE_SCORES = False
 
     def __init__(self, key, model_name, base_url):
         if base_url.find("/rerank") == -1:
@@ -129,7 +184,7 @@ class LocalAIRerank(Base):
         token_count = 0
         for t in texts:
             token_count += num_tokens_from_string(t)
-        res = requests.post(self.base_url, headers=self.headers, json=data).json()
+        res = pooled_request("POST", self.base_url, headers=self.headers, json=data).json()
         rank = np.zeros(len(texts), dtype=float)
         try:
             for d in res["results"]:
@@ -172,7 +227,7 @@ class NvidiaRerank(Base):
             "truncate": "END",
             "top_n": len(texts),
         }
-        res = requests.post(self.base_url, headers=self.headers, json=data).json()
+        res = pooled_request("POST", self.base_url, headers=self.headers, json=data).json()
         rank = np.zeros(len(texts), dtype=float)
         try:
             for d in res["rankings"]:
@@ -194,6 +249,7 @@ class LmStudioRerank(Base):
 
 class OpenAI_APIRerank(Base):
     _FACTORY_NAME = "OpenAI-API-Compatible"
+    _CACHE_SCORES = False
 
     def __init__(self, key, model_name, base_url):
         normalized_base_url = (base_url or "").strip()
@@ -216,7 +272,7 @@ class OpenAI_APIRerank(Base):
         token_count = 0
         for t in texts:
             token_count += num_tokens_from_string(t)
-        res = requests.post(self.base_url, headers=self.headers, json=data).json()
+        res = pooled_request("POST", self.base_url, headers=self.headers, json=data).json()
         rank = np.zeros(len(texts), dtype=float)
         try:
             for d in res["results"]:
@@ -294,7 +350,7 @@ class SILICONFLOWRerank(Base):
             "max_chunks_per_doc": 1024,
             "overlap_tokens": 80,
         }
-        response = requests.post(self.base_url, json=payload, headers=self.headers).json()
+        response = pooled_request("POST", self.base_url, json=payload, headers=self.headers).json()
         rank = np.zeros(len(texts), dtype=float)
         try:
             for d in response["results"]:
@@ -395,8 +451,8 @@ class HuggingfaceRerank(Base):
         batch_size = 8
         for i in range(0, len(texts), batch_size):
             try:
-                res = requests.post(
-                    f"http://{url}/rerank", headers={"Content-Type": "application/json"}, json={"query": query, "texts": texts[i : i + batch_size], "raw_scores": False, "truncate": True}
+                res = pooled_request(
+                    "POST", f"http://{url}/rerank", headers={"Content-Type": "application/json"}, json={"query": query, "texts": texts[i : i + batch_size], "raw_scores": False, "truncate": True}
                 )
 
                 for o in res.json():
@@ -445,7 +501,7 @@ class GPUStackRerank(Base):
         }
 
         try:
-            response = requests.post(self.base_url, json=payload, headers=self.headers)
+            response = pooled_request("POST", self.base_url, json=payload, headers=self.headers)
             response.raise_for_status()
             response_json = response.json()
 
@@ -15,10 +15,12 @@
 #
 
 import logging
+import os
 import random
 from collections import Counter, defaultdict
 
-from common.token_utils import num_tokens_from_string
+from common.misc_utils import once
+from common.token_utils import num_tokens_from_string, num_tokens_from_strings
 import re
 import copy
 import roman_numbers as r
@@ -30,6 +32,11 @@ import chardet
 
 __all__ = ['rag_tokenizer']
 
+# Worker processes used to tokenize the chunks of large documents; 0 tokenizes in the caller.
+TOKENIZE_PROCESSES = int(os.environ.get("TOKENIZE_PROCESSES", "0"))
+TOKENIZE_PARALLEL_MIN = int(os.environ.get("TOKENIZE_PARALLEL_MIN", "512"))
+TOKENIZE_PARALLEL_BATCH = 128
+
 all_codecs = [
     'utf-8', 'gb2312', 'gbk', 'utf_16', 'ascii', 'big5', 'big5hkscs',
     'cp037', 'cp273', 'cp424', 'cp437',
@@ -273,7 +280,61 @@ def tokenize(d, txt, eng):
     d["content_sm_ltks"] = rag_tokenizer.fine_grained_tokenize(d["content_ltks"])
 
 
-def split_with_pattern(d, pattern: str, content: str, eng) -> list:
+def _tokenize_texts(txts: list[str]) -> list[tuple[str, str]]:
+    from . import rag_tokenizer
+    res = []
+    for txt in txts:
+        ltks = rag_tokenizer.tokenize(re.sub(r"</?(table|td|caption|tr|th)( [^<>]{0,12})?>", " ", txt))
+        res.append((ltks, rag_tokenizer.fine_grained_tokenize(ltks)))
+    return res
+
+
+@once
+def _tokenize_pool():
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    return ProcessPoolExecutor(TOKENIZE_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+
+
+def tokenize_docs(docs: list[dict]):
+    """
+    `tokenize` every doc on its content_with_weight, in place. With TOKENIZE_PROCESSES set,
+    documents of at least TOKENIZE_PARALLEL_MIN chunks are tokenized across worker processes.
+    """
+    from common import settings
+    txts = [d["content_with_weight"] for d in docs]
+    if TOKENIZE_PROCESSES > 0 and len(txts) >= TOKENIZE_PARALLEL_MIN and not settings.DOC_ENGINE_INFINITY:
+        batches = [txts[i:i + TOKENIZE_PARALLEL_BATCH] for i in range(0, len(txts), TOKENIZE_PARALLEL_BATCH)]
+        tks = [r for res in _tokenize_pool().map(_tokenize_texts, batches) for r in res]
+    else:
+        tks = _tokenize_texts(txts)
+    for d, (ltks, sm_ltks) in zip(docs, tks):
+        d["content_ltks"] = ltks
+        d["content_sm_ltks"] = sm_ltks
+
+
+def doc_copier(doc: dict):
+    """
+    Returns a function making a copy of `doc` per chunk. Strings and numbers are shared,
+    only container or object values are deep-copied, so the usual docnm/title template
+    costs a dict copy per chunk instead of a deepcopy.
+    """
+    mutable = [k for k, v in doc.items() if not isinstance(v, (str, int, float, bool, bytes, type(None)))]
+    if not mutable:
+        return doc.copy
+
+    def copy_doc():
+        d = doc.copy()
+        for k in mutable:
+            d[k] = copy.deepcopy(doc[k])
+        return d
+
+    return copy_doc
+
+
+def _split_with_pattern(d, pattern: str, content: str) -> list:
+    """`split_with_pattern` without tokenizing: the pieces only get content_with_weight."""
+    new_doc = doc_copier(d)
     docs = []
 
     # Validate and compile regex pattern before use
@@ -282,8 +343,8 @@ def split_with_pattern(d, pattern: str, content: str, eng) -> list:
     except re.error as e:
         logging.warning(f"Invalid delimiter regex pattern '{pattern}': {e}. Falling back to no split.")
         # Fallback: return content as single chunk
-        dd = copy.deepcopy(d)
-        tokenize(dd, content, eng)
+        dd = new_doc()
+        dd["content_with_weight"] = content
         return [dd]
 
     txts = [txt for txt in compiled_pattern.split(content)]
@@ -293,20 +354,27 @@ def split_with_pattern(d, pattern: str, content: str, eng) -> list:
             continue
         if j + 1 < len(txts):
             txt += txts[j + 1]
-        dd = copy.deepcopy(d)
-        tokenize(dd, txt, eng)
+        dd = new_doc()
+        dd["content_with_weight"] = txt
         docs.append(dd)
     return docs
 
 
+def split_with_pattern(d, pattern: str, content: str, eng) -> list:
+    docs = _split_with_pattern(d, pattern, content)
+    tokenize_docs(docs)
+    return docs
+
+
 def tokenize_chunks(chunks, doc, eng, pdf_parser=None, child_delimiters_pattern=None):
     res = []
+    new_doc = doc_copier(doc)
     # wrap up as es documents
     for ii, ck in enumerate(chunks):
         if len(ck.strip()) == 0:
             continue
         logging.debug("-- {}".format(ck))
-        d = copy.deepcopy(doc)
+        d = new_doc()
         if pdf_parser:
             try:
                 d["image"], poss = pdf_parser.crop(ck, need_position=True)
@@ -319,22 +387,24 @@ def tokenize_chunks(chunks, doc, eng, pdf_parser=None, child_delimiters_pattern=
 
         if child_delimiters_pattern:
             d["mom_with_weight"] = ck
-            res.extend(split_with_pattern(d, child_delimiters_pattern, ck, eng))
+            res.extend(_split_with_pattern(d, child_delimiters_pattern, ck))
             continue
 
-        tokenize(d, ck, eng)
+        d["content_with_weight"] = ck
         res.append(d)
+    tokenize_docs(res)
     return res
 
 
 def doc_tokenize_chunks_with_images(chunks, doc, eng, child_delimiters_pattern=None, batch_size=10):
     res = []
+    new_doc = doc_copier(doc)
     for ii, ck in enumerate(chunks):
         text = ck.get("context_above", "") + ck.get("text") + ck.get("context_below", "")
         if len(text.strip()) == 0:
             continue
         logging.debug("-- {}".format(ck))
-        d = copy.deepcopy(doc)
+        d = new_doc()
         if ck.get("image"):
             d["image"] = ck.get("image")
         add_positions(d, [[ii] * 5])
@@ -342,44 +412,48 @@ def doc_tokenize_chunks_with_images(chunks, doc, eng, child_delimiters_pattern=N
         if ck.get("ck_type") == "text":
             if child_delimiters_pattern:
                 d["mom_with_weight"] = text
-                res.extend(split_with_pattern(d, child_delimiters_pattern, text, eng))
+                res.extend(_split_with_pattern(d, child_delimiters_pattern, text))
                 continue
         elif ck.get("ck_type") == "image":
             d["doc_type_kwd"] = "image"
         elif ck.get("ck_type") == "table":
             d["doc_type_kwd"] = "table"
-        tokenize(d, text, eng)
+        d["content_with_weight"] = text
         res.append(d)
+    tokenize_docs(res)
     return res
 
 
 def tokenize_chunks_with_images(chunks, doc, eng, images, child_delimiters_pattern=None):
     res = []
+    new_doc = doc_copier(doc)
     # wrap up as es documents
     for ii, (ck, image) in enumerate(zip(chunks, images)):
         if len(ck.strip()) == 0:
             continue
         logging.debug("-- {}".format(ck))
-        d = copy.deepcopy(doc)
+        d = new_doc()
         d["image"] = image
         add_positions(d, [[ii] * 5])
         if child_delimiters_pattern:
             d["mom_with_weight"] = ck
-            res.extend(split_with_pattern(d, child_delimiters_pattern, ck, eng))
+            res.extend(_split_with_pattern(d, child_delimiters_pattern, ck))
             continue
-        tokenize(d, ck, eng)
+        d["content_with_weight"] = ck
         res.append(d)
+    tokenize_docs(res)
     return res
 
 
 def tokenize_table(tbls, doc, eng, batch_size=10):
     res = []
+    new_doc = doc_copier(doc)
     # add tables
     for (img, rows), poss in tbls:
         if not rows:
             continue
         if isinstance(rows, str):
-            d = copy.deepcopy(doc)
+            d = new_doc()
             tokenize(d, rows, eng)
             d["content_with_weight"] = rows
             d["doc_type_kwd"] = "table"
@@ -393,7 +467,7 @@ def tokenize_table(tbls, doc, eng, batch_size=10):
             continue
         de = "; " if eng else "； "
         for i in range(0, len(rows), batch_size):
-            d = copy.deepcopy(doc)
+            d = new_doc()
             r = de.join(rows[i:i + batch_size])
             tokenize(d, r, eng)
             d["doc_type_kwd"] = "table"
@@ -1067,44 +1141,93 @@ def hierarchical_merge(bull, sections, depth):
     return res
 
 
-def naive_merge(sections: str | list, chunk_token_num=128, delimiter="\n。；！？", overlapped_percent=0):
+_POSITION_TAG = re.compile(r"@@[\t0-9.-]+?##")
+
+
+class _ChunkBuffer:
+    """
+    A chunk being assembled by `_merge_sections`. The text is kept as a list of parts and
+    the position tags it contains as a set, so growing the chunk never copies its text
+    and looking up a tag does not rescan it.
+    """
+
+    __slots__ = ("parts", "tokens", "tags")
+
+    def __init__(self):
+        self.parts = []
+        self.tokens = 0
+        self.tags = set()
+
+    def add(self, text: str, tokens: int, pos: str = "", is_tag: bool = False):
+        """Append a section's text and, if given, the position string that follows it."""
+        self.parts.append(text)
+        self.tokens += tokens
+        if "@@" in text:
+            self.tags.update(_POSITION_TAG.findall(text))
+        if pos:
+            self.parts.append(pos)
+            if is_tag:
+                self.tags.add(pos)
+            else:
+                self.tags.update(_POSITION_TAG.findall(pos))
+
+    def contains(self, s: str, is_tag: bool) -> bool:
+        """Whether `s` is in the text; `is_tag` says `s` is a whole position tag."""
+        if not s:
+            return True
+        if s in self.tags:
+            return True
+        return not is_tag and s in self.text()
+
+    def text(self) -> str:
+        if len(self.parts) > 1:
+            self.parts = ["".join(self.parts)]
+        return self.parts[0] if self.parts else ""
+
+
+def _merge_sections(texts: list[str], poss: list[str], chunk_token_num, overlapped_percent):
+    """
+    Pack consecutive sections into chunks of about `chunk_token_num` tokens, carrying
+    `overlapped_percent` of the previous chunk's text into the next one. Returns the chunks,
+    led by an empty one, and the index of the chunk every section went into. Token counts
+    of all sections are taken in one batch up front.
+    """
     from deepdoc.parser.pdf_parser import RAGFlowPdfParser
+    limit = chunk_token_num * (100 - overlapped_percent) / 100.
+    chunks = [_ChunkBuffer()]
+    owners = []
+    for t, pos, tnum in zip(texts, poss, num_tokens_from_strings(texts)):
+        if not pos or tnum < 8:
+            pos = ""
+        is_tag = bool(pos) and _POSITION_TAG.fullmatch(pos) is not None
+        last = chunks[-1]
+        # Ensure that the length of the merged chunk does not exceed chunk_token_num
+        if not last.parts or last.tokens > limit:
+            if overlapped_percent:
+                overlapped = RAGFlowPdfParser.remove_tag(last.text())
+                t = overlapped[int(len(overlapped) * (100 - overlapped_percent) / 100.):] + t
+            last = _ChunkBuffer()
+            chunks.append(last)
+            last.add(t, tnum, pos if t.find(pos) < 0 else "", is_tag)
+        else:
+            last.add(t, tnum, "" if last.contains(pos, is_tag) else pos, is_tag)
+        owners.append(len(chunks) - 1)
+    return chunks, owners
+
+
+def naive_merge(sections: str | list, chunk_token_num=128, delimiter="\n。；！？", overlapped_percent=0):
     if not sections:
         return []
     if isinstance(sections, str):
         sections = [sections]
     if isinstance(sections[0], str):
         sections = [(s, "") for s in sections]
-    cks = [""]
-    tk_nums = [0]
-
-    def add_chunk(t, pos):
-        nonlocal cks, tk_nums, delimiter
-        tnum = num_tokens_from_string(t)
-        if not pos:
-            pos = ""
-        if tnum < 8:
-            pos = ""
-        # Ensure that the length of the merged chunk does not exceed chunk_token_num
-        if cks[-1] == "" or tk_nums[-1] > chunk_token_num * (100 - overlapped_percent) / 100.:
-            if cks:
-                overlapped = RAGFlowPdfParser.remove_tag(cks[-1])
-                t = overlapped[int(len(overlapped) * (100 - overlapped_percent) / 100.):] + t
-            if t.find(pos) < 0:
-                t += pos
-            cks.append(t)
-            tk_nums.append(tnum)
-        else:
-            if cks[-1].find(pos) < 0:
-                t += pos
-            cks[-1] += t
-            tk_nums[-1] += tnum
 
     custom_delimiters = [m.group(1) for m in re.finditer(r"`([^`]+)`", delimiter)]
     has_custom = bool(custom_delimiters)
     if has_custom:
         custom_pattern = "|".join(re.escape(t) for t in sorted(set(custom_delimiters), key=len, reverse=True))
-        cks, tk_nums = [], []
+        cks = []
         for sec, pos in sections:
             split_sec = re.split(r"(%s)" % custom_pattern, sec, flags=re.DOTALL)
             for sub_sec in split_sec:
@@ -1117,55 +1240,22 @@ def naive_merge(sections: str | list, chunk_token_num=128, delimiter="\n。；
                 if local_pos and text.find(local_pos) < 0:
                     text += local_pos
                 cks.append(text)
-                tk_nums.append(num_tokens_from_string(text))
         return cks
 
-    for sec, pos in sections:
-        add_chunk("\n" + sec, pos)
-
-    return cks
+    texts = ["\n" + sec for sec, _ in sections]
+    chunks, _ = _merge_sections(texts, [pos for _, pos in sections], chunk_token_num, overlapped_percent)
+    return [ck.text() for ck in chunks]
 
 
 def naive_merge_with_images(texts, images, chunk_token_num=128, delimiter="\n。；！？", overlapped_percent=0):
-    from deepdoc.parser.pdf_parser import RAGFlowPdfParser
     if not texts or len(texts) != len(images):
         return [], []
-    cks = [""]
-    result_images = [None]
-    tk_nums = [0]
-
-    def add_chunk(t, image, pos=""):
-        nonlocal cks, result_images, tk_nums, delimiter
-        tnum = num_tokens_from_string(t)
-        if not pos:
-            pos = ""
-        if tnum < 8:
-            pos = ""
-        # Ensure that the length of the merged chunk does not exceed chunk_token_num
-        if cks[-1] == "" or tk_nums[-1] > chunk_token_num * (100 - overlapped_percent) / 100.:
-            if cks:
-                overlapped = RAGFlowPdfParser.remove_tag(cks[-1])
-                t = overlapped[int(len(overlapped) * (100 - overlapped_percent) / 100.):] + t
-            if t.find(pos) < 0:
-                t += pos
-            cks.append(t)
-            result_images.append(image)
-            tk_nums.append(tnum)
-        else:
-            if cks[-1].find(pos) < 0:
-                t += pos
-            cks[-1] += t
-            if result_images[-1] is None:
-                result_images[-1] = image
-            else:
-                result_images[-1] = concat_img(result_images[-1], image)
-            tk_nums[-1] += tnum
 
     custom_delimiters = [m.group(1) for m in re.finditer(r"`([^`]+)`", delimiter)]
     has_custom = bool(custom_delimiters)
     if has_custom:
         custom_pattern = "|".join(re.escape(t) for t in sorted(set(custom_delimiters), key=len, reverse=True))
-        cks, result_images, tk_nums = [], [], []
+        cks, result_images = [], []
         for text, image in zip(texts, images):
             text_str = text[0] if isinstance(text, tuple) else text
             if text_str is None:
@@ -1183,19 +1273,30 @@ def naive_merge_with_images(texts, images, chunk_token_num=128, delimiter="\n。
                     text_seg += local_pos
                 cks.append(text_seg)
                 result_images.append(image)
-                tk_nums.append(num_tokens_from_string(text_seg))
         return cks, result_images
 
-    for text, image in zip(texts, images):
+    secs, poss = [], []
+    for text in texts:
         # if text is tuple, unpack it
         if isinstance(text, tuple):
-            text_str = text[0] if text[0] is not None else ""
-            text_pos = text[1] if len(text) > 1 else ""
-            add_chunk("\n" + text_str, image, text_pos)
+            secs.append("\n" + (text[0] if text[0] is not None else ""))
+            poss.append(text[1] if len(text) > 1 else "")
         else:
-            add_chunk("\n" + (text or ""), image)
-
-    return cks, result_images
+            secs.append("\n" + (text or ""))
+            poss.append("")
+    chunks, owners = _merge_sections(secs, poss, chunk_token_num, overlapped_percent)
+
+    result_images = [None] * len(chunks)
+    prev = 0
+    for image, i in zip(images, owners):
+        if i != prev:
+            prev = i
+            result_images[i] = image
+        elif result_images[i] is None:
+            result_images[i] = image
+        else:
+            result_images[i] = concat_img(result_images[i], image)
+    return [ck.text() for ck in chunks], result_images
 
 
 def docx_question_level(p, bull=-1):
@@ -0,0 +1,132 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Benchmark of chunk assembly: `naive_merge` and `tokenize_chunks` against the previous
+string-concatenating / deepcopying implementations kept below. Every run asserts that
+both produce identical chunks.
+
+    python -m rag.nlp.merge_benchmark --pages 2000 --processes 4
+"""
+
+import copy
+import random
+import time
+
+from common.token_utils import num_tokens_from_string
+from rag.nlp import add_positions, naive_merge, tokenize, tokenize_chunks
+
+
+def naive_merge_reference(sections, chunk_token_num=128, overlapped_percent=0):
+    from deepdoc.parser.pdf_parser import RAGFlowPdfParser
+    cks = [""]
+    tk_nums = [0]
+
+    def add_chunk(t, pos):
+        tnum = num_tokens_from_string(t)
+        if not pos:
+            pos = ""
+        if tnum < 8:
+            pos = ""
+        if cks[-1] == "" or tk_nums[-1] > chunk_token_num * (100 - overlapped_percent) / 100.:
+            if cks:
+                overlapped = RAGFlowPdfParser.remove_tag(cks[-1])
+                t = overlapped[int(len(overlapped) * (100 - overlapped_percent) / 100.):] + t
+            if t.find(pos) < 0:
+                t += pos
+            cks.append(t)
+            tk_nums.append(tnum)
+        else:
+            if cks[-1].find(pos) < 0:
+                t += pos
+            cks[-1] += t
+            tk_nums[-1] += tnum
+
+    for sec, pos in sections:
+        add_chunk("\n" + sec, pos)
+    return cks
+
+
+def tokenize_chunks_reference(chunks, doc, eng):
+    res = []
+    for ii, ck in enumerate(chunks):
+        if len(ck.strip()) == 0:
+            continue
+        d = copy.deepcopy(doc)
+        add_positions(d, [[ii] * 5])
+        tokenize(d, ck, eng)
+        res.append(d)
+    return res
+
+
+def pdf_like_sections(pages: int, seed: int = 0) -> list[tuple[str, str]]:
+    """Text lines with the position tags the PDF parser attaches, ~40 lines a page."""
+    rnd = random.Random(seed)
+    words = ("the model layer data system table figure result value retrieval index chunk "
+             "检索 模型 数据 表格 结果").split()
+    sections = []
+    for page in range(1, pages + 1):
+        for line in range(40):
+            text = " ".join(rnd.choices(words, k=rnd.randint(3, 30)))
+            x0 = rnd.uniform(40, 300)
+            tag = "@@{}\t{:.1f}\t{:.1f}\t{:.1f}\t{:.1f}##".format(page, x0, x0 + 250, line * 18.0, line * 18.0 + 12)
+            sections.append((text, tag))
+    return sections
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import rag.nlp as nlp
+
+    parser = argparse.ArgumentParser(description="Compare chunk assembly against the previous implementation.")
+    parser.add_argument("--pages", type=int, default=500, help="Pages of the synthetic PDF")
+    parser.add_argument("--chunk-tokens", default="128,512,2048,8192")
+    parser.add_argument("--overlap", default="0,20", help="Comma separated overlapped_percent values")
+    parser.add_argument("--processes", type=int, default=0, help="Also tokenize across this many worker processes")
+    args = parser.parse_args()
+
+    def timed(fn):
+        st = time.perf_counter()
+        res = fn()
+        return res, time.perf_counter() - st
+
+    sections = pdf_like_sections(args.pages)
+    print(f"{len(sections)} sections from {args.pages} pages")
+    print(f"{'tokens':>7} {'overlap':>7} {'chunks':>7} {'before(s)':>10} {'after(s)':>9} {'speedup':>8}")
+    for n in [int(x) for x in args.chunk_tokens.split(",")]:
+        for op in [int(x) for x in args.overlap.split(",")]:
+            # Count every section once first so neither side is timed on a cold token-count cache.
+            naive_merge(sections, n, overlapped_percent=op)
+            old, t_old = timed(lambda: naive_merge_reference(sections, n, op))
+            new, t_new = timed(lambda: naive_merge(sections, n, overlapped_percent=op))
+            assert old == new, f"naive_merge differs at chunk_token_num={n}, overlapped_percent={op}"
+            print(f"{n:>7} {op:>7} {len(new):>7} {t_old:>10.3f} {t_new:>9.3f} {t_old / max(t_new, 1e-9):>7.1f}x")
+
+    from deepdoc.parser.pdf_parser import RAGFlowPdfParser
+    chunks = [RAGFlowPdfParser.remove_tag(c) for c in naive_merge(sections, 512)]
+    doc = {"docnm_kwd": "manual.pdf", "title_tks": "manual", "title_sm_tks": "manual"}
+    old, t_old = timed(lambda: tokenize_chunks_reference(chunks, doc, True))
+    new, t_new = timed(lambda: tokenize_chunks(chunks, doc, True))
+    assert old == new, "tokenize_chunks differs"
+    print(f"tokenize_chunks x{len(new)}: before {t_old:.3f}s, after {t_new:.3f}s, {t_old / max(t_new, 1e-9):.1f}x")
+
+    if args.processes > 0:
+        nlp.TOKENIZE_PROCESSES = args.processes
+        nlp.TOKENIZE_PARALLEL_MIN = 1
+        nlp._tokenize_pool().submit(nlp._tokenize_texts, ["warm up"]).result()
+        par, t_par = timed(lambda: tokenize_chunks(chunks, doc, True))
+        assert par == old, "tokenize_chunks across processes differs"
+        print(f"tokenize_chunks x{len(par)} on {args.processes} processes: {t_par:.3f}s, {t_old / max(t_par, 1e-9):.1f}x")
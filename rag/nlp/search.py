@@ -402,7 +402,9 @@ class Dealer:
                            rank_feature=rank_feature)
 
         if rerank_mdl and sres.total > 0:
-            sim, tsim, vsim = self.rerank_by_model(
+            # The rerank model is a blocking HTTP call; keep it off the event loop.
+            sim, tsim, vsim = await thread_pool_exec(
+                self.rerank_by_model,
                 rerank_mdl,
                 sres,
                 question,
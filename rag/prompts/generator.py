@@ -164,6 +164,7 @@ CROSS_LANGUAGES_USER_PROMPT_TEMPLATE = load_prompt("cross_languages_user_prompt"
 FULL_QUESTION_PROMPT_TEMPLATE = load_prompt("full_question_prompt")
 KEYWORD_PROMPT_TEMPLATE = load_prompt("keyword_prompt")
 QUESTION_PROMPT_TEMPLATE = load_prompt("question_prompt")
+KEYWORD_QUESTION_PROMPT_TEMPLATE = load_prompt("keyword_question_prompt")
 VISION_LLM_DESCRIBE_PROMPT = load_prompt("vision_llm_describe_prompt")
 VISION_LLM_FIGURE_DESCRIBE_PROMPT = load_prompt("vision_llm_figure_describe_prompt")
 VISION_LLM_FIGURE_DESCRIBE_PROMPT_WITH_CONTEXT = load_prompt("vision_llm_figure_describe_prompt_with_context")
@@ -221,6 +222,35 @@ async def question_proposal(chat_mdl, content, topn=3):
     return kwd
 
 
+async def keyword_question_proposal(chat_mdl, content, keyword_topn=3, question_topn=3):
+    """
+    Keywords and questions of one piece of content in a single call. Returns (keywords, questions)
+    formatted like `keyword_extraction` and `question_proposal`, or None if the answer is unusable.
+    """
+    template = PROMPT_JINJA_ENV.from_string(KEYWORD_QUESTION_PROMPT_TEMPLATE)
+    rendered_prompt = template.render(content=content, keyword_topn=keyword_topn, question_topn=question_topn)
+
+    msg = [{"role": "system", "content": rendered_prompt}, {"role": "user", "content": "Output: "}]
+    _, msg = message_fit_in(msg, chat_mdl.max_length)
+    ans = await chat_mdl.async_chat(rendered_prompt, msg[1:], {"temperature": 0.2})
+    if isinstance(ans, tuple):
+        ans = ans[0]
+    ans = re.sub(r"(^.*</think>|```json\n|```\n*$)", "", ans, flags=re.DOTALL)
+    if ans.find("**ERROR**") >= 0:
+        return None
+    try:
+        obj = json_repair.loads(ans)
+    except Exception:
+        return None
+    if not isinstance(obj, dict) or not isinstance(obj.get("keywords"), list) or not isinstance(obj.get("questions"), list):
+        return None
+    keywords = [str(k).strip() for k in obj["keywords"] if str(k).strip()]
+    questions = [str(q).strip() for q in obj["questions"] if str(q).strip()]
+    if not keywords or not questions:
+        return None
+    return ",".join(keywords), "\n".join(questions)
+
+
 async def full_question(tenant_id=None, llm_id=None, messages=[], language=None, chat_mdl=None):
     from common.constants import LLMType
     from api.db.services.llm_service import LLMBundle
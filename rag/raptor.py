@@ -15,11 +15,11 @@
 #
 import asyncio
 import logging
+import os
 import re
 
 import numpy as np
-import umap
-from sklearn.mixture import GaussianMixture
+import xxhash
 
 from api.db.services.task_service import has_canceled
 from common.connection_utils import timeout
@@ -33,6 +33,7 @@ from rag.graphrag.utils import (
     set_llm_cache,
 )
 from common.misc_utils import thread_pool_exec
+from rag.utils.raptor_cluster import RaptorClusterEngine
 
 
 class RecursiveAbstractiveProcessing4TreeOrganizedRetrieval:
@@ -97,18 +98,56 @@ class RecursiveAbstractiveProcessing4TreeOrganizedRetrieval:
         return embds
 
     def _get_optimal_clusters(self, embeddings: np.ndarray, random_state: int, task_id: str = ""):
-        max_clusters = min(self._max_cluster, len(embeddings))
-        n_clusters = np.arange(1, max_clusters)
-        bics = []
-        for n in n_clusters:
-            self._check_task_canceled(task_id, "get optimal clusters")
-
-            gm = GaussianMixture(n_components=n, random_state=random_state)
-            gm.fit(embeddings)
-            bics.append(gm.bic(embeddings))
-        optimal_clusters = n_clusters[np.argmin(bics)]
+        engine = RaptorClusterEngine(self._max_cluster, random_state, threshold=self._threshold)
+        optimal_clusters, _ = engine.search(embeddings, lambda: self._check_task_canceled(task_id, "get optimal clusters"))
         return optimal_clusters
 
+    async def _summarize(self, texts: list[str], callback=None, task_id: str = ""):
+        """
+        Summarize one cluster and embed the summary. Returns (summary, embedding),
+        or None when the cluster was skipped because of a recoverable error.
+        """
+        self._check_task_canceled(task_id, "summarization")
+
+        len_per_chunk = int((self._llm_model.max_length - self._max_token) / len(texts))
+        cluster_content = "\n".join([truncate(t, max(1, len_per_chunk)) for t in texts])
+        try:
+            async with chat_limiter:
+                self._check_task_canceled(task_id, "before LLM call")
+
+                cnt = await self._chat(
+                    "You're a helpful assistant.",
+                    [
+                        {
+                            "role": "user",
+                            "content": self._prompt.format(cluster_content=cluster_content),
+                        }
+                    ],
+                    {"max_tokens": max(self._max_token, 512)},  # fix issue:  #10235
+                )
+                cnt = re.sub(
+                    "(······\n由于长度的原因，回答被截断了，要继续吗？|For the content length reason, it stopped, continue?)",
+                    "",
+                    cnt,
+                )
+                logging.debug(f"SUM: {cnt}")
+
+                self._check_task_canceled(task_id, "before embedding")
+
+                embds = await self._embedding_encode(cnt)
+                return cnt, embds
+        except TaskCanceledException:
+            raise
+        except Exception as exc:
+            self._error_count += 1
+            warn_msg = f"[RAPTOR] Skip cluster ({len(texts)} chunks) due to error: {exc}"
+            logging.warning(warn_msg)
+            if callback:
+                callback(msg=warn_msg)
+            if self._error_count >= self._max_errors:
+                raise RuntimeError(f"RAPTOR aborted after {self._error_count} errors. Last error: {exc}") from exc
+        return None
+
     async def __call__(self, chunks, random_state, callback=None, task_id: str = ""):
         if len(chunks) <= 1:
             return []
@@ -119,47 +158,9 @@ class RecursiveAbstractiveProcessing4TreeOrganizedRetrieval:
         @timeout(60 * 20)
         async def summarize(ck_idx: list[int]):
             nonlocal chunks
-
-            self._check_task_canceled(task_id, "summarization")
-
-            texts = [chunks[i][0] for i in ck_idx]
-            len_per_chunk = int((self._llm_model.max_length - self._max_token) / len(texts))
-            cluster_content = "\n".join([truncate(t, max(1, len_per_chunk)) for t in texts])
-            try:
-                async with chat_limiter:
-                    self._check_task_canceled(task_id, "before LLM call")
-
-                    cnt = await self._chat(
-                        "You're a helpful assistant.",
-                        [
-                            {
-                                "role": "user",
-                                "content": self._prompt.format(cluster_content=cluster_content),
-                            }
-                        ],
-                        {"max_tokens": max(self._max_token, 512)},  # fix issue:  #10235
-                    )
-                    cnt = re.sub(
-                        "(······\n由于长度的原因，回答被截断了，要继续吗？|For the content length reason, it stopped, continue?)",
-                        "",
-                        cnt,
-                    )
-                    logging.debug(f"SUM: {cnt}")
-
-                    self._check_task_canceled(task_id, "before embedding")
-
-                    embds = await self._embedding_encode(cnt)
-                    chunks.append((cnt, embds))
-            except TaskCanceledException:
-                raise
-            except Exception as exc:
-                self._error_count += 1
-                warn_msg = f"[RAPTOR] Skip cluster ({len(ck_idx)} chunks) due to error: {exc}"
-                logging.warning(warn_msg)
-                if callback:
-                    callback(msg=warn_msg)
-                if self._error_count >= self._max_errors:
-                    raise RuntimeError(f"RAPTOR aborted after {self._error_count} errors. Last error: {exc}") from exc
+            res = await self._summarize([chunks[i][0] for i in ck_idx], callback, task_id)
+            if res:
+                chunks.append(res)
 
         labels = []
         while end - start > 1:
@@ -176,21 +177,10 @@ class RecursiveAbstractiveProcessing4TreeOrganizedRetrieval:
                 end = len(chunks)
                 continue
 
-            n_neighbors = int((len(embeddings) - 1) ** 0.8)
-            reduced_embeddings = umap.UMAP(
-                n_neighbors=max(2, n_neighbors),
-                n_components=min(12, len(embeddings) - 2),
-                metric="cosine",
-            ).fit_transform(embeddings)
-            n_clusters = self._get_optimal_clusters(reduced_embeddings, random_state, task_id=task_id)
-            if n_clusters == 1:
-                lbls = [0 for _ in range(len(reduced_embeddings))]
-            else:
-                gm = GaussianMixture(n_components=n_clusters, random_state=random_state)
-                gm.fit(reduced_embeddings)
-                probs = gm.predict_proba(reduced_embeddings)
-                lbls = [np.where(prob > self._threshold)[0] for prob in probs]
-                lbls = [lbl[0] if isinstance(lbl, np.ndarray) else lbl for lbl in lbls]
+            engine = RaptorClusterEngine(self._max_cluster, random_state, threshold=self._threshold)
+            n_clusters, lbls = await thread_pool_exec(
+                engine.cluster, embeddings, lambda: self._check_task_canceled(task_id, "get optimal clusters")
+            )
 
             tasks = []
             for c in range(n_clusters):
@@ -216,3 +206,127 @@ class RecursiveAbstractiveProcessing4TreeOrganizedRetrieval:
             end = len(chunks)
 
         return chunks
+
+
+# Above this share of unseen members a layer is re-clustered instead of extended.
+RAPTOR_INCREMENTAL_REBUILD_RATIO = float(os.environ.get("RAPTOR_INCREMENTAL_REBUILD_RATIO", "0.5"))
+
+
+def _text_hash(txt: str) -> str:
+    return xxhash.xxh64(txt.encode("utf-8")).hexdigest()
+
+
+class IncrementalRaptor(RecursiveAbstractiveProcessing4TreeOrganizedRetrieval):
+    """
+    RAPTOR that updates a persisted tree instead of rebuilding it.
+
+    The state keeps, per layer, the member hashes, centroid and summary of every
+    cluster. Chunks that are new since the last run are assigned to the closest
+    existing centroid; only clusters whose member set changed are re-summarized
+    and re-embedded, and the changed summaries propagate to the next layer the
+    same way. Layers without a usable state (first run, configuration change or
+    too many new members) are clustered from scratch with RaptorClusterEngine.
+    """
+
+    def __init__(self, *args, fingerprint: str = "", **kwargs):
+        super().__init__(*args, **kwargs)
+        self._fingerprint = fingerprint
+        self.resummarized = 0
+        self.reused = 0
+
+    def _assign(self, items, old_clusters):
+        if not old_clusters:
+            return None
+        positions = {h: i for i, (h, _, _) in enumerate(items)}
+        clusters = []
+        for c in old_clusters:
+            members = [h for h in c["members"] if h in positions]
+            clusters.append({**c, "members": members, "changed": len(members) != len(c["members"])})
+        assigned = set(h for c in clusters for h in c["members"])
+        fresh = [i for i, (h, _, _) in enumerate(items) if h not in assigned]
+        if len(fresh) > RAPTOR_INCREMENTAL_REBUILD_RATIO * len(items):
+            return None
+
+        if fresh:
+            centroids = np.array([c["centroid"] for c in clusters], dtype=np.float32)
+            centroids /= np.linalg.norm(centroids, axis=1, keepdims=True) + 1e-12
+            for i in fresh:
+                vec = items[i][2] / (np.linalg.norm(items[i][2]) + 1e-12)
+                c = clusters[int(np.argmax(centroids @ vec))]
+                c["members"].append(items[i][0])
+                c["changed"] = True
+
+        clusters = [c for c in clusters if c["members"]]
+        for c in clusters:
+            c["members"].sort(key=lambda h: positions[h])
+            if c["changed"]:
+                c["centroid"] = np.mean([items[positions[h]][2] for h in c["members"]], axis=0).tolist()
+        return clusters
+
+    def _fresh_clusters(self, items, random_state, task_id):
+        if len(items) == 2:
+            lbls = [0, 0]
+        else:
+            engine = RaptorClusterEngine(self._max_cluster, random_state, threshold=self._threshold)
+            _, lbls = engine.cluster([v for _, _, v in items], lambda: self._check_task_canceled(task_id, "get optimal clusters"))
+        grouped = {}
+        for i, lbl in enumerate(lbls):
+            grouped.setdefault(int(lbl), []).append(i)
+        return [
+            {
+                "members": [items[i][0] for i in idx],
+                "centroid": np.mean([items[i][2] for i in idx], axis=0).tolist(),
+                "changed": True,
+            }
+            for _, idx in sorted(grouped.items())
+        ]
+
+    async def __call__(self, chunks, random_state, state=None, callback=None, task_id: str = ""):
+        """
+        Returns (added, retired, state): the (summary, embedding) pairs to index,
+        the summary texts whose chunks are stale, and the state to persist.
+        """
+        state = state or {}
+        old_layers = state.get("layers", []) if state.get("fingerprint") == self._fingerprint else []
+        old_summaries = set(c["summary"] for layer in state.get("layers", []) for c in layer["clusters"] if c.get("summary"))
+
+        items, seen = [], set()
+        for s, a in chunks:
+            if not s or a is None or len(a) == 0:
+                continue
+            h = _text_hash(s)
+            if h not in seen:
+                seen.add(h)
+                items.append((h, s, np.asarray(a, dtype=np.float32)))
+
+        layers, added = [], []
+        while len(items) > 1:
+            self._check_task_canceled(task_id, "layer processing")
+            layer_no = len(layers)
+            clusters = self._assign(items, old_layers[layer_no]["clusters"] if layer_no < len(old_layers) else None)
+            if clusters is None:
+                clusters = await thread_pool_exec(self._fresh_clusters, items, random_state, task_id)
+                # Higher layers were built on the old partition, so rebuild them too.
+                old_layers = old_layers[:layer_no]
+
+            texts = {h: s for h, s, _ in items}
+            changed = [c for c in clusters if c.pop("changed") or not c.get("summary")]
+            results = await asyncio.gather(*[self._summarize([texts[h] for h in c["members"]], callback, task_id) for c in changed])
+            for c, res in zip(changed, results):
+                c["summary"], c["vector"] = (res[0], np.asarray(res[1]).tolist()) if res else (None, None)
+                if res:
+                    added.append(res)
+            self.resummarized += len(changed)
+            self.reused += len(clusters) - len(changed)
+
+            layers.append({"clusters": clusters})
+            if callback:
+                callback(msg="Cluster one layer: {} -> {} ({} re-summarized)".format(len(items), len(clusters), len(changed)))
+            next_items = [(_text_hash(c["summary"]), c["summary"], np.asarray(c["vector"], dtype=np.float32)) for c in clusters if c.get("summary")]
+            if len(next_items) >= len(items):
+                break
+            items = next_items
+
+        new_summaries = set(c["summary"] for layer in layers for c in layer["clusters"] if c.get("summary"))
+        retired = list(old_summaries - new_summaries)
+        return added, retired, {"fingerprint": self._fingerprint, "layers": layers}
@@ -16,7 +16,7 @@
 import time
 
 
-from common.misc_utils import thread_pool_exec
+from common.misc_utils import once, thread_pool_exec
 
 start_ts = time.time()
 
@@ -35,21 +35,21 @@ from api.db.services.knowledgebase_service import KnowledgebaseService
 from api.db.services.pipeline_operation_log_service import PipelineOperationLogService
 from api.db.joint_services.memory_message_service import handle_save_to_memory_task
 from common.connection_utils import timeout
-from common.metadata_utils import turn2jsonschema, update_metadata_to
-from rag.utils.base64_image import image2id
-from rag.utils.raptor_utils import should_skip_raptor, get_skip_reason
+from common.metadata_utils import update_metadata_to
+from rag.utils.base64_image import image2id, image_nbytes
+from rag.utils.raptor_utils import should_skip_raptor, get_skip_reason, load_raptor_state, prune_raptor_state, save_raptor_state
 from common.log_utils import init_root_logger
 from common.config_utils import show_configs
 from rag.graphrag.general.index import run_graphrag_for_kb
-from rag.graphrag.utils import get_llm_cache, set_llm_cache, get_tags_from_cache, set_tags_to_cache
-from rag.prompts.generator import keyword_extraction, question_proposal, content_tagging, run_toc_from_text, \
-    gen_metadata
+from rag.graphrag.utils import get_tags_from_cache, set_tags_to_cache
+from rag.prompts.generator import run_toc_from_text
 import logging
 import os
 from datetime import datetime
 import json
 import xxhash
 import copy
+from collections import deque
 import re
 from functools import partial
 from multiprocessing.context import TimeoutError
@@ -62,18 +62,21 @@ from peewee import DoesNotExist
 from common.constants import LLMType, ParserType, PipelineTaskType
 from api.db.services.document_service import DocumentService
 from api.db.services.doc_metadata_service import DocMetadataService
-from api.db.services.llm_service import LLMBundle
-from api.db.services.task_service import TaskService, has_canceled, CANVAS_DEBUG_DOC_ID, GRAPH_RAPTOR_FAKE_DOC_ID
+from api.db.services.llm_service import LLMBundle, bridge_stats
+from api.db.services.task_service import TaskService, TaskProgressBuffer, has_canceled, queue_tasks, CANVAS_DEBUG_DOC_ID, GRAPH_RAPTOR_FAKE_DOC_ID
 from api.db.services.file2document_service import File2DocumentService
 from common.versions import get_ragflow_version
 from api.db.db_models import close_connection
+from api.utils.file_utils import page_count
 from rag.app import laws, paper, presentation, manual, qa, table, book, resume, picture, naive, one, audio, \
     email, tag
 from rag.nlp import search, rag_tokenizer, add_positions
-from rag.raptor import RecursiveAbstractiveProcessing4TreeOrganizedRetrieval as Raptor
+from rag.raptor import RecursiveAbstractiveProcessing4TreeOrganizedRetrieval as Raptor, IncrementalRaptor
 from common.token_utils import num_tokens_from_string, truncate
 from rag.utils.redis_conn import REDIS_CONN, RedisDistributedLock
-from rag.graphrag.utils import chat_limiter
+from rag.utils.task_scheduler import TaskScheduler
+from rag.utils.embedding_broker import EmbeddingBroker
+from rag.utils.chunk_enricher import ChunkEnricher, KeywordPass, MetadataPass, QuestionPass, TagPass
 from common.signal_utils import start_tracemalloc_and_snapshot, stop_tracemalloc
 from common.exceptions import TaskCanceledException
 from common import settings
@@ -119,31 +122,48 @@ DONE_TASKS = 0
 FAILED_TASKS = 0
 
 CURRENT_TASKS = {}
+# task id -> the stream message it came from, so the heartbeat can keep its scheduler slot alive.
+RUNNING_MSGS = {}
 
 MAX_CONCURRENT_TASKS = int(os.environ.get('MAX_CONCURRENT_TASKS', "5"))
 MAX_CONCURRENT_CHUNK_BUILDERS = int(os.environ.get('MAX_CONCURRENT_CHUNK_BUILDERS', "1"))
 MAX_CONCURRENT_MINIO = int(os.environ.get('MAX_CONCURRENT_MINIO', '10'))
+# Chunk images of one document being encoded or uploaded at a time.
+CHUNK_IMAGE_WINDOW = int(os.environ.get('CHUNK_IMAGE_WINDOW', '32'))
 task_limiter = asyncio.Semaphore(MAX_CONCURRENT_TASKS)
 chunk_limiter = asyncio.Semaphore(MAX_CONCURRENT_CHUNK_BUILDERS)
-embed_limiter = asyncio.Semaphore(MAX_CONCURRENT_CHUNK_BUILDERS)
 minio_limiter = asyncio.Semaphore(MAX_CONCURRENT_MINIO)
 kg_limiter = asyncio.Semaphore(2)
 WORKER_HEARTBEAT_TIMEOUT = int(os.environ.get('WORKER_HEARTBEAT_TIMEOUT', '120'))
+# How long set_progress trusts a "not canceled" answer before asking Redis again.
+TASK_CANCEL_CHECK_INTERVAL = float(os.environ.get('TASK_CANCEL_CHECK_INTERVAL', '1'))
 stop_event = threading.Event()
+_cancel_checked_at = {}
 
 
 def signal_handler(sig, frame):
     logging.info("Received interrupt signal, shutting down...")
     stop_event.set()
+    # Buffered progress and token usage are flushed at exit (atexit), outside signal context.
     time.sleep(1)
     sys.exit(0)
 
 
+def _progress_has_canceled(task_id):
+    now = time.monotonic()
+    if now - _cancel_checked_at.get(task_id, float("-inf")) < TASK_CANCEL_CHECK_INTERVAL:
+        return False
+    if has_canceled(task_id):
+        return True
+    _cancel_checked_at[task_id] = now
+    return False
+
+
 def set_progress(task_id, from_page=0, to_page=-1, prog=None, msg="Processing..."):
     try:
         if prog is not None and prog < 0:
             msg = "[ERROR]" + msg
-        cancel = has_canceled(task_id)
+        cancel = _progress_has_canceled(task_id)
 
         if cancel:
             msg += " [Canceled]"
@@ -159,7 +179,7 @@ def set_progress(task_id, from_page=0, to_page=-1, prog=None, msg="Processing...
         if prog is not None:
             d["progress"] = prog
 
-        TaskService.update_progress(task_id, d)
+        TaskProgressBuffer.add(task_id, d)
 
         close_connection()
         if cancel:
@@ -187,6 +207,9 @@ async def collect():
         except StopIteration:
             for svr_queue_name in svr_queue_names:
                 redis_msg = REDIS_CONN.queue_consumer(svr_queue_name, SVR_CONSUMER_GROUP_NAME, CONSUMER_NAME)
+                # An empty stream is refilled from the tenant queues, then read again.
+                if not redis_msg and TaskScheduler.dispatch(svr_queue_name):
+                    redis_msg = REDIS_CONN.queue_consumer(svr_queue_name, SVR_CONSUMER_GROUP_NAME, CONSUMER_NAME)
                 if redis_msg:
                     break
     except Exception as e:
@@ -201,6 +224,10 @@ async def collect():
         redis_msg.ack()
         return None, None
 
+    if stop_event.is_set() and TaskScheduler.hand_back(redis_msg):
+        logging.info(f"collect handed back task {msg.get('id')} while shutting down")
+        return None, None
+
     canceled = False
     if msg.get("doc_id", "") in [GRAPH_RAPTOR_FAKE_DOC_ID, CANVAS_DEBUG_DOC_ID]:
         task = msg
@@ -222,6 +249,7 @@ async def collect():
         FAILED_TASKS += 1
         logging.warning(f"collect task {msg['id']} {state}")
         redis_msg.ack()
+        TaskScheduler.release(redis_msg, msg["id"])
         return None, None
 
     task_type = msg.get("task_type", "")
@@ -230,6 +258,8 @@ async def collect():
         task["tenant_id"] = msg["tenant_id"]
         task["dataflow_id"] = msg["dataflow_id"]
         task["kb_id"] = msg.get("kb_id", "")
+    if task_type == "plan":
+        task["priority"] = msg.get("priority", 0)
     if task_type[:6] == "memory":
         task["memory_id"] = msg["memory_id"]
         task["source_id"] = msg["source_id"]
@@ -241,6 +271,23 @@ async def get_storage_binary(bucket, name):
     return await thread_pool_exec(settings.STORAGE_IMPL.get, bucket, name)
 
 
+async def plan_document_tasks(task):
+    """Count pages/rows of a document uploaded before counts were stored, then queue its real tasks."""
+    bucket, name = File2DocumentService.get_storage_address(doc_id=task["doc_id"])
+    binary = await get_storage_binary(bucket, name)
+    page_num = await thread_pool_exec(page_count, task["name"], binary, task["parser_id"]) or 0
+    DocumentService.update_by_id(task["doc_id"], {"page_num": page_num})
+    e, doc = DocumentService.get_by_id(task["doc_id"])
+    if not e:
+        return
+    doc = doc.to_dict()
+    doc["tenant_id"] = task["tenant_id"]
+    # Replaces the document's tasks with the page/row ranges. This task's row stays until
+    # handle_task returns, so its own progress still has somewhere to go.
+    await thread_pool_exec(queue_tasks, doc, bucket, name, task["priority"], task["id"])
+    logging.info(f"Planned {task['name']} ({page_num} pages/rows)")
+
+
 @timeout(60 * 80, 1)
 async def build_chunks(task, progress_callback):
     if task["size"] > settings.DOC_MAXIMUM_SIZE:
@@ -298,219 +345,158 @@ async def build_chunks(task, progress_callback):
         doc[PAGERANK_FLD] = int(task["pagerank"])
     st = timer()
 
+    # Chunk images are uploaded through a window of CHUNK_IMAGE_WINDOW in-flight uploads.
+    # Every chunk's image is referenced only by its outgoing doc, and image2id closes it
+    # right after the put, so decoded images are released as the upload progresses
+    # instead of all staying alive until the last one is stored.
+    window = asyncio.Semaphore(CHUNK_IMAGE_WINDOW)
+    pending = set()
+    failed = []
+    img_stats = {"images": 0, "bytes": 0, "inflight": 0, "peak": 0}
+
     @timeout(60)
-    async def upload_to_minio(document, chunk):
+    async def upload_image(d):
+        await image2id(d, partial(settings.STORAGE_IMPL.put, tenant_id=task["tenant_id"]), d["id"], task["kb_id"])
+
+    async def upload_to_minio(d, size):
         try:
-            d = copy.deepcopy(document)
-            d.update(chunk)
+            await upload_image(d)
+        except Exception:
+            logging.exception(
+                "Saving image of chunk {}/{}/{} got exception".format(task["location"], task["name"], d["id"]))
+            raise
+        finally:
+            img_stats["inflight"] -= size
+            window.release()
+
+    def upload_done(t):
+        pending.discard(t)
+        if not t.cancelled() and t.exception():
+            failed.append(t.exception())
+
+    cks = deque(cks)
+    try:
+        while cks:
+            ck = cks.popleft()
+            d = {**doc, **ck}
+            ck = None
             d["id"] = xxhash.xxh64(
-                (chunk["content_with_weight"] + str(d["doc_id"])).encode("utf-8", "surrogatepass")).hexdigest()
+                (d["content_with_weight"] + str(d["doc_id"])).encode("utf-8", "surrogatepass")).hexdigest()
             d["create_time"] = str(datetime.now()).replace("T", " ")[:19]
             d["create_timestamp_flt"] = datetime.now().timestamp()
+            docs.append(d)
 
             if d.get("img_id"):
-                docs.append(d)
-                return
-
+                continue
             if not d.get("image"):
                 _ = d.pop("image", None)
                 d["img_id"] = ""
-                docs.append(d)
-                return
-            await image2id(d, partial(settings.STORAGE_IMPL.put, tenant_id=task["tenant_id"]), d["id"], task["kb_id"])
-            docs.append(d)
-        except Exception:
-            logging.exception(
-                "Saving image of chunk {}/{}/{} got exception".format(task["location"], task["name"], d["id"]))
-            raise
+                continue
 
-    tasks = []
-    for ck in cks:
-        tasks.append(asyncio.create_task(upload_to_minio(doc, ck)))
-    try:
-        await asyncio.gather(*tasks, return_exceptions=False)
+            await window.acquire()
+            if failed:
+                window.release()
+                raise failed[0]
+            size = image_nbytes(d["image"])
+            img_stats["images"] += 1
+            img_stats["bytes"] += size
+            img_stats["inflight"] += size
+            img_stats["peak"] = max(img_stats["peak"], img_stats["inflight"])
+            t = asyncio.create_task(upload_to_minio(d, size))
+            pending.add(t)
+            t.add_done_callback(upload_done)
+        await asyncio.gather(*pending, return_exceptions=False)
     except Exception as e:
         logging.error(f"MINIO PUT({task['name']}) got exception: {e}")
-        for t in tasks:
+        for t in pending:
             t.cancel()
-        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.gather(*pending, return_exceptions=True)
         raise
 
     el = timer() - st
-    logging.info("MINIO PUT({}) cost {:.3f} s".format(task["name"], el))
-
-    if task["parser_config"].get("auto_keywords", 0):
-        st = timer()
-        progress_callback(msg="Start to generate keywords for every chunk ...")
-        chat_mdl = LLMBundle(task["tenant_id"], LLMType.CHAT, llm_name=task["llm_id"], lang=task["language"])
-
-        async def doc_keyword_extraction(chat_mdl, d, topn):
-            cached = get_llm_cache(chat_mdl.llm_name, d["content_with_weight"], "keywords", {"topn": topn})
-            if not cached:
-                if has_canceled(task["id"]):
-                    progress_callback(-1, msg="Task has been canceled.")
-                    return
-                async with chat_limiter:
-                    cached = await keyword_extraction(chat_mdl, d["content_with_weight"], topn)
-                set_llm_cache(chat_mdl.llm_name, d["content_with_weight"], cached, "keywords", {"topn": topn})
-            if cached:
-                d["important_kwd"] = cached.split(",")
-                d["important_tks"] = rag_tokenizer.tokenize(" ".join(d["important_kwd"]))
-            return
-
-        tasks = []
-        for d in docs:
-            tasks.append(
-                asyncio.create_task(doc_keyword_extraction(chat_mdl, d, task["parser_config"]["auto_keywords"])))
-        try:
-            await asyncio.gather(*tasks, return_exceptions=False)
-        except Exception as e:
-            logging.error("Error in doc_keyword_extraction: {}".format(e))
-            for t in tasks:
-                t.cancel()
-            await asyncio.gather(*tasks, return_exceptions=True)
-            raise
-        progress_callback(msg="Keywords generation {} chunks completed in {:.2f}s".format(len(docs), timer() - st))
-
-    if task["parser_config"].get("auto_questions", 0):
-        st = timer()
-        progress_callback(msg="Start to generate questions for every chunk ...")
-        chat_mdl = LLMBundle(task["tenant_id"], LLMType.CHAT, llm_name=task["llm_id"], lang=task["language"])
-
-        async def doc_question_proposal(chat_mdl, d, topn):
-            cached = get_llm_cache(chat_mdl.llm_name, d["content_with_weight"], "question", {"topn": topn})
-            if not cached:
-                if has_canceled(task["id"]):
-                    progress_callback(-1, msg="Task has been canceled.")
-                    return
-                async with chat_limiter:
-                    cached = await question_proposal(chat_mdl, d["content_with_weight"], topn)
-                set_llm_cache(chat_mdl.llm_name, d["content_with_weight"], cached, "question", {"topn": topn})
-            if cached:
-                d["question_kwd"] = cached.split("\n")
-                d["question_tks"] = rag_tokenizer.tokenize("\n".join(d["question_kwd"]))
-
-        tasks = []
-        for d in docs:
-            tasks.append(
-                asyncio.create_task(doc_question_proposal(chat_mdl, d, task["parser_config"]["auto_questions"])))
-        try:
-            await asyncio.gather(*tasks, return_exceptions=False)
-        except Exception as e:
-            logging.error("Error in doc_question_proposal", exc_info=e)
-            for t in tasks:
-                t.cancel()
-            await asyncio.gather(*tasks, return_exceptions=True)
-            raise
-        progress_callback(msg="Question generation {} chunks completed in {:.2f}s".format(len(docs), timer() - st))
-
-    if task["parser_config"].get("enable_metadata", False) and task["parser_config"].get("metadata"):
-        st = timer()
-        progress_callback(msg="Start to generate meta-data for every chunk ...")
-        chat_mdl = LLMBundle(task["tenant_id"], LLMType.CHAT, llm_name=task["llm_id"], lang=task["language"])
-
-        async def gen_metadata_task(chat_mdl, d):
-            cached = get_llm_cache(chat_mdl.llm_name, d["content_with_weight"], "metadata",
-                                   task["parser_config"]["metadata"])
-            if not cached:
-                if has_canceled(task["id"]):
-                    progress_callback(-1, msg="Task has been canceled.")
-                    return
-                async with chat_limiter:
-                    cached = await gen_metadata(chat_mdl,
-                                                turn2jsonschema(task["parser_config"]["metadata"]),
-                                                d["content_with_weight"])
-                set_llm_cache(chat_mdl.llm_name, d["content_with_weight"], cached, "metadata",
-                              task["parser_config"]["metadata"])
-            if cached:
-                d["metadata_obj"] = cached
-
-        tasks = []
-        for d in docs:
-            tasks.append(asyncio.create_task(gen_metadata_task(chat_mdl, d)))
-        try:
-            await asyncio.gather(*tasks, return_exceptions=False)
-        except Exception as e:
-            logging.error("Error in doc_question_proposal", exc_info=e)
-            for t in tasks:
-                t.cancel()
-            await asyncio.gather(*tasks, return_exceptions=True)
-            raise
-        metadata = {}
-        for doc in docs:
-            metadata = update_metadata_to(metadata, doc["metadata_obj"])
-            del doc["metadata_obj"]
-        if metadata:
-            existing_meta = DocMetadataService.get_document_metadata(task["doc_id"])
-            existing_meta = existing_meta if isinstance(existing_meta, dict) else {}
-            metadata = update_metadata_to(metadata, existing_meta)
-            DocMetadataService.update_document_metadata(task["doc_id"], metadata)
-        progress_callback(msg="Question generation {} chunks completed in {:.2f}s".format(len(docs), timer() - st))
-
-    if task["kb_parser_config"].get("tag_kb_ids", []):
+    if img_stats["images"]:
+        logging.info("MINIO PUT({}) cost {:.3f} s, {} images, {:.1f} MB decoded, {:.1f} images/s, peak in flight {:.1f} MB".format(
+            task["name"], el, img_stats["images"], img_stats["bytes"] / 1024 / 1024,
+            img_stats["images"] / max(el, 1e-6), img_stats["peak"] / 1024 / 1024))
+    else:
+        logging.info("MINIO PUT({}) cost {:.3f} s".format(task["name"], el))
+
+    parser_config = task["parser_config"]
+    passes = []
+    if parser_config.get("auto_keywords", 0):
+        passes.append(KeywordPass(parser_config["auto_keywords"]))
+    if parser_config.get("auto_questions", 0):
+        passes.append(QuestionPass(parser_config["auto_questions"]))
+    if parser_config.get("enable_metadata", False) and parser_config.get("metadata"):
+        passes.append(MetadataPass(parser_config["metadata"]))
+    tag_kb_ids = task["kb_parser_config"].get("tag_kb_ids", [])
+    if not passes and not tag_kb_ids:
+        return docs
+
+    def tagging_pass():
         progress_callback(msg="Start to tag for every chunk ...")
-        kb_ids = task["kb_parser_config"]["tag_kb_ids"]
         tenant_id = task["tenant_id"]
         topn_tags = task["kb_parser_config"].get("topn_tags", 3)
         S = 1000
-        st = timer()
         examples = []
-        all_tags = get_tags_from_cache(kb_ids)
+        all_tags = get_tags_from_cache(tag_kb_ids)
         if not all_tags:
-            all_tags = settings.retriever.all_tags_in_portion(tenant_id, kb_ids, S)
-            set_tags_to_cache(kb_ids, all_tags)
+            all_tags = settings.retriever.all_tags_in_portion(tenant_id, tag_kb_ids, S)
+            set_tags_to_cache(tag_kb_ids, all_tags)
         else:
             all_tags = json.loads(all_tags)
 
-        chat_mdl = LLMBundle(task["tenant_id"], LLMType.CHAT, llm_name=task["llm_id"], lang=task["language"])
-
-        docs_to_tag = []
+        docs_to_tag = set()
         for d in docs:
             task_canceled = has_canceled(task["id"])
             if task_canceled:
                 progress_callback(-1, msg="Task has been canceled.")
                 return None
-            if settings.retriever.tag_content(tenant_id, kb_ids, d, all_tags, topn_tags=topn_tags, S=S) and len(
+            if settings.retriever.tag_content(tenant_id, tag_kb_ids, d, all_tags, topn_tags=topn_tags, S=S) and len(
                     d[TAG_FLD]) > 0:
                 examples.append({"content": d["content_with_weight"], TAG_FLD: d[TAG_FLD]})
             else:
-                docs_to_tag.append(d)
+                docs_to_tag.add(id(d))
+        return TagPass(all_tags, examples, topn_tags, docs_to_tag)
 
-        async def doc_content_tagging(chat_mdl, d, topn_tags):
-            cached = get_llm_cache(chat_mdl.llm_name, d["content_with_weight"], all_tags, {"topn": topn_tags})
-            if not cached:
-                if has_canceled(task["id"]):
-                    progress_callback(-1, msg="Task has been canceled.")
-                    return
-                picked_examples = random.choices(examples, k=2) if len(examples) > 2 else examples
-                if not picked_examples:
-                    picked_examples.append({"content": "This is an example", TAG_FLD: {'example': 1}})
-                async with chat_limiter:
-                    cached = await content_tagging(
-                        chat_mdl,
-                        d["content_with_weight"],
-                        all_tags,
-                        picked_examples,
-                        topn_tags,
-                    )
-                if cached:
-                    cached = json.dumps(cached)
-            if cached:
-                set_llm_cache(chat_mdl.llm_name, d["content_with_weight"], cached, all_tags, {"topn": topn_tags})
-                d[TAG_FLD] = json.loads(cached)
-
-        tasks = []
-        for d in docs_to_tag:
-            tasks.append(asyncio.create_task(doc_content_tagging(chat_mdl, d, topn_tags)))
-        try:
-            await asyncio.gather(*tasks, return_exceptions=False)
-        except Exception as e:
-            logging.error("Error tagging docs: {}".format(e))
-            for t in tasks:
-                t.cancel()
-            await asyncio.gather(*tasks, return_exceptions=True)
-            raise
-        progress_callback(msg="Tagging {} chunks completed in {:.2f}s".format(len(docs), timer() - st))
+    st = timer()
+    chat_mdl = LLMBundle(task["tenant_id"], LLMType.CHAT, llm_name=task["llm_id"], lang=task["language"])
+    enricher = ChunkEnricher(chat_mdl, is_canceled=lambda: has_canceled(task["id"]))
+    # Passes run together per chunk. Tagging by retrieval matches on the chunk's keywords,
+    # so with auto keywords it runs once the first passes are done.
+    tag_first = tag_kb_ids and not parser_config.get("auto_keywords", 0)
+    if tag_first:
+        tag_pass = tagging_pass()
+        if tag_pass is None:
+            return None
+        passes.append(tag_pass)
+    try:
+        if passes:
+            progress_callback(msg="Start to generate {} for every chunk ...".format(", ".join(p.name for p in passes)))
+            await enricher.run(docs, passes)
+        if tag_kb_ids and not tag_first and not enricher.canceled:
+            tag_pass = tagging_pass()
+            if tag_pass is None:
+                return None
+            await enricher.run(docs, [tag_pass])
+    except Exception as e:
+        logging.error("Error enriching chunks of {}: {}".format(task["name"], e))
+        raise
+    if enricher.canceled:
+        progress_callback(-1, msg="Task has been canceled.")
+        return None
+
+    if any(isinstance(p, MetadataPass) for p in passes):
+        metadata = {}
+        for d in docs:
+            metadata = update_metadata_to(metadata, d.pop("metadata_obj", None))
+        if metadata:
+            existing_meta = DocMetadataService.get_document_metadata(task["doc_id"])
+            existing_meta = existing_meta if isinstance(existing_meta, dict) else {}
+            metadata = update_metadata_to(metadata, existing_meta)
+            DocMetadataService.update_document_metadata(task["doc_id"], metadata)
+    logging.info("Chunk enrichment of {}: {}".format(task["name"], enricher.stats()))
+    progress_callback(msg="Enrichment of {} chunks completed in {:.2f}s: {}".format(len(docs), timer() - st, enricher.summary()))
 
     return docs
 
@@ -567,6 +553,32 @@ def init_kb(row, vector_size: int):
     return settings.docStoreConn.create_idx(idxnm, row.get("kb_id", ""), vector_size, parser_id)
 
 
+@once
+def embedding_broker():
+    return EmbeddingBroker(settings.EMBEDDING_BATCH_SIZE)
+
+
+async def broker_encode(broker, mdl, texts, on_progress=None):
+    """
+    Encode `texts` through the shared broker in EMBEDDING_BATCH_SIZE slices, sent concurrently.
+    Returns (vectors per slice in order, tokens); `on_progress` gets the finished fraction.
+    """
+    size = settings.EMBEDDING_BATCH_SIZE
+    slices = [texts[i: i + size] for i in range(0, len(texts), size)]
+    results = [None] * len(slices)
+
+    async def encode_slice(k):
+        results[k] = await broker.encode(mdl, slices[k])
+
+    done = 0
+    for fut in asyncio.as_completed([encode_slice(k) for k in range(len(slices))]):
+        await fut
+        done += 1
+        if on_progress and (done == len(slices) or done % max(1, len(slices) // 20) == 0):
+            on_progress(done / len(slices))
+    return [vts for vts, _ in results], sum(c for _, c in results)
+
+
 async def embedding(docs, mdl, parser_config=None, callback=None):
     if parser_config is None:
         parser_config = {}
@@ -582,27 +594,16 @@ async def embedding(docs, mdl, parser_config=None, callback=None):
         cnts.append(c)
 
     tk_count = 0
+    broker = embedding_broker()
     if len(tts) == len(cnts):
-        vts, c = await thread_pool_exec(mdl.encode, tts[0:1])
+        vts, c = await broker.encode(mdl, tts[0:1])
         tts = np.tile(vts[0], (len(cnts), 1))
         tk_count += c
 
-    @timeout(60)
-    def batch_encode(txts):
-        nonlocal mdl
-        return mdl.encode([truncate(c, mdl.max_length - 10) for c in txts])
-
-    cnts_ = np.array([])
-    for i in range(0, len(cnts), settings.EMBEDDING_BATCH_SIZE):
-        async with embed_limiter:
-            vts, c = await thread_pool_exec(batch_encode, cnts[i: i + settings.EMBEDDING_BATCH_SIZE])
-        if len(cnts_) == 0:
-            cnts_ = vts
-        else:
-            cnts_ = np.concatenate((cnts_, vts), axis=0)
-        tk_count += c
-        callback(prog=0.7 + 0.2 * (i + 1) / len(cnts), msg="")
-    cnts = cnts_
+    cnts = await thread_pool_exec(lambda: [truncate(c, mdl.max_length - 10) for c in cnts])
+    vts_list, c = await broker_encode(broker, mdl, cnts, lambda done: callback(prog=0.7 + 0.2 * done, msg=""))
+    tk_count += c
+    cnts = np.concatenate(vts_list, axis=0)
     filename_embd_weight = parser_config.get("filename_embd_weight", 0.1)  # due to the db support none value
     if not filename_embd_weight:
         filename_embd_weight = 0.1
@@ -670,26 +671,14 @@ async def run_dataflow(task: dict):
             embedding_id = kb.embd_id
             embedding_model = LLMBundle(task["tenant_id"], LLMType.EMBEDDING, llm_name=embedding_id)
 
-            @timeout(60)
-            def batch_encode(txts):
-                nonlocal embedding_model
-                return embedding_model.encode([truncate(c, embedding_model.max_length - 10) for c in txts])
-
-            vects = np.array([])
             texts = [o.get("questions", o.get("summary", o["text"])) for o in chunks]
-            delta = 0.20 / (len(texts) // settings.EMBEDDING_BATCH_SIZE + 1)
-            prog = 0.8
-            for i in range(0, len(texts), settings.EMBEDDING_BATCH_SIZE):
-                async with embed_limiter:
-                    vts, c = await thread_pool_exec(batch_encode, texts[i: i + settings.EMBEDDING_BATCH_SIZE])
-                if len(vects) == 0:
-                    vects = vts
-                else:
-                    vects = np.concatenate((vects, vts), axis=0)
-                embedding_token_consumption += c
-                prog += delta
-                if i % (len(texts) // settings.EMBEDDING_BATCH_SIZE / 100 + 1) == 1:
-                    set_progress(task_id, prog=prog, msg=f"{i + 1} / {len(texts) // settings.EMBEDDING_BATCH_SIZE}")
+            texts = await thread_pool_exec(lambda: [truncate(c, embedding_model.max_length - 10) for c in texts])
+            vts_list, c = await broker_encode(
+                embedding_broker(), embedding_model, texts,
+                lambda done: set_progress(task_id, prog=0.8 + 0.2 * done, msg=f"{int(done * 100)}% embedded"),
+            )
+            vects = np.concatenate(vts_list, axis=0) if vts_list else np.array([])
+            embedding_token_consumption += c
 
             assert len(vects) == len(chunks)
             for i, ck in enumerate(chunks):
@@ -772,20 +761,41 @@ async def run_raptor_for_kb(row, kb_parser_config, chat_mdl, embd_mdl, vector_si
     res = []
     tk_count = 0
     max_errors = int(os.environ.get("RAPTOR_MAX_ERRORS", 3))
+    incremental = raptor_config.get("incremental", False)
+    states = {}
+    if incremental:
+        states = load_raptor_state(str(row["kb_id"]))
+        live = set(d["id"] for d in DocumentService.get_all_doc_ids_by_kb_ids([str(row["kb_id"])]))
+        prune_raptor_state(states, live | {fake_doc_id})
+    retired_ids = []
+    fingerprint = xxhash.xxh64(json.dumps([
+        embd_mdl.llm_name, vector_size, raptor_config["prompt"], raptor_config["max_token"],
+        raptor_config["threshold"], raptor_config.get("max_cluster", 64), raptor_config["random_seed"]
+    ]).encode("utf-8")).hexdigest()
+
+    def summary_chunk_id(content):
+        return xxhash.xxh64((content + str(fake_doc_id)).encode("utf-8")).hexdigest()
 
     async def generate(chunks, did):
         nonlocal tk_count, res
-        raptor = Raptor(
+        raptor_args = (
             raptor_config.get("max_cluster", 64),
             chat_mdl,
             embd_mdl,
             raptor_config["prompt"],
             raptor_config["max_token"],
             raptor_config["threshold"],
-            max_errors=max_errors,
         )
-        original_length = len(chunks)
-        chunks = await raptor(chunks, kb_parser_config["raptor"]["random_seed"], callback, row["id"])
+        if incremental:
+            raptor = IncrementalRaptor(*raptor_args, max_errors=max_errors, fingerprint=fingerprint)
+            summaries, retired, states[did] = await raptor(chunks, raptor_config["random_seed"], states.get(did), callback, row["id"])
+            retired_ids.extend(summary_chunk_id(content) for content in retired)
+            callback(msg=f"RAPTOR incremental: {raptor.resummarized} clusters re-summarized, {raptor.reused} reused, {len(retired)} summaries retired")
+        else:
+            raptor = Raptor(*raptor_args, max_errors=max_errors)
+            original_length = len(chunks)
+            chunks = await raptor(chunks, kb_parser_config["raptor"]["random_seed"], callback, row["id"])
+            summaries = chunks[original_length:]
         doc = {
             "doc_id": did,
             "kb_id": [str(row["kb_id"])],
@@ -796,25 +806,43 @@ async def run_raptor_for_kb(row, kb_parser_config, chat_mdl, embd_mdl, vector_si
         if row["pagerank"]:
             doc[PAGERANK_FLD] = int(row["pagerank"])
 
-        for content, vctr in chunks[original_length:]:
+        for content, vctr in summaries:
             d = copy.deepcopy(doc)
-            d["id"] = xxhash.xxh64((content + str(fake_doc_id)).encode("utf-8")).hexdigest()
+            d["id"] = summary_chunk_id(content)
             d["create_time"] = str(datetime.now()).replace("T", " ")[:19]
             d["create_timestamp_flt"] = datetime.now().timestamp()
-            d[vctr_nm] = vctr.tolist()
+            d[vctr_nm] = np.asarray(vctr).tolist()
             d["content_with_weight"] = content
             d["content_ltks"] = rag_tokenizer.tokenize(content)
             d["content_sm_ltks"] = rag_tokenizer.fine_grained_tokenize(d["content_ltks"])
             res.append(d)
             tk_count += num_tokens_from_string(content)
 
+    def commit() -> int:
+        """
+        Retire stale summaries and persist the tree state, once the new summaries are indexed.
+        Returns the number of summary chunks deleted.
+        """
+        if not incremental:
+            return 0
+        kept = set(d["id"] for d in res)
+        stale = [i for i in retired_ids if i not in kept]
+        deleted = 0
+        if stale:
+            deleted = settings.docStoreConn.delete({"id": stale}, search.index_name(row["tenant_id"]), str(row["kb_id"]))
+        save_raptor_state(str(row["kb_id"]), states)
+        return deleted
+
     if raptor_config.get("scope", "file") == "file":
         for x, doc_id in enumerate(doc_ids):
             chunks = []
             skipped_chunks = 0
             for d in settings.retriever.chunk_list(doc_id, row["tenant_id"], [str(row["kb_id"])],
-                                                   fields=["content_with_weight", vctr_nm],
+                                                   fields=["content_with_weight", vctr_nm, "raptor_kwd"],
                                                    sort_by_position=True):
+                # Summaries of earlier runs share the doc_id; they are not leaves of the tree.
+                if d.get("raptor_kwd"):
+                    continue
                 # Skip chunks that don't have the required vector field (may have been indexed with different embedding model)
                 if vctr_nm not in d or d[vctr_nm] is None:
                     skipped_chunks += 1
@@ -837,8 +865,10 @@ async def run_raptor_for_kb(row, kb_parser_config, chat_mdl, embd_mdl, vector_si
         skipped_chunks = 0
         for doc_id in doc_ids:
             for d in settings.retriever.chunk_list(doc_id, row["tenant_id"], [str(row["kb_id"])],
-                                                   fields=["content_with_weight", vctr_nm],
+                                                   fields=["content_with_weight", vctr_nm, "raptor_kwd"],
                                                    sort_by_position=True):
+                if d.get("raptor_kwd"):
+                    continue
                 # Skip chunks that don't have the required vector field
                 if vctr_nm not in d or d[vctr_nm] is None:
                     skipped_chunks += 1
@@ -852,11 +882,11 @@ async def run_raptor_for_kb(row, kb_parser_config, chat_mdl, embd_mdl, vector_si
         if not chunks:
             logging.error(f"RAPTOR: No valid chunks with vectors found in any document for kb {row['kb_id']}")
             callback(msg=f"[ERROR] No valid chunks with vectors found. Please ensure documents are parsed with the current embedding model (vector size: {vector_size}).")
-            return res, tk_count
+            return res, tk_count, commit
 
         await generate(chunks, fake_doc_id)
 
-    return res, tk_count
+    return res, tk_count, commit
 
 
 async def delete_image(kb_id, chunk_id):
@@ -958,6 +988,10 @@ async def do_handle_task(task):
         await run_dataflow(task)
         return
 
+    if task_type == "plan":
+        await plan_document_tasks(task)
+        return
+
     task_id = task["id"]
     task_from_page = task["from_page"]
     task_to_page = task["to_page"]
@@ -973,6 +1007,7 @@ async def do_handle_task(task):
     task_parser_config = task["parser_config"]
     task_start_ts = timer()
     toc_thread = None
+    raptor_commit = None
     executor = concurrent.futures.ThreadPoolExecutor()
 
     # prepare the progress callback function
@@ -1040,7 +1075,7 @@ async def do_handle_task(task):
         chat_model = LLMBundle(task_tenant_id, LLMType.CHAT, llm_name=kb_task_llm_id, lang=task_language)
         # run RAPTOR
         async with kg_limiter:
-            chunks, token_count = await run_raptor_for_kb(
+            chunks, token_count, raptor_commit = await run_raptor_for_kb(
                 row=task,
                 kb_parser_config=kb_parser_config,
                 chat_mdl=chat_model,
@@ -1144,6 +1179,9 @@ async def do_handle_task(task):
     try:
         if not await _maybe_insert_chunks(chunks):
             return
+        if raptor_commit:
+            # Retired summaries were counted when they were indexed.
+            chunk_count -= await thread_pool_exec(raptor_commit)
         if has_canceled(task_id):
             progress_callback(-1, msg="Task has been canceled.")
             return
@@ -1208,10 +1246,13 @@ async def handle_task():
     pipeline_task_type = TASK_TYPE_TO_PIPELINE_TASK_TYPE.get(task_type,
                                                              PipelineTaskType.PARSE) or PipelineTaskType.PARSE
     task_id = task["id"]
+    planned = False
     try:
         logging.info(f"handle_task begin for task {json.dumps(task)}")
         CURRENT_TASKS[task["id"]] = copy.deepcopy(task)
+        RUNNING_MSGS[task_id] = redis_msg
         await do_handle_task(task)
+        planned = task_type == "plan"
         DONE_TASKS += 1
         CURRENT_TASKS.pop(task_id, None)
         logging.info(f"handle_task done for task {json.dumps(task)}")
@@ -1235,10 +1276,18 @@ async def handle_task():
             pass
         logging.exception(f"handle_task got exception for task {json.dumps(task)}")
     finally:
+        RUNNING_MSGS.pop(task_id, None)
+        TaskScheduler.release(redis_msg, task_id)
+        TaskProgressBuffer.flush(task_id)
+        _cancel_checked_at.pop(task_id, None)
+        if planned:
+            # The real tasks are queued; a failed plan keeps its row to show the error.
+            TaskService.delete_by_id(task_id)
         task_document_ids = []
         if task_type in ["graphrag", "raptor", "mindmap"]:
             task_document_ids = task["doc_ids"]
-        if not task.get("dataflow_id", ""):
+        # A plan task only re-queues the document; its real tasks log the operation.
+        if not task.get("dataflow_id", "") and task_type != "plan":
             PipelineOperationLogService.record_pipeline_operation(document_id=task["doc_id"], pipeline_id="",
                                                                   task_type=pipeline_task_type,
                                                                   fake_document_ids=task_document_ids)
@@ -1276,7 +1325,8 @@ async def report_status():
 
         group_info = REDIS_CONN.queue_info(settings.get_svr_queue_name(0), SVR_CONSUMER_GROUP_NAME) or {}
         PENDING_TASKS = int(group_info.get("pending", 0))
-        LAG_TASKS = int(group_info.get("lag", 0))
+        LAG_TASKS = int(group_info.get("lag", 0)) + TaskScheduler.queued(settings.get_svr_queue_name(0))
+        TaskScheduler.touch([(msg, task_id) for task_id, msg in list(RUNNING_MSGS.items())])
 
         current = copy.deepcopy(CURRENT_TASKS)
         heartbeat = json.dumps({
@@ -1290,6 +1340,8 @@ async def report_status():
             "done": DONE_TASKS,
             "failed": FAILED_TASKS,
             "current": current,
+            "embedding_broker": embedding_broker().stats(),
+            "llm_bridge": bridge_stats(),
         })
 
         # Report heartbeat to Redis
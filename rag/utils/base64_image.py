@@ -78,6 +78,15 @@ async def image2id(d: dict, storage_put_func: partial, objname: str, bucket: str
     del d["image"]
 
 
+def image_nbytes(img) -> int:
+    """Memory held by a chunk image: raw pixel size for PIL images, length for encoded bytes."""
+    if isinstance(img, (bytes, bytearray)):
+        return len(img)
+    if isinstance(img, Image.Image):
+        return img.width * img.height * len(img.getbands())
+    return 0
+
+
 def id2image(image_id: str | None, storage_get_func: partial):
     if not image_id:
         return
@@ -0,0 +1,254 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+"""
+LLM enrichment of chunks: keywords, questions, metadata and tags.
+
+Each enabled enrichment is an `EnrichPass`. `ChunkEnricher.run` walks the chunks in
+batches of CHUNK_ENRICH_CACHE_BATCH. The cached answers of every (chunk, pass) pair of
+a batch are fetched with one MGET, and each chunk with misses gets one task that runs
+its missing passes concurrently under `chat_limiter`. Batches are not awaited one by
+one, so the LLM calls of a batch overlap the cache lookups of the next.
+
+With CHUNK_ENRICH_COMBINE, a chunk missing both keywords and questions gets both from
+one structured-output call. The answers are cached under the keys of the two separate
+passes, so the cache is shared whichever mode wrote it.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+
+from common.constants import TAG_FLD
+from common.metadata_utils import turn2jsonschema
+from rag.graphrag.utils import chat_limiter, get_llm_cache_many, set_llm_cache
+from rag.nlp import rag_tokenizer
+from rag.prompts.generator import content_tagging, gen_metadata, keyword_extraction, keyword_question_proposal, question_proposal
+
+CHUNK_ENRICH_CACHE_BATCH = int(os.environ.get("CHUNK_ENRICH_CACHE_BATCH", "256"))
+CHUNK_ENRICH_COMBINE = int(os.environ.get("CHUNK_ENRICH_COMBINE", "0"))
+
+
+class EnrichPass:
+    """How one enrichment is cached, generated and stored on a chunk."""
+
+    name = ""
+
+    def cache_args(self) -> tuple:
+        """(history, genconf) of the LLM cache key; the chunk text is the rest of it."""
+        raise NotImplementedError
+
+    def wants(self, d: dict) -> bool:
+        return True
+
+    async def generate(self, chat_mdl, d: dict) -> str | None:
+        raise NotImplementedError
+
+    def apply(self, d: dict, cached: str):
+        raise NotImplementedError
+
+
+class KeywordPass(EnrichPass):
+    name = "keywords"
+
+    def __init__(self, topn):
+        self.topn = topn
+
+    def cache_args(self):
+        return "keywords", {"topn": self.topn}
+
+    async def generate(self, chat_mdl, d):
+        return await keyword_extraction(chat_mdl, d["content_with_weight"], self.topn)
+
+    def apply(self, d, cached):
+        d["important_kwd"] = cached.split(",")
+        d["important_tks"] = rag_tokenizer.tokenize(" ".join(d["important_kwd"]))
+
+
+class QuestionPass(EnrichPass):
+    name = "questions"
+
+    def __init__(self, topn):
+        self.topn = topn
+
+    def cache_args(self):
+        return "question", {"topn": self.topn}
+
+    async def generate(self, chat_mdl, d):
+        return await question_proposal(chat_mdl, d["content_with_weight"], self.topn)
+
+    def apply(self, d, cached):
+        d["question_kwd"] = cached.split("\n")
+        d["question_tks"] = rag_tokenizer.tokenize("\n".join(d["question_kwd"]))
+
+
+class MetadataPass(EnrichPass):
+    """Leaves the extracted metadata in d["metadata_obj"] for the caller to merge."""
+
+    name = "metadata"
+
+    def __init__(self, metadata_conf):
+        self.metadata_conf = metadata_conf
+
+    def cache_args(self):
+        return "metadata", self.metadata_conf
+
+    async def generate(self, chat_mdl, d):
+        return await gen_metadata(chat_mdl, turn2jsonschema(self.metadata_conf), d["content_with_weight"])
+
+    def apply(self, d, cached):
+        d["metadata_obj"] = cached
+
+
+class TagPass(EnrichPass):
+    """Tags the chunks in `targets` (ids of the dicts) with the LLM, using tagged chunks as examples."""
+
+    name = "tags"
+
+    def __init__(self, all_tags, examples: list, topn, targets: set):
+        self.all_tags = all_tags
+        self.examples = examples
+        self.topn = topn
+        self.targets = targets
+
+    def cache_args(self):
+        return self.all_tags, {"topn": self.topn}
+
+    def wants(self, d):
+        return id(d) in self.targets
+
+    async def generate(self, chat_mdl, d):
+        picked_examples = random.choices(self.examples, k=2) if len(self.examples) > 2 else list(self.examples)
+        if not picked_examples:
+            picked_examples.append({"content": "This is an example", TAG_FLD: {"example": 1}})
+        res = await content_tagging(chat_mdl, d["content_with_weight"], self.all_tags, picked_examples, self.topn)
+        return json.dumps(res) if res else None
+
+    def apply(self, d, cached):
+        d[TAG_FLD] = json.loads(cached)
+
+
+class ChunkEnricher:
+    def __init__(self, chat_mdl, is_canceled=None, combine: bool = bool(CHUNK_ENRICH_COMBINE), cache_batch: int = CHUNK_ENRICH_CACHE_BATCH):
+        self.chat_mdl = chat_mdl
+        self.is_canceled = is_canceled or (lambda: False)
+        self.combine = combine
+        self.cache_batch = max(1, cache_batch)
+        self.canceled = False
+        self._stats = {}
+
+    def _stat(self, name) -> dict:
+        return self._stats.setdefault(name, {"chunks": 0, "hits": 0, "calls": 0, "elapsed": 0.0})
+
+    async def run(self, docs: list[dict], passes: list[EnrichPass]):
+        """
+        Apply `passes` to `docs` in place. Stops calling the LLM once `is_canceled()` is true
+        and sets `self.canceled`; an LLM error cancels the remaining calls and is raised.
+        """
+        if not docs or not passes:
+            return
+        st = time.monotonic()
+        tasks = []
+        try:
+            for i in range(0, len(docs), self.cache_batch):
+                jobs = [(d, p) for d in docs[i:i + self.cache_batch] for p in passes if p.wants(d)]
+                cached = get_llm_cache_many(self.chat_mdl.llm_name, [(d["content_with_weight"], *p.cache_args()) for d, p in jobs])
+                misses = {}
+                for (d, p), v in zip(jobs, cached):
+                    stat = self._stat(p.name)
+                    stat["chunks"] += 1
+                    if v:
+                        stat["hits"] += 1
+                        p.apply(d, v)
+                    else:
+                        misses.setdefault(id(d), (d, []))[1].append(p)
+                for d, missing in misses.values():
+                    tasks.append(asyncio.create_task(self._enrich(d, missing)))
+                # Let the calls just queued start before fetching the next batch.
+                await asyncio.sleep(0)
+            await asyncio.gather(*tasks)
+        except Exception:
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            elapsed = time.monotonic() - st
+            for p in passes:
+                self._stat(p.name)["elapsed"] += elapsed
+
+    async def _enrich(self, d, passes):
+        calls = []
+        if self.combine:
+            kw = next((p for p in passes if isinstance(p, KeywordPass)), None)
+            q = next((p for p in passes if isinstance(p, QuestionPass)), None)
+            if kw and q:
+                calls.append(self._call_combined(d, kw, q))
+                passes = [p for p in passes if p is not kw and p is not q]
+        calls.extend(self._call(d, p) for p in passes)
+        await asyncio.gather(*calls)
+
+    def _check_canceled(self) -> bool:
+        if not self.canceled and self.is_canceled():
+            self.canceled = True
+        return self.canceled
+
+    def _store(self, d, p, res):
+        if not res:
+            return
+        set_llm_cache(self.chat_mdl.llm_name, d["content_with_weight"], res, *p.cache_args())
+        p.apply(d, res)
+
+    async def _call(self, d, p):
+        if self._check_canceled():
+            return
+        async with chat_limiter:
+            res = await p.generate(self.chat_mdl, d)
+        self._stat(p.name)["calls"] += 1
+        self._store(d, p, res)
+
+    async def _call_combined(self, d, kw, q):
+        if self._check_canceled():
+            return
+        async with chat_limiter:
+            res = await keyword_question_proposal(self.chat_mdl, d["content_with_weight"], kw.topn, q.topn)
+        self._stat("combined")["calls"] += 1
+        if res is None:
+            logging.debug("Combined keyword/question answer unusable, asking separately.")
+            await asyncio.gather(self._call(d, kw), self._call(d, q))
+            return
+        for p, v in zip((kw, q), res):
+            self._stat(p.name)["calls"] += 1
+            self._store(d, p, v)
+
+    def stats(self) -> dict:
+        """Per pass: chunks handled, cache hits, LLM calls, hit ratio and chunks per second."""
+        res = {}
+        for name, s in self._stats.items():
+            res[name] = {"chunks": s["chunks"], "hits": s["hits"], "calls": s["calls"]}
+            if s["chunks"]:
+                res[name]["hit_ratio"] = round(s["hits"] / s["chunks"], 3)
+                res[name]["chunks_per_s"] = round(s["chunks"] / max(s["elapsed"], 1e-6), 1)
+        return res
+
+    def summary(self) -> str:
+        return "; ".join(
+            "{} {} chunks, {:.0%} cached, {:.1f}/s".format(name, s["chunks"], s["hit_ratio"], s["chunks_per_s"])
+            for name, s in self.stats().items() if s["chunks"]
+        )
@@ -0,0 +1,175 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+"""
+Cross-task embedding micro-batching for the task executor.
+
+Every concurrent task of an executor hands its texts to one `EmbeddingBroker`.
+Texts for the same (tenant, embedding model) are queued in one lane; a lane is
+sent as soon as it holds `batch_size` texts, or `window` seconds after its first
+text arrived, so the many 1-5 chunk documents of a mail or ticket import share
+full batches instead of each sending a nearly empty request. Rows are routed
+back to the caller that submitted them, in order, together with its share of the
+batch's token count.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+
+import numpy as np
+
+from common.connection_utils import timeout
+from common.misc_utils import thread_pool_exec
+
+EMBEDDING_BROKER_WINDOW = float(os.environ.get("EMBEDDING_BROKER_WINDOW_MS", "20")) / 1000
+# Batches in flight across all tasks of the executor.
+EMBEDDING_BROKER_CONCURRENCY = int(os.environ.get("EMBEDDING_BROKER_CONCURRENCY", "4"))
+
+
+@timeout(60)
+def _encode(mdl, texts):
+    return mdl.encode(texts)
+
+
+class _Request:
+    __slots__ = ("future", "rows", "left", "tokens")
+
+    def __init__(self, future, n):
+        self.future = future
+        self.rows = [None] * n
+        self.left = n
+        self.tokens = 0.0
+
+
+class _Lane:
+    __slots__ = ("mdl", "items", "timer")
+
+    def __init__(self, mdl):
+        self.mdl = mdl
+        self.items = deque()  # (request, row index, text, enqueued at)
+        self.timer = None
+
+
+class EmbeddingBroker:
+    def __init__(self, batch_size: int, window: float = EMBEDDING_BROKER_WINDOW, concurrency: int = EMBEDDING_BROKER_CONCURRENCY):
+        self.batch_size = max(1, batch_size)
+        self.window = window
+        self._limiter = asyncio.Semaphore(max(1, concurrency))
+        self._lanes: dict[tuple, _Lane] = {}
+        self._inflight = set()
+        self._stats = {"batches": 0, "texts": 0, "wait": 0.0, "max_wait": 0.0}
+
+    @staticmethod
+    def _lane_key(mdl) -> tuple:
+        return getattr(mdl, "tenant_id", None), getattr(mdl, "llm_name", None) or id(mdl)
+
+    async def encode(self, mdl, texts: list[str]) -> tuple[np.ndarray, int]:
+        """Same contract as `mdl.encode(texts)`; the texts may be sent together with other tasks' texts."""
+        if not texts:
+            return np.array([]), 0
+        loop = asyncio.get_running_loop()
+        req = _Request(loop.create_future(), len(texts))
+
+        key = self._lane_key(mdl)
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = _Lane(mdl)
+        now = time.monotonic()
+        lane.items.extend((req, i, t, now) for i, t in enumerate(texts))
+        while len(lane.items) >= self.batch_size:
+            self._flush(key)
+        if lane.items and lane.timer is None:
+            lane.timer = loop.call_later(self.window, self._flush, key)
+        return await req.future
+
+    def _flush(self, key):
+        lane = self._lanes.get(key)
+        if lane is None:
+            return
+        if lane.timer is not None:
+            lane.timer.cancel()
+            lane.timer = None
+        batch = [lane.items.popleft() for _ in range(min(self.batch_size, len(lane.items)))]
+        if not lane.items:
+            del self._lanes[key]
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._dispatch(lane.mdl, batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, mdl, batch: list):
+        async with self._limiter:
+            wait = time.monotonic() - batch[0][3]
+            self._stats["batches"] += 1
+            self._stats["texts"] += len(batch)
+            self._stats["wait"] += wait
+            self._stats["max_wait"] = max(self._stats["max_wait"], wait)
+            try:
+                self._deliver(batch, *await thread_pool_exec(_encode, mdl, [t for _, _, t, _ in batch]))
+                return
+            except Exception as e:
+                groups = {}
+                for item in batch:
+                    groups.setdefault(id(item[0]), []).append(item)
+                if len(groups) == 1:
+                    self._fail(batch, e)
+                    return
+                logging.warning(f"EmbeddingBroker batch of {len(groups)} requests failed ({e}), retrying each on its own")
+
+            # One bad text (too long, rejected by the provider...) must not fail the other tasks' texts.
+            for items in groups.values():
+                try:
+                    self._deliver(items, *await thread_pool_exec(_encode, mdl, [t for _, _, t, _ in items]))
+                except Exception as e:
+                    self._fail(items, e)
+
+    @staticmethod
+    def _fail(items: list, e: Exception):
+        for req in {id(r): r for r, _, _, _ in items}.values():
+            if not req.future.done():
+                req.future.set_exception(e)
+
+    @staticmethod
+    def _deliver(items: list, vts, tokens):
+        # The provider reports tokens per batch; each request is charged in proportion to its text length.
+        chars = sum(len(t) for _, _, t, _ in items) or 1
+        for (req, i, t, _), row in zip(items, vts):
+            if req.future.done():
+                continue
+            req.rows[i] = row
+            req.tokens += tokens * len(t) / chars
+            req.left -= 1
+            if req.left == 0:
+                req.future.set_result((np.stack(req.rows), int(round(req.tokens))))
+
+    def stats(self) -> dict:
+        """Batches sent, mean fill ratio and queueing delay (enqueue of a batch's first text to send)."""
+        s = self._stats
+        batches = s["batches"] or 1
+        return {
+            "batches": s["batches"],
+            "texts": s["texts"],
+            "fill_ratio": round(s["texts"] / (batches * self.batch_size), 3),
+            "avg_wait_ms": round(s["wait"] / batches * 1000, 1),
+            "max_wait_ms": round(s["max_wait"] * 1000, 1),
+        }
+
+    def log_stats(self):
+        if self._stats["batches"]:
+            logging.info(f"EmbeddingBroker {self.stats()}")
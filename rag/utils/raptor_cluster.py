@@ -0,0 +1,171 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+"""
+Clustering engine used by RAPTOR to pick the number of clusters of a layer.
+
+The UMAP projection of a layer is computed once and shared by every
+candidate evaluation. Candidate cluster counts are fitted in waves on a
+process pool and the search stops once the BIC curve has not improved
+for `patience` consecutive candidates. Candidates are always scanned in
+ascending order, so the result only depends on `random_state`, not on
+the pool size or on scheduling.
+"""
+
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Optional
+
+import numpy as np
+import umap
+from sklearn.mixture import GaussianMixture
+
+from common.misc_utils import once
+
+RAPTOR_CLUSTER_WORKERS = int(os.environ.get("RAPTOR_CLUSTER_WORKERS", "4"))
+RAPTOR_BIC_PATIENCE = int(os.environ.get("RAPTOR_BIC_PATIENCE", "3"))
+# Minimum parallel wave: below this many samples a process round-trip costs more than the fit.
+RAPTOR_CLUSTER_PARALLEL_MIN_SAMPLES = int(os.environ.get("RAPTOR_CLUSTER_PARALLEL_MIN_SAMPLES", "256"))
+
+
+@once
+def _process_pool_executor():
+    # spawn, not fork: the task executor runs event loops and thread pools that must not be forked.
+    return ProcessPoolExecutor(
+        max_workers=max(1, RAPTOR_CLUSTER_WORKERS),
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+
+
+def _fit_candidate(embeddings: np.ndarray, n_components: int, random_state: int):
+    gm = GaussianMixture(n_components=n_components, random_state=random_state)
+    gm.fit(embeddings)
+    return n_components, gm.bic(embeddings), gm
+
+
+class RaptorClusterEngine:
+    def __init__(
+        self,
+        max_cluster: int,
+        random_state: int,
+        threshold: float = 0.1,
+        max_workers: Optional[int] = None,
+        patience: Optional[int] = None,
+    ):
+        self._max_cluster = max_cluster
+        self._random_state = random_state
+        self._threshold = threshold
+        self._max_workers = RAPTOR_CLUSTER_WORKERS if max_workers is None else max_workers
+        self._patience = RAPTOR_BIC_PATIENCE if patience is None else patience
+        self.evaluated = 0
+
+    def reduce(self, embeddings) -> np.ndarray:
+        n_neighbors = int((len(embeddings) - 1) ** 0.8)
+        return umap.UMAP(
+            n_neighbors=max(2, n_neighbors),
+            n_components=min(12, len(embeddings) - 2),
+            metric="cosine",
+            random_state=self._random_state,
+        ).fit_transform(embeddings)
+
+    def _fit_wave(self, reduced: np.ndarray, candidates: list[int]):
+        if self._max_workers <= 1 or len(candidates) <= 1 or len(reduced) < RAPTOR_CLUSTER_PARALLEL_MIN_SAMPLES:
+            return [_fit_candidate(reduced, n, self._random_state) for n in candidates]
+        pool = _process_pool_executor()
+        futures = [pool.submit(_fit_candidate, reduced, n, self._random_state) for n in candidates]
+        return [f.result() for f in futures]
+
+    def search(self, reduced: np.ndarray, check_canceled: Optional[Callable[[], None]] = None):
+        """
+        Return (n_clusters, fitted GaussianMixture or None) with the lowest BIC.
+
+        Candidates are 1..min(max_cluster, len(reduced)) - 1, as before; the
+        search ends early after `patience` consecutive non-improving candidates.
+        """
+        max_clusters = min(self._max_cluster, len(reduced))
+        candidates = list(range(1, max_clusters))
+        if not candidates:
+            return 1, None
+
+        wave_size = max(1, self._max_workers)
+        best_n, best_bic, best_model = None, None, None
+        since_best = 0
+        self.evaluated = 0
+        for i in range(0, len(candidates), wave_size):
+            if check_canceled:
+                check_canceled()
+            for n, bic, gm in self._fit_wave(reduced, candidates[i:i + wave_size]):
+                self.evaluated += 1
+                if best_bic is None or bic < best_bic:
+                    best_n, best_bic, best_model = n, bic, gm
+                    since_best = 0
+                else:
+                    since_best += 1
+                if self._patience > 0 and since_best >= self._patience:
+                    logging.debug(f"RAPTOR BIC search stopped at n={n}, best n={best_n} ({self.evaluated}/{len(candidates)} evaluated)")
+                    return best_n, best_model
+        return best_n, best_model
+
+    def cluster(self, embeddings, check_canceled: Optional[Callable[[], None]] = None):
+        """
+        Project `embeddings` with UMAP and assign one cluster label per row.
+        Returns (n_clusters, labels).
+        """
+        reduced = self.reduce(embeddings)
+        n_clusters, gm = self.search(reduced, check_canceled)
+        if n_clusters == 1:
+            return 1, [0 for _ in range(len(reduced))]
+        # The winning candidate was fitted with the same parameters, so reuse it instead of refitting.
+        probs = gm.predict_proba(reduced)
+        lbls = [np.where(prob > self._threshold)[0] for prob in probs]
+        lbls = [lbl[0] if isinstance(lbl, np.ndarray) else lbl for lbl in lbls]
+        return n_clusters, lbls
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark RAPTOR layer clustering time versus chunk count.")
+    parser.add_argument("--sizes", default="200,500,1000,2000", help="Comma separated chunk counts")
+    parser.add_argument("--dim", type=int, default=256, help="Embedding dimension")
+    parser.add_argument("--max_cluster", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=RAPTOR_CLUSTER_WORKERS)
+    parser.add_argument("--patience", type=int, default=RAPTOR_BIC_PATIENCE)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    print(f"{'chunks':>8} {'baseline(s)':>12} {'engine(s)':>10} {'speedup':>8} {'evaluated':>10} {'n(base)':>8} {'n(engine)':>10}")
+    for size in [int(s) for s in args.sizes.split(",") if s.strip()]:
+        centers = rng.normal(size=(max(2, size // 50), args.dim))
+        embds = centers[rng.integers(0, len(centers), size)] + rng.normal(scale=0.3, size=(size, args.dim))
+
+        baseline = RaptorClusterEngine(args.max_cluster, args.seed, max_workers=1, patience=0)
+        engine = RaptorClusterEngine(args.max_cluster, args.seed, max_workers=args.workers, patience=args.patience)
+        reduced = baseline.reduce(embds)
+
+        st = time.perf_counter()
+        n_base, _ = baseline.search(reduced)
+        t_base = time.perf_counter() - st
+
+        st = time.perf_counter()
+        n_engine, _ = engine.search(reduced)
+        t_engine = time.perf_counter() - st
+
+        print(f"{size:>8} {t_base:>12.2f} {t_engine:>10.2f} {t_base / max(t_engine, 1e-9):>7.1f}x {engine.evaluated:>10} {n_base:>8} {n_engine:>10}")
@@ -18,6 +18,7 @@
 Utility functions for Raptor processing decisions.
 """
 
+import json
 import logging
 from typing import Optional
 
@@ -142,3 +143,53 @@ def get_skip_reason(
             return f"Tabular PDF (parser={parser_id}) - Raptor auto-disabled"
 
     return ""
+
+
+# Tree states live in their own bucket, one object per knowledge base. Uploads go to the
+# bucket named after the knowledge base under their file name, so they can never reach it.
+RAPTOR_STATE_BUCKET = "raptor-state"
+
+
+def load_raptor_state(kb_id: str) -> dict:
+    """
+    Load the incremental RAPTOR tree states of a knowledge base.
+
+    Returns:
+        Dict keyed by tree id (document id, or the fake doc id for KB scope);
+        empty if nothing was persisted or the object is unreadable
+    """
+    from common import settings
+
+    try:
+        if not settings.STORAGE_IMPL.obj_exist(RAPTOR_STATE_BUCKET, kb_id):
+            return {}
+        return json.loads(settings.STORAGE_IMPL.get(RAPTOR_STATE_BUCKET, kb_id))
+    except Exception:
+        logging.exception(f"Failed to load RAPTOR tree state of kb {kb_id}, rebuilding from scratch")
+        return {}
+
+
+def save_raptor_state(kb_id: str, states: dict):
+    from common import settings
+
+    settings.STORAGE_IMPL.put(RAPTOR_STATE_BUCKET, kb_id, json.dumps(states).encode("utf-8"))
+
+
+def remove_raptor_state(kb_id: str):
+    from common import settings
+
+    if settings.STORAGE_IMPL.obj_exist(RAPTOR_STATE_BUCKET, kb_id):
+        settings.STORAGE_IMPL.rm(RAPTOR_STATE_BUCKET, kb_id)
+
+
+def prune_raptor_state(states: dict, tree_ids: set) -> list:
+    """
+    Drop the trees of documents that no longer exist, in place.
+
+    Returns:
+        The ids of the dropped trees
+    """
+    dropped = [k for k in states if k not in tree_ids]
+    for k in dropped:
+        del states[k]
+    return dropped
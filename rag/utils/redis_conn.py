@@ -41,6 +41,7 @@ class RedisMsg:
         self.__group_name = group_name
         self.__msg_id = msg_id
         self.__message = json.loads(message["message"])
+        self.__tenant_id = message.get("tenant_id", "")
 
     def ack(self):
         try:
@@ -56,6 +57,13 @@ class RedisMsg:
     def get_msg_id(self):
         return self.__msg_id
 
+    def get_queue_name(self):
+        return self.__queue_name
+
+    def get_tenant_id(self):
+        """Set on messages dispatched by TaskScheduler, empty otherwise."""
+        return self.__tenant_id
+
 
 @singleton
 class RedisDB:
@@ -188,6 +196,16 @@ class RedisDB:
             logging.warning("RedisDB.get " + str(k) + " got exception: " + str(e))
             self.__open__()
 
+    def mget(self, keys: list) -> list:
+        if not keys:
+            return []
+        try:
+            return self.REDIS.mget(keys)
+        except Exception as e:
+            logging.warning("RedisDB.mget " + str(keys[0]) + "... got exception: " + str(e))
+            self.__open__()
+        return [None] * len(keys)
+
     def set_obj(self, k, obj, exp=3600):
         try:
             self.REDIS.set(k, json.dumps(obj, ensure_ascii=False), exp)
@@ -235,6 +253,73 @@ class RedisDB:
             self.__open__()
         return None
 
+    def hset(self, key: str, field: str, value: str, exp: int | None = None):
+        try:
+            pipe = self.REDIS.pipeline()
+            pipe.hset(key, field, value)
+            if exp:
+                pipe.expire(key, exp)
+            pipe.execute()
+            return True
+        except Exception as e:
+            logging.warning("RedisDB.hset " + str(key) + " got exception: " + str(e))
+            self.__open__()
+        return False
+
+    def hmset(self, key: str, mapping: dict, exp: int | None = None):
+        """Set several hash fields in one round trip, refreshing the key's TTL."""
+        try:
+            pipe = self.REDIS.pipeline()
+            pipe.hset(key, mapping=mapping)
+            if exp:
+                pipe.expire(key, exp)
+            pipe.execute()
+            return True
+        except Exception as e:
+            logging.warning("RedisDB.hmset " + str(key) + " got exception: " + str(e))
+            self.__open__()
+        return False
+
+    def hmget(self, key: str, fields: list) -> list:
+        try:
+            return self.REDIS.hmget(key, fields)
+        except Exception as e:
+            logging.warning("RedisDB.hmget " + str(key) + " got exception: " + str(e))
+            self.__open__()
+        return [None] * len(fields)
+
+    def hgetall(self, key: str) -> dict:
+        try:
+            return self.REDIS.hgetall(key)
+        except Exception as e:
+            logging.warning("RedisDB.hgetall " + str(key) + " got exception: " + str(e))
+            self.__open__()
+        return {}
+
+    def rpush(self, key: str, value: str, exp: int | None = None, maxlen: int | None = None):
+        """Append one entry; with `maxlen` only the newest entries are kept."""
+        try:
+            pipe = self.REDIS.pipeline()
+            pipe.rpush(key, value)
+            if maxlen:
+                pipe.ltrim(key, -maxlen, -1)
+            if exp:
+                pipe.expire(key, exp)
+            pipe.execute()
+            return True
+        except Exception as e:
+            logging.warning("RedisDB.rpush " + str(key) + " got exception: " + str(e))
+            self.__open__()
+        return False
+
+    def lrange(self, key: str, start: int = 0, end: int = -1) -> list:
+        try:
+            return self.REDIS.lrange(key, start, end)
+        except Exception as e:
+            logging.warning("RedisDB.lrange " + str(key) + " got exception: " + str(e))
+            self.__open__()
+        return []
+
     def zadd(self, key: str, member: str, score: float):
         try:
             self.REDIS.zadd(key, {member: score})
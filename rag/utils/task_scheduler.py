@@ -0,0 +1,426 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+"""
+Tenant-fair dispatch in front of the per-priority task streams.
+
+Producers append tasks to a per-tenant list instead of the stream. Whenever an
+executor finds a stream empty it asks `TaskScheduler.dispatch` to move a small
+batch into it: it repeatedly picks the active tenant with the lowest virtual
+time (weighted fair queuing: every dispatch advances the tenant by 1/weight, a
+tenant joining the active set starts at the current clock) and skips tenants
+that already have `cap` tasks dispatched and not yet released. The cap only
+holds a tenant back while another tenant has queued work; once every tenant
+with work is at its cap, they are dispatched past it. The stream keeps its
+consumer-group semantics, so ack, retry and the unacked recovery of
+`collect()` are unchanged. The stream only ever holds a few tasks, so whichever
+executor is idle takes the next one and a large backlog stays in the tenant lists.
+
+Redis layout for a stream `q`, under the hash tag `{q}` so every key of the
+scheduler and the stream itself live in one Redis Cluster slot:
+`{q}:sched:q:<tenant>` task lists, `{q}:sched:active` zset of tenants with
+work, `{q}:sched:running:<tenant>` zset of dispatched task ids (scored by the
+last heartbeat of the executor running them), `{q}:sched:clock`, and the
+optional `{q}:sched:weights` and `{q}:sched:caps` hashes holding per-tenant
+overrides. Both scripts receive every key they touch in KEYS.
+"""
+
+import json
+import logging
+import os
+import time
+
+from rag.utils.redis_conn import REDIS_CONN
+from common import settings
+
+TASK_SCHEDULER_ENABLED = int(os.environ.get("TASK_SCHEDULER_ENABLED", "1"))
+# Tasks one tenant may have dispatched at the same time while other tenants have queued work; 0 disables the cap.
+TASK_SCHED_TENANT_CAP = int(os.environ.get("TASK_SCHED_TENANT_CAP", "16"))
+# Tasks moved into an empty stream per refill.
+TASK_SCHED_PREFETCH = int(os.environ.get("TASK_SCHED_PREFETCH", "2"))
+# Executors refresh their running tasks with every heartbeat (30s); a task not refreshed
+# for this long (its executor died) stops counting against the cap.
+TASK_SCHED_RUNNING_TTL = int(os.environ.get("TASK_SCHED_RUNNING_TTL", 300))
+
+
+class TaskScheduler:
+    LUA_ENQUEUE_SCRIPT = """
+        -- KEYS[1] = tenant queue, KEYS[2] = active, KEYS[3] = clock, KEYS[4] = tenant running
+        -- ARGV[1] = tenant, ARGV[2] = message, ARGV[3] = "1" to push in front
+        -- ARGV[4] = task id to release (hand back), may be empty
+        local tenant = ARGV[1]
+        if ARGV[3] == "1" then
+            redis.call("LPUSH", KEYS[1], ARGV[2])
+        else
+            redis.call("RPUSH", KEYS[1], ARGV[2])
+        end
+        if ARGV[4] ~= "" then
+            redis.call("ZREM", KEYS[4], ARGV[4])
+        end
+        if not redis.call("ZSCORE", KEYS[2], tenant) then
+            local clock = tonumber(redis.call("GET", KEYS[3])) or 0
+            redis.call("ZADD", KEYS[2], clock, tenant)
+        end
+        return 1
+    """
+
+    LUA_DISPATCH_SCRIPT = """
+        -- KEYS[1] = active, KEYS[2] = clock, KEYS[3] = weights, KEYS[4] = caps,
+        -- KEYS[5] = tenant queue, KEYS[6] = tenant running, KEYS[7] = stream
+        -- ARGV[1] = tenant, ARGV[2] = now, ARGV[3] = running ttl, ARGV[4] = default cap,
+        -- ARGV[5] = "1" to enforce the cap
+        -- Returns 1 if a task was moved, 0 if the tenant has no work, -1 if it is at its cap.
+        local tenant = ARGV[1]
+        local now = tonumber(ARGV[2])
+        local ttl = tonumber(ARGV[3])
+        local score = tonumber(redis.call("ZSCORE", KEYS[1], tenant))
+        if not score then
+            return 0
+        end
+        redis.call("ZREMRANGEBYSCORE", KEYS[6], "-inf", now - ttl)
+        if ARGV[5] == "1" then
+            local cap = tonumber(redis.call("HGET", KEYS[4], tenant)) or tonumber(ARGV[4])
+            if cap > 0 and redis.call("ZCARD", KEYS[6]) >= cap then
+                return -1
+            end
+        end
+
+        local raw = redis.call("LPOP", KEYS[5])
+        if raw then
+            local ok, msg = pcall(cjson.decode, raw)
+            local task_id = (ok and type(msg) == "table" and msg["id"]) or raw
+            redis.call("XADD", KEYS[7], "*", "message", raw, "tenant_id", tenant)
+            redis.call("ZADD", KEYS[6], now, task_id)
+            redis.call("EXPIRE", KEYS[6], ttl)
+            local weight = tonumber(redis.call("HGET", KEYS[3], tenant)) or 1
+            if weight <= 0 then
+                weight = 1
+            end
+            redis.call("SET", KEYS[2], score)
+            redis.call("ZINCRBY", KEYS[1], 1 / weight, tenant)
+        end
+        if redis.call("LLEN", KEYS[5]) == 0 then
+            redis.call("ZREM", KEYS[1], tenant)
+        end
+        if raw then
+            return 1
+        end
+        return 0
+    """
+
+    _enqueue_script = None
+    _dispatch_script = None
+
+    @staticmethod
+    def _prefix(queue_name: str) -> str:
+        return f"{{{queue_name}}}:sched"
+
+    @classmethod
+    def _enqueue_keys(cls, queue_name: str, tenant_id: str) -> list[str]:
+        prefix = cls._prefix(queue_name)
+        return [f"{prefix}:q:{tenant_id}", f"{prefix}:active", f"{prefix}:clock", f"{prefix}:running:{tenant_id}"]
+
+    @classmethod
+    def _dispatch_keys(cls, queue_name: str, tenant_id: str) -> list[str]:
+        prefix = cls._prefix(queue_name)
+        return [
+            f"{prefix}:active",
+            f"{prefix}:clock",
+            f"{prefix}:weights",
+            f"{prefix}:caps",
+            f"{prefix}:q:{tenant_id}",
+            f"{prefix}:running:{tenant_id}",
+            queue_name,
+        ]
+
+    @classmethod
+    def _scripts(cls):
+        if cls._enqueue_script is None:
+            cls._enqueue_script = REDIS_CONN.REDIS.register_script(cls.LUA_ENQUEUE_SCRIPT)
+            cls._dispatch_script = REDIS_CONN.REDIS.register_script(cls.LUA_DISPATCH_SCRIPT)
+        return cls._enqueue_script, cls._dispatch_script
+
+    @classmethod
+    def enqueue(cls, priority: int, tenant_id: str, message: dict) -> bool:
+        """Queue a task behind the tenant's earlier tasks. Falls back to the plain stream when disabled or tenant-less."""
+        queue_name = settings.get_svr_queue_name(priority)
+        if not TASK_SCHEDULER_ENABLED or not tenant_id:
+            return REDIS_CONN.queue_product(queue_name, message=message)
+        for _ in range(3):
+            try:
+                enqueue, _ = cls._scripts()
+                enqueue(keys=cls._enqueue_keys(queue_name, tenant_id), args=[tenant_id, json.dumps(message), "0", ""], client=REDIS_CONN.REDIS)
+                return True
+            except Exception as e:
+                logging.warning(f"TaskScheduler.enqueue {queue_name} got exception: {e}")
+        return False
+
+    @classmethod
+    def enqueue_many(cls, priority: int, tenant_id: str, messages: list[dict]) -> bool:
+        """`enqueue` for a batch of tasks in one pipelined round trip."""
+        queue_name = settings.get_svr_queue_name(priority)
+        for _ in range(3):
+            try:
+                pipe = REDIS_CONN.REDIS.pipeline(transaction=False)
+                if not TASK_SCHEDULER_ENABLED or not tenant_id:
+                    for message in messages:
+                        pipe.xadd(queue_name, {"message": json.dumps(message)})
+                else:
+                    enqueue, _ = cls._scripts()
+                    for message in messages:
+                        enqueue(keys=cls._enqueue_keys(queue_name, tenant_id), args=[tenant_id, json.dumps(message), "0", ""], client=pipe)
+                pipe.execute()
+                return True
+            except Exception as e:
+                logging.warning(f"TaskScheduler.enqueue_many {queue_name} got exception: {e}")
+        return False
+
+    @classmethod
+    def dispatch(cls, queue_name: str, n: int = TASK_SCHED_PREFETCH) -> int:
+        """Move up to `n` tasks into the stream, fairly across tenants. Returns how many were moved."""
+        if not TASK_SCHEDULER_ENABLED:
+            return 0
+        active = f"{cls._prefix(queue_name)}:active"
+        dispatched, capped, enforce_cap = 0, set(), True
+        try:
+            _, dispatch = cls._scripts()
+            while dispatched < n:
+                # Lowest virtual time first; the script re-checks the tenant atomically.
+                tenants = [t for t in REDIS_CONN.REDIS.zrange(active, 0, -1) if t not in capped]
+                if not tenants:
+                    if not (enforce_cap and capped):
+                        break
+                    # Every tenant with queued work is at its cap, so nobody is waiting behind them.
+                    enforce_cap, capped = False, set()
+                    continue
+                for tenant in tenants:
+                    moved = int(dispatch(
+                        keys=cls._dispatch_keys(queue_name, tenant),
+                        args=[tenant, time.time(), TASK_SCHED_RUNNING_TTL, TASK_SCHED_TENANT_CAP, "1" if enforce_cap else "0"],
+                        client=REDIS_CONN.REDIS,
+                    ))
+                    if moved < 0:
+                        capped.add(tenant)
+                        continue
+                    dispatched += moved
+                    break
+        except Exception as e:
+            logging.warning(f"TaskScheduler.dispatch {queue_name} got exception: {e}")
+        return dispatched
+
+    @classmethod
+    def queued(cls, queue_name: str) -> int:
+        """Tasks waiting in the tenant lists of `queue_name`, i.e. not yet in the stream."""
+        if not TASK_SCHEDULER_ENABLED:
+            return 0
+        prefix = cls._prefix(queue_name)
+        try:
+            tenants = REDIS_CONN.REDIS.zrange(f"{prefix}:active", 0, -1)
+            if not tenants:
+                return 0
+            pipe = REDIS_CONN.REDIS.pipeline(transaction=False)
+            for tenant in tenants:
+                pipe.llen(f"{prefix}:q:{tenant}")
+            return sum(int(n or 0) for n in pipe.execute())
+        except Exception as e:
+            logging.warning(f"TaskScheduler.queued {queue_name} got exception: {e}")
+        return 0
+
+    @classmethod
+    def touch(cls, running: list) -> None:
+        """
+        Refresh [(redis_msg, task_id)] of tasks this executor is still running, so they keep
+        their tenant slot; without it a slot frees itself TASK_SCHED_RUNNING_TTL after dispatch.
+        """
+        pipe = None
+        now = time.time()
+        for redis_msg, task_id in running:
+            tenant_id = redis_msg.get_tenant_id() if redis_msg else ""
+            if not tenant_id:
+                continue
+            if pipe is None:
+                pipe = REDIS_CONN.REDIS.pipeline(transaction=False)
+            key = f"{cls._prefix(redis_msg.get_queue_name())}:running:{tenant_id}"
+            pipe.zadd(key, {task_id: now}, xx=True)
+            pipe.expire(key, TASK_SCHED_RUNNING_TTL)
+        if pipe is None:
+            return
+        try:
+            pipe.execute()
+        except Exception as e:
+            logging.warning(f"TaskScheduler.touch got exception: {e}")
+
+    @classmethod
+    def release(cls, redis_msg, task_id: str):
+        """The task dispatched in `redis_msg` is finished, failed or dropped; free its tenant slot."""
+        tenant_id = redis_msg.get_tenant_id() if redis_msg else ""
+        if not tenant_id:
+            return
+        key = f"{cls._prefix(redis_msg.get_queue_name())}:running:{tenant_id}"
+        try:
+            REDIS_CONN.REDIS.zrem(key, task_id)
+        except Exception as e:
+            logging.warning(f"TaskScheduler.release {key} got exception: {e}")
+
+    @classmethod
+    def hand_back(cls, redis_msg) -> bool:
+        """
+        Return a dispatched but unstarted task to the front of its tenant queue and ack it,
+        so another executor picks it up. False if the message did not come from the scheduler.
+        """
+        tenant_id = redis_msg.get_tenant_id()
+        if not tenant_id:
+            return False
+        message = redis_msg.get_message()
+        try:
+            enqueue, _ = cls._scripts()
+            enqueue(
+                keys=cls._enqueue_keys(redis_msg.get_queue_name(), tenant_id),
+                args=[tenant_id, json.dumps(message), "1", message.get("id", "")],
+                client=REDIS_CONN.REDIS,
+            )
+        except Exception as e:
+            logging.warning(f"TaskScheduler.hand_back {redis_msg.get_msg_id()} got exception: {e}")
+            return False
+        return redis_msg.ack()
+
+    @classmethod
+    def set_tenant_policy(cls, tenant_id: str, weight: float | None = None, cap: int | None = None):
+        """Override the weight (default 1) or the concurrency cap of a tenant on every priority queue."""
+        for queue_name in settings.get_svr_queue_names():
+            prefix = cls._prefix(queue_name)
+            if weight is not None:
+                REDIS_CONN.REDIS.hset(f"{prefix}:weights", tenant_id, weight)
+            if cap is not None:
+                REDIS_CONN.REDIS.hset(f"{prefix}:caps", tenant_id, cap)
+
+    @classmethod
+    def stats(cls, queue_name: str) -> dict:
+        """{tenant: {"queued": n, "running": n, "vtime": score}} for the tenants with queued work."""
+        prefix = cls._prefix(queue_name)
+        res = {}
+        try:
+            for tenant, score in REDIS_CONN.REDIS.zrange(f"{prefix}:active", 0, -1, withscores=True):
+                res[tenant] = {
+                    "queued": REDIS_CONN.REDIS.llen(f"{prefix}:q:{tenant}"),
+                    "running": REDIS_CONN.REDIS.zcard(f"{prefix}:running:{tenant}"),
+                    "vtime": score,
+                }
+        except Exception as e:
+            logging.warning(f"TaskScheduler.stats {queue_name} got exception: {e}")
+        return res
+
+
+if __name__ == "__main__":
+    # Offline simulation of the dispatch policy above (no Redis): queue wait per tenant
+    # for plain FIFO versus tenant-fair dispatch when one tenant floods the queue.
+    import argparse
+    import heapq
+    import random
+    from collections import defaultdict, deque
+
+    parser = argparse.ArgumentParser(description="Simulate per-tenant queue wait under FIFO and tenant-fair dispatch.")
+    parser.add_argument("--workers", type=int, default=16, help="Concurrent task slots across all executors")
+    parser.add_argument("--bulk", type=int, default=10000, help="Tasks the flooding tenant submits at t=0")
+    parser.add_argument("--tenants", type=int, default=5, help="Interactive tenants")
+    parser.add_argument("--interval", type=float, default=60, help="Mean seconds between an interactive tenant's uploads")
+    parser.add_argument("--service", type=float, default=20, help="Mean task duration in seconds")
+    parser.add_argument("--horizon", type=float, default=3600, help="Seconds of interactive arrivals")
+    parser.add_argument("--cap", type=int, default=TASK_SCHED_TENANT_CAP)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    class FifoModel:
+        def __init__(self):
+            self.q = deque()
+
+        def add(self, tenant, item):
+            self.q.append((tenant, item))
+
+        def pop(self, running):
+            return self.q.popleft() if self.q else None
+
+    class FairModel:
+        """Same decisions as LUA_ENQUEUE_SCRIPT / LUA_DISPATCH_SCRIPT."""
+
+        def __init__(self, cap):
+            self.cap = cap
+            self.queues = defaultdict(deque)
+            self.active = {}
+            self.clock = 0.0
+
+        def add(self, tenant, item):
+            self.queues[tenant].append(item)
+            self.active.setdefault(tenant, self.clock)
+
+        def pop(self, running):
+            ordered = sorted(self.active.items(), key=lambda kv: (kv[1], kv[0]))
+            below_cap = [kv for kv in ordered if self.cap <= 0 or running[kv[0]] < self.cap]
+            for tenant, score in below_cap or ordered:
+                item = self.queues[tenant].popleft()
+                self.clock = score
+                self.active[tenant] = score + 1
+                if not self.queues[tenant]:
+                    del self.active[tenant]
+                return tenant, item
+            return None
+
+    def simulate(model, rng):
+        arrivals = [(0.0, "bulk") for _ in range(args.bulk)]
+        for i in range(args.tenants):
+            t = rng.expovariate(1 / args.interval)
+            while t < args.horizon:
+                arrivals.append((t, f"tenant-{i}"))
+                t += rng.expovariate(1 / args.interval)
+        arrivals.sort()
+        durations = [rng.expovariate(1 / args.service) for _ in arrivals]
+
+        waits = defaultdict(list)
+        running = defaultdict(int)
+        busy = []
+        now, i, free = 0.0, 0, args.workers
+        while i < len(arrivals) or busy:
+            while i < len(arrivals) and arrivals[i][0] <= now:
+                model.add(arrivals[i][1], (arrivals[i][0], durations[i]))
+                i += 1
+            while free:
+                picked = model.pop(running)
+                if not picked:
+                    break
+                tenant, (arrived, duration) = picked
+                waits[tenant].append(now - arrived)
+                running[tenant] += 1
+                free -= 1
+                heapq.heappush(busy, (now + duration, tenant))
+            next_arrival = arrivals[i][0] if i < len(arrivals) else float("inf")
+            next_done = busy[0][0] if busy else float("inf")
+            now = min(next_arrival, next_done)
+            while busy and busy[0][0] <= now:
+                _, tenant = heapq.heappop(busy)
+                running[tenant] -= 1
+                free += 1
+        return waits
+
+    def pct(values, p):
+        values = sorted(values)
+        return values[min(len(values) - 1, int(p * len(values)))]
+
+    fifo = simulate(FifoModel(), random.Random(args.seed))
+    fair = simulate(FairModel(args.cap), random.Random(args.seed))
+    print(f"{'tenant':>10} {'tasks':>6} {'fifo p50':>9} {'fifo p95':>9} {'fifo max':>9} {'fair p50':>9} {'fair p95':>9} {'fair max':>9}  (seconds waited in queue)")
+    for tenant in sorted(fifo):
+        a, b = fifo[tenant], fair[tenant]
+        print(f"{tenant:>10} {len(a):>6} {pct(a, .5):>9.0f} {pct(a, .95):>9.0f} {max(a):>9.0f} {pct(b, .5):>9.0f} {pct(b, .95):>9.0f} {max(b):>9.0f}")
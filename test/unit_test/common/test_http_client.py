@@ -0,0 +1,98 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import asyncio
+import http.server
+import json
+import threading
+import time
+
+import httpx
+import pytest
+
+from common import http_client
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    peers = set()
+
+    def do_POST(self):
+        _Handler.peers.add(self.client_address)
+        self.rfile.read(int(self.headers["content-length"]))
+        body = json.dumps({"ok": True}).encode()
+        self.send_response(200)
+        self.send_header("Set-Cookie", "session=tenant-a")
+        self.send_header("content-length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    _Handler.peers = set()
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/rerank"
+    http_client.close_pools()
+    server.shutdown()
+    server.server_close()
+
+
+class TestPooledClient:
+    def test_reuses_connection(self, server_url):
+        for _ in range(10):
+            assert http_client.pooled_request("POST", server_url, json={}).json() == {"ok": True}
+        assert len(_Handler.peers) == 1
+        assert http_client.pool_stats()[http_client._origin(server_url)]["requests"] >= 10
+
+    def test_one_client_per_origin(self, server_url):
+        assert http_client.get_pooled_client(server_url) is http_client.get_pooled_client(server_url.replace("/rerank", "/embed"))
+        assert http_client.get_pooled_client(server_url) is not http_client.get_pooled_client("https://api.example.com/v1")
+
+    def test_never_stores_cookies(self, server_url):
+        http_client.pooled_request("POST", server_url, json={})
+        assert len(http_client.get_pooled_client(server_url).cookies) == 0
+
+    def test_close_by_provider_is_ignored(self, server_url):
+        client = http_client.get_pooled_client(server_url)
+        client.close()
+        assert not client.is_closed
+        assert http_client.pooled_request("POST", server_url, json={}).status_code == 200
+
+    def test_async_client_across_event_loops(self, server_url):
+        async def call():
+            try:
+                return await http_client.async_pooled_request("POST", server_url, json={})
+            finally:
+                await http_client.aclose_loop_pools()
+
+        for _ in range(2):
+            assert asyncio.run(call()).json() == {"ok": True}
+
+    def test_full_pool_fails_fast(self, server_url, monkeypatch):
+        monkeypatch.setattr(http_client, "HTTP_POOL_MAX_CONNECTIONS_PER_HOST", 1)
+        monkeypatch.setattr(http_client, "HTTP_POOL_ACQUIRE_TIMEOUT", 0.2)
+        client = http_client.get_pooled_client(server_url)
+        # An unread streamed response keeps the only connection checked out.
+        with client.stream("POST", server_url, json={}):
+            started = time.monotonic()
+            with pytest.raises(httpx.PoolTimeout):
+                client.post(server_url, json={}, timeout=600)
+            assert time.monotonic() - started < 5
+        assert http_client.pool_stats()[http_client._origin(server_url)]["pool_timeouts"] == 1
@@ -14,7 +14,8 @@
 #  limitations under the License.
 #
 
-from common.token_utils import num_tokens_from_string, total_token_count_from_response, truncate, encoder
+from common.token_utils import num_tokens_from_string, total_token_count_from_response, truncate, encoder, \
+    num_tokens_from_strings, token_upper_bound, within_token_budget, token_count_cache_stats
 import pytest
 
 
@@ -371,3 +372,41 @@ class TestTruncate:
 
         result = truncate(number_string, max_len)
         assert len(encoder.encode(result)) == max_len
+
+
+class TestTokenCountCache:
+    """Test cases for the cached, batched and estimated token counts"""
+
+    texts = [
+        "Retrieval-augmented generation combines a search step with a language model. " * 3,
+        "检索增强生成把检索和大语言模型结合起来，用检索到的内容回答问题。" * 3,
+        "short",
+        "",
+    ]
+
+    def test_cached_count_matches_encoder(self):
+        for text in self.texts:
+            assert num_tokens_from_string(text) == len(encoder.encode(text))
+            hits = token_count_cache_stats().get("hit", 0)
+            assert num_tokens_from_string(text) == len(encoder.encode(text))
+            if len(text) >= 64:
+                assert token_count_cache_stats()["hit"] == hits + 1
+
+    def test_batch_matches_single(self):
+        texts = self.texts + [f"Section {i}: " + "lorem ipsum dolor sit amet " * i for i in range(40)]
+        assert num_tokens_from_strings(texts) == [len(encoder.encode(t)) for t in texts]
+
+    def test_upper_bound(self):
+        for text in self.texts:
+            assert token_upper_bound(text) >= len(encoder.encode(text))
+
+    def test_within_budget(self):
+        text = self.texts[0]
+        n = len(encoder.encode(text))
+        assert within_token_budget(text, n)
+        assert not within_token_budget(text, n - 1)
+
+    def test_truncate_keeps_text_under_budget(self):
+        text = self.texts[1]
+        assert truncate(text, 10000) is text
+        assert truncate(text, len(encoder.encode(text))) == text
@@ -0,0 +1,100 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+"""
+Unit tests for the array-backed GraphRAG graph.
+"""
+
+import networkx as nx
+import pytest
+
+from rag.graphrag.general.csr_graph import CSRGraph
+
+
+def _weighted_graph(n=200, seed=0):
+    g = nx.barabasi_albert_graph(n, 3, seed=seed)
+    g = nx.relabel_nodes(g, {i: f"ENTITY {i}" for i in g.nodes()})
+    for k, (u, v) in enumerate(g.edges()):
+        g.edges[u, v]["weight"] = float(k % 7 + 1)
+    return g
+
+
+class TestFromNetworkx:
+    def test_symmetric_adjacency(self):
+        g = _weighted_graph(50)
+        csr = CSRGraph.from_networkx(g)
+        assert len(csr) == 50
+        assert csr.num_edges == g.number_of_edges()
+        assert (csr.adjacency != csr.adjacency.T).nnz == 0
+
+    def test_normalize_merges_colliding_names(self):
+        g = nx.Graph()
+        g.add_edge(" alice ", "BOB", weight=1.0)
+        g.add_edge("Alice", "bob", weight=2.0)
+        csr = CSRGraph.from_networkx(g, normalize=True)
+        assert csr.nodes == ["ALICE", "BOB"]
+        assert csr.adjacency[0, 1] == 3.0
+
+
+class TestAnalytics:
+    def test_pagerank_matches_networkx(self):
+        g = _weighted_graph()
+        expected = nx.pagerank(g)
+        got = CSRGraph.from_networkx(g).pagerank()
+        assert max(abs(expected[k] - got[k]) for k in expected) < 1e-6
+
+    def test_largest_connected_component(self):
+        g = _weighted_graph(30)
+        g.add_edge("ISLAND A", "ISLAND B")
+        lcc = CSRGraph.from_networkx(g).largest_connected_component()
+        assert len(lcc) == 30
+        assert "ISLAND A" not in lcc.index
+
+    def test_n_hop_paths(self):
+        g = nx.Graph()
+        g.add_edge("A", "B", weight=3.0)
+        g.add_edge("B", "C", weight=1.0)
+        g.add_edge("A", "D", weight=2.0)
+        paths = CSRGraph.from_networkx(g).n_hop_paths("A", n_hops=2)
+        assert {"path": ["A", "B"], "weights": [3.0]} in paths
+        assert {"path": ["A", "B", "C"], "weights": [3.0, 1.0]} in paths
+        assert all(p["path"][0] == "A" for p in paths)
+        assert CSRGraph.from_networkx(g).n_hop_paths("Z") == []
+
+
+class TestLeiden:
+    @pytest.fixture(autouse=True)
+    def _needs_graspologic(self):
+        pytest.importorskip("graspologic")
+
+    def test_csr_backend_matches_networkx(self):
+        from rag.graphrag.general import leiden
+
+        g = _weighted_graph(300)
+        g.add_edge("ENTITY 1", "ENTITY 1", weight=2.0)
+        csr = leiden.run(g, {"backend": "csr", "max_cluster_size": 12})
+        assert csr
+        assert csr == leiden.run(g, {"backend": "networkx", "max_cluster_size": 12})
+
+    def test_every_node_gets_a_community(self):
+        g = _weighted_graph(100)
+        levels = CSRGraph.from_networkx(g).leiden(max_cluster_size=12, seed=0xDEADBEEF)
+        assert set(levels[0]) == set(g.nodes())
+
+    def test_empty_graph(self):
+        g = nx.Graph()
+        g.add_nodes_from(["A", "B"])
+        assert CSRGraph.from_networkx(g).leiden(max_cluster_size=12, seed=0) == {}
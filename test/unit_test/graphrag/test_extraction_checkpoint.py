@@ -0,0 +1,95 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+"""
+Unit tests for the per-chunk GraphRAG extraction checkpoint.
+"""
+
+import asyncio
+
+import pytest
+
+from rag.graphrag import checkpoint as checkpoint_mod
+from rag.graphrag.checkpoint import ExtractionCheckpoint, ExtractionResults
+
+
+class FakeRedis:
+    def __init__(self):
+        self.hashes = {}
+
+    def hset(self, key, field, value, exp=None):
+        self.hashes.setdefault(key, {})[field] = value
+        return True
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def delete(self, key):
+        self.hashes.pop(key, None)
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    fake = FakeRedis()
+    monkeypatch.setattr(checkpoint_mod, "REDIS_CONN", fake)
+    return fake
+
+
+RESULT = ({"ALICE": [{"entity_type": "person"}]}, {("ALICE", "BOB"): [{"weight": 1.0}]}, 42)
+
+
+class TestExtractionCheckpoint:
+    def test_round_trip(self, redis):
+        ExtractionCheckpoint("doc1", "extractor", "llm", ["person"]).save("chunk text", RESULT)
+        assert ExtractionCheckpoint("doc1", "extractor", "llm", ["person"]).get("chunk text") == RESULT
+
+    def test_config_change_misses(self, redis):
+        ExtractionCheckpoint("doc1", "extractor", "llm", ["person"]).save("chunk text", RESULT)
+        assert ExtractionCheckpoint("doc1", "extractor", "other-llm", ["person"]).get("chunk text") is None
+        assert ExtractionCheckpoint("doc1", "extractor", "llm", ["person", "place"]).get("chunk text") is None
+
+    def test_corrupted_entry_is_ignored(self, redis):
+        cp = ExtractionCheckpoint("doc1", "extractor", "llm", [])
+        redis.hset(cp._key, cp.chunk_key("chunk text"), "{broken")
+        assert cp.get("chunk text") is None
+
+    def test_clear(self, redis):
+        cp = ExtractionCheckpoint("doc1", "extractor", "llm", [])
+        cp.save("chunk text", RESULT)
+        cp.clear()
+        assert cp.get("chunk text") is None
+
+
+class TestExtractionResults:
+    def test_merge_sorts_edge_keys(self):
+        results = ExtractionResults()
+        results.merge(({"A": [1]}, {("B", "A"): [1]}, 3))
+        results.merge(({"A": [2]}, {("A", "B"): [2]}, 4), from_checkpoint=True)
+        assert results.nodes == {"A": [1, 2]}
+        assert results.edges == {("A", "B"): [1, 2]}
+        assert (results.token_count, results.extracted, results.skipped, len(results)) == (7, 1, 1, 2)
+
+    def test_chunk_sink_checkpoints_off_the_loop(self, redis):
+        async def run():
+            results = ExtractionResults()
+            cp = ExtractionCheckpoint("doc1", "extractor", "llm", [])
+            results.for_chunk("chunk text", cp).append(RESULT)
+            assert len(results) == 1
+            await results.flush()
+            return cp
+
+        cp = asyncio.run(run())
+        assert cp.get("chunk text") == RESULT
@@ -0,0 +1,157 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+"""
+Unit tests for the batched, cached chunk enricher, with the LLM cache and the
+prompt helpers replaced by in-memory fakes.
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from rag.utils import chunk_enricher
+from rag.utils.chunk_enricher import ChunkEnricher, KeywordPass, QuestionPass
+
+
+class FakeCache:
+    def __init__(self):
+        self.store = {}
+        self.mgets = []
+
+    def get_many(self, llmnm, items):
+        self.mgets.append(len(items))
+        return [self.store.get((llmnm, *self._key(*it))) for it in items]
+
+    def set(self, llmnm, txt, v, history, genconf):
+        self.store[(llmnm, *self._key(txt, history, genconf))] = v
+
+    @staticmethod
+    def _key(txt, history, genconf):
+        return txt, history, tuple(sorted(genconf.items()))
+
+
+class FakePrompts:
+    """Answers every prompt from the chunk text and records the calls."""
+
+    def __init__(self, combined_fails=False, fail_on=None):
+        self.calls = []
+        self.combined_fails = combined_fails
+        self.fail_on = fail_on
+
+    async def keywords(self, chat_mdl, content, topn):
+        self.calls.append(("keywords", content))
+        if content == self.fail_on:
+            raise RuntimeError("llm down")
+        return f"{content}-k1,{content}-k2"
+
+    async def questions(self, chat_mdl, content, topn):
+        self.calls.append(("questions", content))
+        return f"{content}-q1\n{content}-q2"
+
+    async def combined(self, chat_mdl, content, kw_topn, q_topn):
+        self.calls.append(("combined", content))
+        if self.combined_fails:
+            return None
+        return f"{content}-k1,{content}-k2", f"{content}-q1\n{content}-q2"
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    fake = FakeCache()
+    monkeypatch.setattr(chunk_enricher, "get_llm_cache_many", fake.get_many)
+    monkeypatch.setattr(chunk_enricher, "set_llm_cache", fake.set)
+    monkeypatch.setattr(chunk_enricher, "rag_tokenizer", SimpleNamespace(tokenize=lambda s: s.lower()))
+    return fake
+
+
+@pytest.fixture
+def prompts(monkeypatch):
+    fake = FakePrompts()
+    monkeypatch.setattr(chunk_enricher, "keyword_extraction", fake.keywords)
+    monkeypatch.setattr(chunk_enricher, "question_proposal", fake.questions)
+    monkeypatch.setattr(chunk_enricher, "keyword_question_proposal", fake.combined)
+    return fake
+
+
+CHAT = SimpleNamespace(llm_name="chat")
+
+
+def docs(n):
+    return [{"content_with_weight": f"c{i}"} for i in range(n)]
+
+
+def enrich(docs, passes, **kwargs):
+    async def go():
+        enricher = ChunkEnricher(CHAT, **kwargs)
+        await enricher.run(docs, passes)
+        return enricher
+
+    return asyncio.run(go())
+
+
+class TestChunkEnricher:
+    def test_applies_every_pass(self, cache, prompts):
+        chunks = docs(2)
+        enrich(chunks, [KeywordPass(2), QuestionPass(2)])
+        assert chunks[0]["important_kwd"] == ["c0-k1", "c0-k2"]
+        assert chunks[1]["question_kwd"] == ["c1-q1", "c1-q2"]
+        assert chunks[1]["question_tks"] == "c1-q1\nc1-q2"
+
+    def test_second_run_is_served_from_the_cache(self, cache, prompts):
+        enrich(docs(3), [KeywordPass(2)])
+        prompts.calls.clear()
+        chunks = docs(3)
+        enricher = enrich(chunks, [KeywordPass(2)])
+        assert prompts.calls == []
+        assert chunks[2]["important_kwd"] == ["c2-k1", "c2-k2"]
+        assert enricher.stats()["keywords"]["hit_ratio"] == 1.0
+
+    def test_cache_is_fetched_per_batch(self, cache, prompts):
+        enrich(docs(5), [KeywordPass(2), QuestionPass(2)], cache_batch=2)
+        assert cache.mgets == [4, 4, 2]
+
+    def test_combined_call_shares_the_cache_of_the_separate_passes(self, cache, prompts):
+        chunks = docs(2)
+        enrich(chunks, [KeywordPass(2), QuestionPass(2)], combine=True)
+        assert [name for name, _ in prompts.calls] == ["combined", "combined"]
+        assert chunks[0]["question_kwd"] == ["c0-q1", "c0-q2"]
+        prompts.calls.clear()
+        enrich(docs(2), [KeywordPass(2), QuestionPass(2)], combine=False)
+        assert prompts.calls == []
+
+    def test_unusable_combined_answer_falls_back(self, cache, prompts):
+        prompts.combined_fails = True
+        chunks = docs(1)
+        enrich(chunks, [KeywordPass(2), QuestionPass(2)], combine=True)
+        assert sorted(name for name, _ in prompts.calls) == ["combined", "keywords", "questions"]
+        assert chunks[0]["important_kwd"] == ["c0-k1", "c0-k2"]
+
+    def test_cancel_stops_llm_calls(self, cache, prompts):
+        enricher = enrich(docs(3), [KeywordPass(2)], is_canceled=lambda: True)
+        assert enricher.canceled
+        assert prompts.calls == []
+
+    def test_llm_error_is_raised(self, cache, prompts):
+        prompts.fail_on = "c1"
+        with pytest.raises(RuntimeError, match="llm down"):
+            enrich(docs(3), [KeywordPass(2)])
+
+    def test_summary(self, cache, prompts):
+        enricher = enrich(docs(2), [KeywordPass(2)])
+        assert enricher.stats()["keywords"]["calls"] == 2
+        assert enricher.summary().startswith("keywords 2 chunks, 0% cached")
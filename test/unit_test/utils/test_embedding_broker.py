@@ -0,0 +1,169 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+"""
+Unit tests for the cross-task embedding micro-batcher.
+"""
+
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+from rag.utils.embedding_broker import EmbeddingBroker
+
+
+class FakeModel:
+    """Embeds a text as [len(text), 1] and charges one token per character."""
+
+    def __init__(self, tenant_id="tenant", llm_name="embd", fail=False, reject=None):
+        self.tenant_id = tenant_id
+        self.llm_name = llm_name
+        self.fail = fail
+        self.reject = reject
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def encode(self, texts):
+        with self._lock:
+            self.calls.append(list(texts))
+        if self.fail:
+            raise RuntimeError("provider down")
+        if self.reject in texts:
+            raise ValueError(f"rejected {self.reject}")
+        return np.array([[len(t), 1.0] for t in texts]), sum(len(t) for t in texts)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class TestEmbeddingBroker:
+    def test_empty_input(self):
+        async def go():
+            return await EmbeddingBroker(batch_size=4).encode(FakeModel(), [])
+
+        vts, tokens = run(go())
+        assert len(vts) == 0 and tokens == 0
+
+    def test_full_batch_is_sent_without_waiting(self):
+        mdl = FakeModel()
+
+        async def go():
+            broker = EmbeddingBroker(batch_size=3, window=60)
+            return await asyncio.wait_for(broker.encode(mdl, ["a", "bb", "ccc"]), 5)
+
+        vts, tokens = run(go())
+        assert vts[:, 0].tolist() == [1, 2, 3]
+        assert tokens == 6
+        assert mdl.calls == [["a", "bb", "ccc"]]
+
+    def test_large_request_is_split_in_order(self):
+        mdl = FakeModel()
+        texts = ["x" * i for i in range(1, 8)]
+
+        async def go():
+            return await EmbeddingBroker(batch_size=3, window=0.01).encode(mdl, texts)
+
+        vts, tokens = run(go())
+        assert vts[:, 0].tolist() == list(range(1, 8))
+        assert tokens == sum(range(1, 8))
+        assert [len(c) for c in mdl.calls] == [3, 3, 1]
+
+    def test_concurrent_requests_share_a_batch(self):
+        mdl = FakeModel()
+
+        async def go():
+            broker = EmbeddingBroker(batch_size=16, window=0.05)
+            results = await asyncio.gather(
+                broker.encode(mdl, ["a"]),
+                broker.encode(mdl, ["bb", "cc"]),
+                broker.encode(mdl, ["dddd"]),
+            )
+            return broker, results
+
+        broker, results = run(go())
+        assert len(mdl.calls) == 1
+        assert [r[0][:, 0].tolist() for r in results] == [[1], [2, 2], [4]]
+        # Tokens are charged in proportion to each request's characters.
+        assert [r[1] for r in results] == [1, 4, 4]
+        assert broker.stats()["batches"] == 1
+        assert broker.stats()["texts"] == 4
+
+    def test_models_get_separate_lanes(self):
+        a, b = FakeModel(llm_name="a"), FakeModel(llm_name="b")
+
+        async def go():
+            broker = EmbeddingBroker(batch_size=16, window=0.01)
+            return await asyncio.gather(broker.encode(a, ["x"]), broker.encode(b, ["yy"]))
+
+        (va, _), (vb, _) = run(go())
+        assert a.calls == [["x"]] and b.calls == [["yy"]]
+        assert va[0, 0] == 1 and vb[0, 0] == 2
+
+    def test_failure_reaches_every_request_of_the_batch(self):
+        mdl = FakeModel(fail=True)
+
+        async def go():
+            broker = EmbeddingBroker(batch_size=16, window=0.01)
+            return await asyncio.gather(broker.encode(mdl, ["a"]), broker.encode(mdl, ["b"]), return_exceptions=True)
+
+        results = run(go())
+        # The shared batch, then each request on its own.
+        assert mdl.calls == [["a", "b"], ["a"], ["b"]]
+        assert all(isinstance(r, RuntimeError) for r in results)
+
+    def test_bad_text_fails_only_its_own_request(self):
+        mdl = FakeModel(reject="bad")
+
+        async def go():
+            broker = EmbeddingBroker(batch_size=16, window=0.01)
+            return await asyncio.gather(
+                broker.encode(mdl, ["a"]),
+                broker.encode(mdl, ["x", "bad"]),
+                broker.encode(mdl, ["ccc"]),
+                return_exceptions=True,
+            )
+
+        ok1, failed, ok2 = run(go())
+        assert isinstance(failed, ValueError)
+        assert ok1[0][:, 0].tolist() == [1] and ok1[1] == 1
+        assert ok2[0][:, 0].tolist() == [3] and ok2[1] == 3
+        assert mdl.calls == [["a", "x", "bad", "ccc"], ["a"], ["x", "bad"], ["ccc"]]
+
+    def test_single_request_failure_is_not_retried(self):
+        mdl = FakeModel(fail=True)
+
+        async def go():
+            return await EmbeddingBroker(batch_size=16, window=0.01).encode(mdl, ["a", "b"])
+
+        with pytest.raises(RuntimeError):
+            run(go())
+        assert mdl.calls == [["a", "b"]]
+
+    def test_stats(self):
+        mdl = FakeModel()
+
+        async def go():
+            broker = EmbeddingBroker(batch_size=4, window=0.01)
+            await broker.encode(mdl, ["a", "b"])
+            return broker.stats()
+
+        stats = run(go())
+        assert stats["batches"] == 1
+        assert stats["fill_ratio"] == pytest.approx(0.5)
+        assert stats["avg_wait_ms"] >= 0
@@ -0,0 +1,168 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+"""
+Unit tests for chunk assembly: `naive_merge`, `naive_merge_with_images` and
+`tokenize_chunks` must produce exactly what the previous implementations did.
+"""
+
+import pytest
+
+import rag.nlp as nlp
+from common.token_utils import num_tokens_from_string
+from rag.nlp import naive_merge, naive_merge_with_images, tokenize_chunks
+from rag.nlp.merge_benchmark import naive_merge_reference, pdf_like_sections, tokenize_chunks_reference
+
+
+def naive_merge_with_images_reference(texts, images, chunk_token_num=128, overlapped_percent=0):
+    """The previous `naive_merge_with_images`, without custom delimiters."""
+    from deepdoc.parser.pdf_parser import RAGFlowPdfParser
+    if not texts or len(texts) != len(images):
+        return [], []
+    cks = [""]
+    result_images = [None]
+    tk_nums = [0]
+
+    def add_chunk(t, image, pos=""):
+        tnum = num_tokens_from_string(t)
+        if not pos:
+            pos = ""
+        if tnum < 8:
+            pos = ""
+        if cks[-1] == "" or tk_nums[-1] > chunk_token_num * (100 - overlapped_percent) / 100.:
+            if cks:
+                overlapped = RAGFlowPdfParser.remove_tag(cks[-1])
+                t = overlapped[int(len(overlapped) * (100 - overlapped_percent) / 100.):] + t
+            if t.find(pos) < 0:
+                t += pos
+            cks.append(t)
+            result_images.append(image)
+            tk_nums.append(tnum)
+        else:
+            if cks[-1].find(pos) < 0:
+                t += pos
+            cks[-1] += t
+            if result_images[-1] is None:
+                result_images[-1] = image
+            else:
+                result_images[-1] = nlp.concat_img(result_images[-1], image)
+            tk_nums[-1] += tnum
+
+    for text, image in zip(texts, images):
+        if isinstance(text, tuple):
+            add_chunk("\n" + (text[0] if text[0] is not None else ""), image, text[1] if len(text) > 1 else "")
+        else:
+            add_chunk("\n" + (text or ""), image)
+    return cks, result_images
+
+
+def tag(page, line):
+    return "@@{}\t40.0\t290.0\t{:.1f}\t{:.1f}##".format(page, line * 18.0, line * 18.0 + 12)
+
+
+LONG = "the retrieval model reads every table and figure of the manual before it answers"
+
+
+def mixed_sections():
+    """Long and short (< 8 tokens) sections, repeated tags, a tag already in the text, no tag."""
+    return [
+        (LONG, tag(1, 0)),
+        ("short line", tag(1, 1)),
+        (LONG + " again", tag(1, 0)),
+        (LONG + " " + tag(1, 2), tag(1, 2)),
+        ("ok", ""),
+        (LONG + " once more", tag(1, 3)),
+        (LONG, "not a tag but a position string"),
+        (LONG + " not a tag but a position string", "not a tag but a position string"),
+        ("", tag(2, 0)),
+        (LONG + " last", tag(2, 1)),
+    ]
+
+
+@pytest.fixture
+def fake_concat_img(monkeypatch):
+    def concat(a, b):
+        if not b:
+            return a
+        if not a:
+            return b
+        return a + "+" + b
+
+    monkeypatch.setattr(nlp, "concat_img", concat)
+
+
+class TestNaiveMerge:
+    @pytest.mark.parametrize("chunk_token_num", [1, 16, 40, 128, 2048])
+    @pytest.mark.parametrize("overlapped_percent", [0, 20, 50])
+    def test_matches_previous_implementation(self, chunk_token_num, overlapped_percent):
+        sections = mixed_sections()
+        assert naive_merge(sections, chunk_token_num, overlapped_percent=overlapped_percent) == \
+            naive_merge_reference(sections, chunk_token_num, overlapped_percent)
+
+    @pytest.mark.parametrize("overlapped_percent", [0, 20])
+    def test_pdf_like_sections(self, overlapped_percent):
+        sections = pdf_like_sections(3)
+        for chunk_token_num in (64, 512):
+            assert naive_merge(sections, chunk_token_num, overlapped_percent=overlapped_percent) == \
+                naive_merge_reference(sections, chunk_token_num, overlapped_percent)
+
+    def test_short_sections_drop_their_position(self):
+        cks = naive_merge([("tiny", tag(1, 0)), ("small", tag(1, 1))], 128)
+        assert cks == ["", "\ntiny\nsmall"]
+
+    def test_position_already_in_chunk_is_not_repeated(self):
+        cks = naive_merge([(LONG, tag(1, 0)), (LONG, tag(1, 0))], 2048)
+        assert cks[-1].count(tag(1, 0)) == 1
+
+    def test_plain_strings(self):
+        texts = [LONG, "a", LONG]
+        assert naive_merge(texts, 16) == naive_merge_reference([(t, "") for t in texts], 16)
+
+
+class TestNaiveMergeWithImages:
+    @pytest.mark.parametrize("chunk_token_num", [1, 16, 40, 2048])
+    @pytest.mark.parametrize("overlapped_percent", [0, 20])
+    def test_matches_previous_implementation(self, fake_concat_img, chunk_token_num, overlapped_percent):
+        texts = mixed_sections()
+        images = ["img%d" % i if i % 3 else None for i in range(len(texts))]
+        assert naive_merge_with_images(texts, images, chunk_token_num, overlapped_percent=overlapped_percent) == \
+            naive_merge_with_images_reference(texts, images, chunk_token_num, overlapped_percent)
+
+    def test_mixed_none_and_real_images(self, fake_concat_img):
+        texts = [LONG, "x", (None, ""), (LONG, tag(1, 0)), "y"]
+        images = [None, "a", None, "b", "c"]
+        cks, imgs = naive_merge_with_images(texts, images, 2048)
+        assert (cks, imgs) == naive_merge_with_images_reference(texts, images, 2048)
+        assert imgs == [None, "a+b+c"]
+
+    def test_every_image_starts_a_chunk(self, fake_concat_img):
+        texts = [LONG, LONG, LONG]
+        images = [None, "a", "b"]
+        assert naive_merge_with_images(texts, images, 1) == naive_merge_with_images_reference(texts, images, 1)
+
+    def test_length_mismatch(self):
+        assert naive_merge_with_images([LONG], [], 128) == ([], [])
+
+
+class TestTokenizeChunks:
+    def test_matches_previous_implementation(self):
+        chunks = naive_merge(mixed_sections(), 40) + ["   "]
+        doc = {"docnm_kwd": "manual.pdf", "title_tks": "manual", "title_sm_tks": "manual", "tags": ["a"]}
+        res = tokenize_chunks(chunks, doc, True)
+        assert res == tokenize_chunks_reference(chunks, doc, True)
+        # Mutable values are copied per chunk.
+        res[0]["tags"].append("b")
+        assert doc["tags"] == ["a"] and res[1]["tags"] == ["a"]
@@ -0,0 +1,85 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+"""
+Unit tests for the bulk re-parse job record and its owner liveness check.
+"""
+
+import json
+
+import pytest
+
+from api.db.services import task_service
+from api.db.services.task_service import ParseJob
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, k):
+        return self.data.get(k)
+
+    def set(self, k, v, exp=3600):
+        self.data[k] = v
+        return True
+
+    def set_obj(self, k, obj, exp=3600):
+        self.data[k] = json.dumps(obj)
+        return True
+
+    def exist(self, k):
+        return int(k in self.data)
+
+    def delete(self, k):
+        return self.data.pop(k, None) is not None
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    fake = FakeRedis()
+    monkeypatch.setattr(task_service, "REDIS_CONN", fake)
+    monkeypatch.setattr(task_service, "reparse_documents", lambda tenant_id, kb_id, doc_ids, priority: len(doc_ids))
+    monkeypatch.setattr(task_service, "PARSE_JOB_BATCH", 2)
+    monkeypatch.setattr(ParseJob, "_heartbeat", object())
+    monkeypatch.setattr(ParseJob, "_owned", set())
+    return fake
+
+
+class TestParseJob:
+    def test_inline_job_finishes(self, redis):
+        job = ParseJob.start("tenant", "kb", ["d1", "d2", "d3"])
+        assert (job["status"], job["done"], job["tasks"]) == ("done", 3, 3)
+        assert ParseJob.get(job["id"])["status"] == "done"
+        assert not redis.exist(ParseJob._alive_key(job["id"]))
+
+    def test_running_job_of_a_live_owner(self, redis):
+        ParseJob._own("job1")
+        ParseJob._save({"id": "job1", "kb_id": "kb", "status": "running", "total": 4, "done": 2, "tasks": 2, "error": ""})
+        assert ParseJob.get("job1")["status"] == "running"
+
+    def test_running_job_of_a_dead_owner_fails(self, redis):
+        ParseJob._save({"id": "job1", "kb_id": "kb", "status": "running", "total": 4, "done": 2, "tasks": 2, "error": "", "owner": "host:1"})
+        job = ParseJob.get("job1")
+        assert job["status"] == "failed"
+        assert "host:1" in job["error"] and "2/4" in job["error"]
+        # The verdict is stored, not recomputed on every read.
+        assert json.loads(redis.get(ParseJob._key("job1")))["status"] == "failed"
+
+    def test_unreachable_redis_is_not_a_dead_owner(self, redis, monkeypatch):
+        ParseJob._save({"id": "job1", "kb_id": "kb", "status": "running", "total": 4, "done": 2, "tasks": 2, "error": ""})
+        monkeypatch.setattr(redis, "exist", lambda k: None)
+        assert ParseJob.get("job1")["status"] == "running"
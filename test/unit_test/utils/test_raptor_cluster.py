@@ -0,0 +1,90 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+"""
+Unit tests for the RAPTOR clustering engine.
+"""
+
+import warnings
+
+import numpy as np
+import pytest
+
+with warnings.catch_warnings():
+    # umap warns at import time when TensorFlow is not installed.
+    warnings.simplefilter("ignore", ImportWarning)
+    from rag.utils.raptor_cluster import RaptorClusterEngine
+
+
+def _blobs(n_centers=4, per_center=20, dim=8, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(scale=10, size=(n_centers, dim))
+    return np.concatenate([c + rng.normal(scale=0.1, size=(per_center, dim)) for c in centers])
+
+
+class TestSearch:
+    """BIC search over candidate cluster counts"""
+
+    def test_finds_separated_blobs(self):
+        engine = RaptorClusterEngine(max_cluster=10, random_state=0, max_workers=1, patience=0)
+        n, gm = engine.search(_blobs())
+        assert n == 4
+        assert gm.n_components == 4
+
+    def test_patience_matches_full_scan(self):
+        reduced = _blobs()
+        full = RaptorClusterEngine(max_cluster=10, random_state=0, max_workers=1, patience=0)
+        early = RaptorClusterEngine(max_cluster=10, random_state=0, max_workers=1, patience=3)
+        assert full.search(reduced)[0] == early.search(reduced)[0]
+        assert early.evaluated < full.evaluated == 9
+
+    def test_result_independent_of_wave_size(self):
+        reduced = _blobs()
+        one = RaptorClusterEngine(max_cluster=10, random_state=0, max_workers=1, patience=2)
+        # Below RAPTOR_CLUSTER_PARALLEL_MIN_SAMPLES the waves are fitted in process.
+        wide = RaptorClusterEngine(max_cluster=10, random_state=0, max_workers=4, patience=2)
+        assert one.search(reduced)[0] == wide.search(reduced)[0]
+
+    def test_single_candidate(self):
+        engine = RaptorClusterEngine(max_cluster=1, random_state=0)
+        assert engine.search(_blobs()) == (1, None)
+
+    def test_check_canceled_is_called(self):
+        calls = []
+        engine = RaptorClusterEngine(max_cluster=10, random_state=0, max_workers=1, patience=0)
+        engine.search(_blobs(), lambda: calls.append(1))
+        assert len(calls) == 9
+
+    def test_cancel_stops_search(self):
+        def cancel():
+            raise RuntimeError("canceled")
+
+        engine = RaptorClusterEngine(max_cluster=10, random_state=0, max_workers=1)
+        with pytest.raises(RuntimeError):
+            engine.search(_blobs(), cancel)
+        assert engine.evaluated == 0
+
+
+class TestCluster:
+    # umap warns that a fixed random_state disables its parallelism.
+    @pytest.mark.filterwarnings("ignore::UserWarning")
+    def test_one_label_per_row(self):
+        embeddings = _blobs(n_centers=3, per_center=15, dim=32)
+        engine = RaptorClusterEngine(max_cluster=8, random_state=0, max_workers=1)
+        n, labels = engine.cluster(embeddings)
+        assert len(labels) == len(embeddings)
+        assert n >= 1
+        assert set(int(lbl) for lbl in labels) <= set(range(n))
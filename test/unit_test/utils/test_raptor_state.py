@@ -0,0 +1,109 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+"""
+Unit tests for the persisted incremental RAPTOR tree state.
+"""
+
+import pytest
+
+from rag.utils.raptor_utils import (
+    RAPTOR_STATE_BUCKET,
+    load_raptor_state,
+    prune_raptor_state,
+    remove_raptor_state,
+    save_raptor_state,
+)
+
+
+class InMemoryStorage:
+    def __init__(self):
+        self.objects = {}
+
+    def obj_exist(self, bucket, fnm):
+        return (bucket, fnm) in self.objects
+
+    def get(self, bucket, fnm):
+        return self.objects.get((bucket, fnm))
+
+    def put(self, bucket, fnm, binary):
+        self.objects[(bucket, fnm)] = binary
+
+    def rm(self, bucket, fnm):
+        self.objects.pop((bucket, fnm), None)
+
+
+@pytest.fixture
+def storage(monkeypatch):
+    from common import settings
+
+    store = InMemoryStorage()
+    monkeypatch.setattr(settings, "STORAGE_IMPL", store, raising=False)
+    return store
+
+
+STATES = {
+    "doc1": {
+        "fingerprint": "abc",
+        "layers": [{"clusters": [{"members": ["h1", "h2"], "centroid": [0.1, 0.2], "summary": "s", "vector": [0.3, 0.4]}]}],
+    }
+}
+
+
+class TestRaptorState:
+    def test_load_missing_state(self, storage):
+        assert load_raptor_state("kb1") == {}
+
+    def test_save_then_load(self, storage):
+        save_raptor_state("kb1", STATES)
+        assert (RAPTOR_STATE_BUCKET, "kb1") in storage.objects
+        assert load_raptor_state("kb1") == STATES
+        assert load_raptor_state("kb2") == {}
+
+    def test_unreadable_state_loads_empty(self, storage):
+        storage.put(RAPTOR_STATE_BUCKET, "kb1", b"{not json")
+        assert load_raptor_state("kb1") == {}
+
+    def test_uploaded_document_does_not_collide(self, storage):
+        # Documents are stored in the knowledge base's bucket under their file name.
+        storage.put("kb1", "raptor_tree.json", b"user data")
+        storage.put("kb1", "kb1", b"more user data")
+        assert load_raptor_state("kb1") == {}
+        save_raptor_state("kb1", STATES)
+        assert storage.get("kb1", "raptor_tree.json") == b"user data"
+        assert storage.get("kb1", "kb1") == b"more user data"
+        assert load_raptor_state("kb1") == STATES
+        remove_raptor_state("kb1")
+        assert storage.get("kb1", "raptor_tree.json") == b"user data"
+
+    def test_remove(self, storage):
+        save_raptor_state("kb1", STATES)
+        remove_raptor_state("kb1")
+        assert load_raptor_state("kb1") == {}
+        # Removing a state that does not exist is a no-op.
+        remove_raptor_state("kb1")
+
+
+class TestPruneRaptorState:
+    def test_drops_deleted_documents(self):
+        states = {"doc1": {}, "doc2": {}, "kb_tree": {}}
+        assert prune_raptor_state(states, {"doc1", "kb_tree"}) == ["doc2"]
+        assert set(states) == {"doc1", "kb_tree"}
+
+    def test_keeps_live_documents(self):
+        states = {"doc1": {}}
+        assert prune_raptor_state(states, {"doc1", "doc2"}) == []
+        assert states == {"doc1": {}}
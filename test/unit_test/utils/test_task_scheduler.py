@@ -0,0 +1,154 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+"""
+Unit tests for the tenant-fair task scheduler, run against an in-process Redis
+(fakeredis with Lua support) so the dispatch scripts themselves are exercised.
+"""
+
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")
+
+from valkey.crc import key_slot  # noqa: E402
+
+from common import settings  # noqa: E402
+from rag.utils import task_scheduler  # noqa: E402
+from rag.utils.redis_conn import RedisMsg  # noqa: E402
+from rag.utils.task_scheduler import TaskScheduler  # noqa: E402
+
+QUEUE = settings.get_svr_queue_name(0)
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    conn = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(task_scheduler, "REDIS_CONN", SimpleNamespace(REDIS=conn))
+    monkeypatch.setattr(TaskScheduler, "_enqueue_script", None)
+    monkeypatch.setattr(TaskScheduler, "_dispatch_script", None)
+    monkeypatch.setattr(task_scheduler, "TASK_SCHEDULER_ENABLED", 1)
+    monkeypatch.setattr(task_scheduler, "TASK_SCHED_TENANT_CAP", 16)
+    return conn
+
+
+def enqueue(tenant, n, start=0):
+    for i in range(start, start + n):
+        assert TaskScheduler.enqueue(0, tenant, {"id": f"{tenant}-{i}"})
+
+
+def stream_tasks(redis):
+    return [(fields["tenant_id"], json.loads(fields["message"])["id"]) for _, fields in redis.xrange(QUEUE)]
+
+
+def running(redis, tenant):
+    return redis.zrange(f"{TaskScheduler._prefix(QUEUE)}:running:{tenant}", 0, -1)
+
+
+def as_msg(redis, idx):
+    msg_id, fields = redis.xrange(QUEUE)[idx]
+    return RedisMsg(redis, QUEUE, "group", msg_id, fields)
+
+
+class TestDispatch:
+    def test_round_robin_across_tenants(self, redis):
+        enqueue("a", 10)
+        enqueue("b", 2)
+        assert TaskScheduler.dispatch(QUEUE, 5) == 5
+        assert stream_tasks(redis) == [("a", "a-0"), ("b", "b-0"), ("a", "a-1"), ("b", "b-1"), ("a", "a-2")]
+        assert TaskScheduler.queued(QUEUE) == 7
+
+    def test_empty_scheduler(self, redis):
+        assert TaskScheduler.dispatch(QUEUE, 2) == 0
+        assert TaskScheduler.queued(QUEUE) == 0
+
+    def test_weight(self, redis):
+        TaskScheduler.set_tenant_policy("a", weight=2)
+        enqueue("a", 6)
+        enqueue("b", 6)
+        TaskScheduler.dispatch(QUEUE, 6)
+        tenants = [t for t, _ in stream_tasks(redis)]
+        assert tenants.count("a") == 4 and tenants.count("b") == 2
+
+    def test_cap_holds_back_while_others_wait(self, redis, monkeypatch):
+        monkeypatch.setattr(task_scheduler, "TASK_SCHED_TENANT_CAP", 1)
+        enqueue("a", 3)
+        TaskScheduler.dispatch(QUEUE, 1)
+        enqueue("b", 1)
+        # a is at its cap and b has work: b goes next although a has the lower virtual time.
+        TaskScheduler.dispatch(QUEUE, 1)
+        assert stream_tasks(redis) == [("a", "a-0"), ("b", "b-0")]
+
+    def test_cap_yields_when_nobody_else_waits(self, redis, monkeypatch):
+        monkeypatch.setattr(task_scheduler, "TASK_SCHED_TENANT_CAP", 1)
+        enqueue("a", 3)
+        assert TaskScheduler.dispatch(QUEUE, 3) == 3
+        assert len(running(redis, "a")) == 3
+
+    def test_expired_running_task_frees_its_slot(self, redis, monkeypatch):
+        monkeypatch.setattr(task_scheduler, "TASK_SCHED_TENANT_CAP", 1)
+        enqueue("a", 2)
+        enqueue("b", 2)
+        TaskScheduler.dispatch(QUEUE, 2)
+        # a's executor died long ago: its task no longer counts against the cap.
+        redis.zadd(f"{TaskScheduler._prefix(QUEUE)}:running:a", {"a-0": time.time() - 10 * task_scheduler.TASK_SCHED_RUNNING_TTL})
+        TaskScheduler.dispatch(QUEUE, 1)
+        assert stream_tasks(redis)[-1] == ("a", "a-1")
+
+
+class TestRunningSlots:
+    def test_release(self, redis):
+        enqueue("a", 1)
+        TaskScheduler.dispatch(QUEUE, 1)
+        assert running(redis, "a") == ["a-0"]
+        TaskScheduler.release(as_msg(redis, 0), "a-0")
+        assert running(redis, "a") == []
+
+    def test_touch_refreshes_only_running_tasks(self, redis):
+        enqueue("a", 2)
+        TaskScheduler.dispatch(QUEUE, 2)
+        key = f"{TaskScheduler._prefix(QUEUE)}:running:a"
+        redis.zadd(key, {"a-0": 1, "a-1": 1})
+        TaskScheduler.release(as_msg(redis, 1), "a-1")
+        TaskScheduler.touch([(as_msg(redis, 0), "a-0"), (as_msg(redis, 1), "a-1")])
+        assert redis.zscore(key, "a-0") > time.time() - 60
+        # A task released in the meantime is not brought back.
+        assert redis.zscore(key, "a-1") is None
+
+    def test_hand_back_goes_to_the_front(self, redis):
+        enqueue("a", 2)
+        TaskScheduler.dispatch(QUEUE, 1)
+        redis.xgroup_create(QUEUE, "group", id="0")
+        assert TaskScheduler.hand_back(as_msg(redis, 0))
+        assert running(redis, "a") == []
+        assert redis.lrange(f"{TaskScheduler._prefix(QUEUE)}:q:a", 0, -1)[0] == json.dumps({"id": "a-0"})
+
+
+class TestKeys:
+    def test_scheduler_keys_share_the_stream_slot(self):
+        slot = key_slot(QUEUE.encode())
+        keys = TaskScheduler._enqueue_keys(QUEUE, "tenant") + TaskScheduler._dispatch_keys(QUEUE, "tenant")
+        assert {key_slot(k.encode()) for k in keys} == {slot}
+
+    def test_disabled_scheduler_counts_nothing(self, redis, monkeypatch):
+        enqueue("a", 2)
+        monkeypatch.setattr(task_scheduler, "TASK_SCHEDULER_ENABLED", 0)
+        assert TaskScheduler.queued(QUEUE) == 0
+        assert TaskScheduler.dispatch(QUEUE, 2) == 0
@@ -16,6 +16,7 @@ export enum MessageEventType {
   WorkflowFinished = 'workflow_finished',
   UserInputs = 'user_inputs',
   NodeLogs = 'node_logs',
+  IterationItemFinished = 'iteration_item_finished',
 }
 
 export interface IAnswerEvent<T> {